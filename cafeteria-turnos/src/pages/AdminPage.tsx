@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import axios from "axios";
 import { useAuth } from "../context/AuthContext";
 import { useNavigate } from "react-router-dom";
@@ -35,6 +35,13 @@ const ESTADOS_CAFETERIA = [
   { value: "reabasteciendo", label: "Reabasteciendo" },
 ];
 
+type CambiosTurnos = {
+  siguiente: number;
+  completo: boolean;
+  turnos: Turno[];
+  eliminados: number[];
+};
+
 const TIEMPO_LIMITE_SEGUNDOS = 30;
 
 const AdminPage: React.FC = () => {
@@ -52,6 +59,12 @@ const AdminPage: React.FC = () => {
   const [menu, setMenu] = useState<"inicio" | "turnos" | "subir">("inicio");
   const [now, setNow] = useState<Date>(new Date());
 
+  // Copia local de los turnos: cada refresco pide solo lo que cambió desde
+  // el último número de cambio (?since=) en vez de la lista completa
+  const turnosPorId = useRef<Map<number, Turno>>(new Map());
+  const ultimoCambio = useRef<number>(0);
+  const sincronizando = useRef<Promise<void> | null>(null);
+
   useEffect(() => {
     cargarDatos();
     // eslint-disable-next-line
@@ -73,8 +86,7 @@ const AdminPage: React.FC = () => {
     setLoading(true);
     try {
       const headers = { Authorization: `Bearer ${auth?.access}` };
-      const turnosRes = await axios.get(`${API_URL}/turnos/admin/listar/`, { headers });
-      setTurnos(turnosRes.data);
+      await sincronizarTurnos(headers);
       const cafeteriasRes = await axios.get(`${API_URL}/cafeteria/`, { headers });
       setCafeterias(cafeteriasRes.data);
       if (cafeteriasRes.data.length > 0) {
@@ -88,6 +100,29 @@ const AdminPage: React.FC = () => {
     setLoading(false);
   };
 
+  const sincronizarTurnos = (headers: { Authorization: string }) => {
+    // Un solo pedido a la vez: el intervalo y las acciones comparten la marca
+    if (!sincronizando.current) {
+      sincronizando.current = (async () => {
+        let completo = false;
+        while (!completo) {
+          const res = await axios.get<CambiosTurnos>(`${API_URL}/turnos/admin/listar/`, {
+            headers,
+            params: { since: ultimoCambio.current },
+          });
+          res.data.turnos.forEach((t) => turnosPorId.current.set(t.id, t));
+          res.data.eliminados.forEach((id) => turnosPorId.current.delete(id));
+          ultimoCambio.current = res.data.siguiente;
+          completo = res.data.completo;
+        }
+        setTurnos(Array.from(turnosPorId.current.values()));
+      })().finally(() => {
+        sincronizando.current = null;
+      });
+    }
+    return sincronizando.current;
+  };
+
   // Calcula el tiempo restante SOLO para el turno actual
   const getTiempoRestante = (generado_en: string): number => {
     const generado = new Date(generado_en).getTime();
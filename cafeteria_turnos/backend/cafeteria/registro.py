@@ -0,0 +1,101 @@
+"""
+Registro en memoria de las cafeterías, por proceso.
+
+Las cafeterías cambian unas pocas veces al día pero se leen en cada emisión
+de turno y en cada sondeo de la lista, así que cada proceso las guarda todas:
+las instancias (para buscarlas y ver si están abiertas) y su JSON ya
+serializado (para la lista y el detalle).
+
+- Las señales post_save/post_delete de Cafeteria vacían el registro del
+  proceso que hizo el cambio, en el momento y otra vez al confirmar.
+- Los demás procesos no ven esas señales: cada
+  CAFETERIA_REGISTRO_REVALIDAR_SEGUNDOS comparan la clave del registro
+  (cantidad de cafeterías y mayor updated_at) con la base de datos y, si
+  cambió, lo recargan.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import Cafeteria
+from .serializers import CafeteriaSerializer
+
+
+class _Instantanea:
+    def __init__(self, cafeterias):
+        self.cafeterias = {cafeteria.id: cafeteria for cafeteria in cafeterias}
+        self.datos = list(CafeteriaSerializer(cafeterias, many=True).data)
+        self.datos_por_id = {fila['id']: fila for fila in self.datos}
+        self.clave = (len(cafeterias), max((c.updated_at for c in cafeterias), default=None))
+        self.revalidada_en = time.monotonic()
+
+
+_lock = threading.Lock()
+_instantanea = None
+
+
+def _clave_en_base():
+    fila = Cafeteria.objects.aggregate(n=Count('id'), ultimo=Max('updated_at'))
+    return fila['n'], fila['ultimo']
+
+
+def _actual():
+    global _instantanea
+    instantanea = _instantanea
+    revalidar_cada = getattr(settings, 'CAFETERIA_REGISTRO_REVALIDAR_SEGUNDOS', 5)
+    if instantanea is not None and time.monotonic() - instantanea.revalidada_en < revalidar_cada:
+        return instantanea
+    with _lock:
+        if _instantanea is not instantanea:
+            # Otro hilo ya la recargó mientras esperábamos
+            return _instantanea
+        if instantanea is not None and _clave_en_base() == instantanea.clave:
+            instantanea.revalidada_en = time.monotonic()
+            return instantanea
+        _instantanea = _Instantanea(list(Cafeteria.objects.order_by('id')))
+        return _instantanea
+
+
+def _id(cafeteria_id):
+    try:
+        return int(cafeteria_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def obtener(cafeteria_id):
+    """Copia de la cafetería con ese id, o None si no existe."""
+    cafeteria = _actual().cafeterias.get(_id(cafeteria_id))
+    return copy.copy(cafeteria) if cafeteria else None
+
+
+def primera():
+    """Copia de la cafetería de menor id, o None si no hay ninguna."""
+    cafeterias = _actual().cafeterias
+    return copy.copy(cafeterias[min(cafeterias)]) if cafeterias else None
+
+
+def lista():
+    """JSON de todas las cafeterías, igual que CafeteriaSerializer(many=True)."""
+    return list(_actual().datos)
+
+
+def datos(cafeteria_id):
+    """JSON de una cafetería, o None si no existe."""
+    return _actual().datos_por_id.get(_id(cafeteria_id))
+
+
+def invalidar():
+    global _instantanea
+    with _lock:
+        _instantanea = None
+
+
+def invalidar_al_confirmar():
+    # Un hilo que recargue antes del commit leería el estado viejo
+    invalidar()
+    transaction.on_commit(invalidar)
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import registro
+from .models import Cafeteria
+
+
+@receiver(post_save, sender=Cafeteria)
+@receiver(post_delete, sender=Cafeteria)
+def invalidar_registro(sender, instance, **kwargs):
+    registro.invalidar_al_confirmar()
@@ -14,10 +14,36 @@ class CafeteriaTests(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertGreaterEqual(len(response.data), 1)
 
+    def test_listar_cafeterias_304_sin_cambios(self):
+        url = reverse('cafeteria_list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):  # Solo el contador de versión
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.cafe.nombre = "Norte"
+        self.cafe.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data[0]['nombre'], "Norte")
+
     def test_cambiar_estado_admin(self):
         self.client.force_authenticate(user=self.admin)
         url = reverse('cambiar_estado_cafeteria', args=[self.cafe.id])
         response = self.client.post(url, {"estado": "cerrada"})
         self.cafe.refresh_from_db()
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(self.cafe.estado, "cerrada")
\ No newline at end of file
+        self.assertEqual(self.cafe.estado, "cerrada")
+
+    def test_lista_y_detalle_desde_el_registro(self):
+        self.client.get(reverse('cafeteria_list'))
+        with self.assertNumQueries(1):  # Solo el contador de versión
+            response = self.client.get(reverse('cafeteria_list'))
+        self.assertEqual(response.data[0]['nombre'], "Central")
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('cafeteria_detail', args=[self.cafe.id]))
+        self.assertEqual(response.data['id'], self.cafe.id)
+        self.client.force_authenticate(user=self.admin)
+        self.client.delete(reverse('cafeteria_delete', args=[self.cafe.id]))
+        response = self.client.get(reverse('cafeteria_detail', args=[self.cafe.id]))
+        self.assertEqual(response.status_code, 404)
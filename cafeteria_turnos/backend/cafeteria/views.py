@@ -3,19 +3,34 @@ from rest_framework.response import Response
 from .models import Cafeteria
 from .serializers import CafeteriaSerializer
 from rest_framework.views import APIView
+from django.http import Http404
+from turnos.versiones import VistaCondicionalMixin
+from . import registro
 
-# Listar todas las cafeterías (accesible a todos)
-class CafeteriaListView(generics.ListAPIView):
+# Listar todas las cafeterías (accesible a todos; responde 304 si no cambiaron).
+# El JSON sale del registro en memoria
+class CafeteriaListView(VistaCondicionalMixin, generics.ListAPIView):
+    clave_version = 'cafeterias'
     queryset = Cafeteria.objects.all()
     serializer_class = CafeteriaSerializer
     permission_classes = [permissions.AllowAny]
 
+    def list(self, request, *args, **kwargs):
+        return Response(registro.lista())
+
 # Obtener detalles de una cafetería
-class CafeteriaDetailView(generics.RetrieveAPIView):
+class CafeteriaDetailView(VistaCondicionalMixin, generics.RetrieveAPIView):
+    clave_version = 'cafeterias'
     queryset = Cafeteria.objects.all()
     serializer_class = CafeteriaSerializer
     permission_classes = [permissions.AllowAny]
 
+    def retrieve(self, request, *args, **kwargs):
+        datos = registro.datos(kwargs['pk'])
+        if datos is None:
+            raise Http404
+        return Response(datos)
+
 # Crear una cafetería (solo admin)
 class CafeteriaCreateView(generics.CreateAPIView):
     queryset = Cafeteria.objects.all()
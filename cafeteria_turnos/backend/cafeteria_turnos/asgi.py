@@ -2,6 +2,7 @@
 ASGI config for cafeteria_turnos project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django and WebSockets (turno actual en tiempo real) to Channels.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +14,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cafeteria_turnos.settings')
 
-application = get_asgi_application()
+# Django debe inicializarse antes de importar consumers y modelos
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+import turnos.routing  # noqa: E402
+
+application = ProtocolTypeRouter({
+    "http": django_asgi_app,
+    "websocket": AuthMiddlewareStack(
+        URLRouter(
+            turnos.routing.websocket_urlpatterns
+        )
+    ),
+})
@@ -0,0 +1,235 @@
+"""
+Channel layer de Channels sobre un archivo SQLite compartido.
+
+Permite correr varios workers ASGI en el mismo servidor sin Redis: un
+group_send hecho en un proceso llega a los WebSockets conectados a cualquier
+otro. Configuración:
+
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'cafeteria_turnos.capa_canales.SQLiteChannelLayer',
+            'CONFIG': {'ruta': BASE_DIR / 'canales.sqlite3'},
+        },
+    }
+
+(settings.py la usa cuando CANALES_RUTA está en el entorno.)
+
+Cada proceso tiene un prefijo propio para sus canales ("specific.<id>!...").
+group_send inserta un mensaje por miembro del grupo con un solo INSERT ...
+SELECT, y cada proceso lee de una vez todos los mensajes de su prefijo y los
+reparte a sus canales locales. Un buzón local se borra en cuanto se vacía, y
+los de canales que nadie lee (un WebSocket que se desconectó) cuando sus
+mensajes vencen. La lectura es por sondeo con espera
+adaptativa: intervalo_min mientras llegan mensajes, duplicándose hasta
+intervalo_max cuando no llega nada. Un sondeo vacío es una lectura simple
+(en WAL no bloquea a nadie); el lock de escritura se toma solo para traer y
+borrar cuando hay mensajes.
+
+No implementa el límite de capacidad por canal.
+"""
+import asyncio
+import collections
+import json
+import os
+import random
+import sqlite3
+import string
+import threading
+import time
+
+from channels.layers import BaseChannelLayer
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS mensajes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prefijo TEXT NOT NULL,
+    canal TEXT NOT NULL,
+    expira REAL NOT NULL,
+    datos TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS mensajes_prefijo ON mensajes (prefijo, id);
+CREATE TABLE IF NOT EXISTS grupos (
+    grupo TEXT NOT NULL,
+    canal TEXT NOT NULL,
+    expira REAL NOT NULL,
+    PRIMARY KEY (grupo, canal)
+);
+"""
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(self, ruta='canales.sqlite3', expiry=60, group_expiry=86400,
+                 intervalo_min=0.001, intervalo_max=0.05, capacity=100, channel_capacity=None, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.ruta = str(ruta)
+        self.group_expiry = group_expiry
+        self.intervalo_min = intervalo_min
+        self.intervalo_max = intervalo_max
+        self.id_proceso = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
+        self._conexion = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._buzones = {}  # canal -> deque de (expira, mensaje)
+        self._espera = {}  # prefijo -> intervalo de sondeo actual
+        self._ultimo_sondeo = {}
+        self._envios = 0
+
+    # Conexión
+
+    def _db(self):
+        # Una conexión por proceso (tras un fork se abre otra)
+        if self._conexion is None or self._pid != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=5, isolation_level=None, check_same_thread=False)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            conexion.executescript(ESQUEMA)
+            self._conexion, self._pid = conexion, os.getpid()
+        return self._conexion
+
+    async def _ejecutar(self, funcion, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._con_lock, funcion, *args)
+
+    def _con_lock(self, funcion, *args):
+        with self._lock:
+            return funcion(self._db(), *args)
+
+    # Envío
+
+    def _prefijo(self, canal):
+        return self.non_local_name(canal)
+
+    def _limpiar_si_toca(self, db):
+        self._envios += 1
+        if self._envios % 500 == 0:
+            ahora = time.time()
+            db.execute('DELETE FROM mensajes WHERE expira < ?', (ahora,))
+            db.execute('DELETE FROM grupos WHERE expira < ?', (ahora,))
+
+    def _insertar(self, db, canal, datos):
+        db.execute('INSERT INTO mensajes (prefijo, canal, expira, datos) VALUES (?, ?, ?, ?)',
+                   (self._prefijo(canal), canal, time.time() + self.expiry, datos))
+        self._limpiar_si_toca(db)
+
+    def _insertar_grupo(self, db, grupo, datos):
+        ahora = time.time()
+        # El prefijo es el canal hasta el "!" incluido, o el canal completo
+        db.execute(
+            """
+            INSERT INTO mensajes (prefijo, canal, expira, datos)
+            SELECT CASE WHEN instr(canal, '!') > 0 THEN substr(canal, 1, instr(canal, '!')) ELSE canal END,
+                   canal, ?, ?
+            FROM grupos WHERE grupo = ? AND expira > ?
+            """,
+            (ahora + self.expiry, datos, grupo, ahora),
+        )
+        self._limpiar_si_toca(db)
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        await self._ejecutar(self._insertar, channel, json.dumps(message))
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_group_name(group)
+        await self._ejecutar(self._insertar_grupo, group, json.dumps(message))
+
+    # Recepción
+
+    def _leer(self, db, prefijo):
+        """Trae y borra todos los mensajes de un prefijo."""
+        if db.execute('SELECT 1 FROM mensajes WHERE prefijo = ? LIMIT 1', (prefijo,)).fetchone() is None:
+            return []
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            filas = db.execute('SELECT id, canal, expira, datos FROM mensajes WHERE prefijo = ? ORDER BY id',
+                               (prefijo,)).fetchall()
+            if filas:
+                db.execute('DELETE FROM mensajes WHERE prefijo = ? AND id <= ?', (prefijo, filas[-1][0]))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return filas
+
+    def _repartir(self, filas):
+        # En el loop, igual que _sacar: los buzones no se tocan desde el executor
+        ahora = time.time()
+        for canal in [canal for canal, buzon in self._buzones.items() if buzon[-1][0] < ahora]:
+            del self._buzones[canal]
+        for _, canal, expira, datos in filas:
+            if expira >= ahora:
+                self._buzones.setdefault(canal, collections.deque()).append((expira, json.loads(datos)))
+
+    def _sacar(self, canal):
+        """El próximo mensaje vigente del buzón, o None; el buzón vacío se borra."""
+        buzon = self._buzones.get(canal)
+        if buzon is None:
+            return None
+        ahora = time.time()
+        mensaje = None
+        while buzon and mensaje is None:
+            expira, siguiente = buzon.popleft()
+            if expira >= ahora:
+                mensaje = siguiente
+        if not buzon:
+            del self._buzones[canal]
+        return mensaje
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        prefijo = self._prefijo(channel)
+        while True:
+            mensaje = self._sacar(channel)
+            if mensaje is not None:
+                return mensaje
+            espera = self._espera.get(prefijo, self.intervalo_min)
+            # Un solo sondeo por intervalo para todo el proceso, lo hagan cuantos canales lo hagan
+            if time.monotonic() - self._ultimo_sondeo.get(prefijo, 0) >= espera:
+                self._ultimo_sondeo[prefijo] = time.monotonic()
+                filas = await self._ejecutar(self._leer, prefijo)
+                self._repartir(filas)
+                self._espera[prefijo] = self.intervalo_min if filas else min(espera * 2, self.intervalo_max)
+                mensaje = self._sacar(channel)
+                if mensaje is not None:
+                    return mensaje
+            await asyncio.sleep(self._espera.get(prefijo, self.intervalo_min))
+
+    async def new_channel(self, prefix='specific'):
+        sufijo = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
+        return f'{prefix}.{self.id_proceso}!{sufijo}'
+
+    # Grupos
+
+    def _agregar(self, db, grupo, canal):
+        db.execute('INSERT OR REPLACE INTO grupos (grupo, canal, expira) VALUES (?, ?, ?)',
+                   (grupo, canal, time.time() + self.group_expiry))
+
+    def _descartar(self, db, grupo, canal):
+        db.execute('DELETE FROM grupos WHERE grupo = ? AND canal = ?', (grupo, canal))
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._ejecutar(self._agregar, group, channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._ejecutar(self._descartar, group, channel)
+
+    # Flush
+
+    def _vaciar(self, db):
+        db.execute('DELETE FROM mensajes')
+        db.execute('DELETE FROM grupos')
+
+    async def flush(self):
+        self._buzones.clear()
+        await self._ejecutar(self._vaciar)
+
+    async def close(self):
+        pass
@@ -0,0 +1,351 @@
+"""
+Métricas de la aplicación en el formato de texto de Prometheus (/metrics).
+
+- MetricasMiddleware mide cada petición: duración y consultas SQL (con un
+  execute wrapper de la conexión), por nombre de URL y método.
+- Los consumidores de WebSocket llevan cuántas conexiones tienen abiertas.
+- Las tareas de fondo (planificador, bandeja de salida de push) se miden
+  con `with tarea('nombre'):`.
+
+Registrar una medición solo toca diccionarios en memoria del proceso, bajo
+un lock; nada de E/S en la petición. Un hilo de fondo vuelca cada
+METRICAS_INTERVALO segundos lo acumulado a un archivo SQLite compartido
+(METRICAS_RUTA), como la capa de canales: contadores e histogramas se suman
+con un UPSERT, y los medidores (gauges) se guardan por proceso con la hora
+del volcado. /metrics lee el archivo, así que muestra el total de todos los
+workers (web, planificador, worker de notificaciones). El medidor de un
+proceso que lleva más de 3 intervalos sin volcar (murió) no se cuenta.
+
+Configuración:
+
+    METRICAS_ACTIVAS = True
+    METRICAS_RUTA = BASE_DIR / 'metricas.sqlite3'
+    METRICAS_INTERVALO = 10
+    METRICAS_TOKEN = None
+
+/metrics no es público: lo lee un admin (sesión del admin de Django o JWT
+de la app con is_staff) o, si METRICAS_TOKEN está definido, quien mande
+"Authorization: Bearer <METRICAS_TOKEN>" (el scraper de Prometheus).
+"""
+import atexit
+import logging
+import math
+import os
+import random
+import sqlite3
+import string
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+METODOS = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS'}
+
+# nombre -> (tipo, ayuda, buckets de los histogramas)
+METRICAS = {
+    'cafeteria_peticion_segundos': ('histogram', 'Duración de las peticiones HTTP por vista', BUCKETS_SEGUNDOS),
+    'cafeteria_peticion_consultas': ('histogram', 'Consultas SQL por petición HTTP', BUCKETS_CONSULTAS),
+    'cafeteria_peticiones_total': ('counter', 'Peticiones HTTP por vista y código de respuesta', None),
+    'cafeteria_websockets_abiertos': ('gauge', 'Conexiones WebSocket abiertas', None),
+    'cafeteria_websockets_conexiones_total': ('counter', 'Conexiones WebSocket aceptadas', None),
+    'cafeteria_tarea_segundos': ('histogram', 'Duración de las tareas de fondo', BUCKETS_SEGUNDOS),
+    'cafeteria_tarea_errores_total': ('counter', 'Tareas de fondo que terminaron con error', None),
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS sumas (
+    muestra TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    serie TEXT NOT NULL,
+    orden INTEGER NOT NULL,
+    valor REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS medidores (
+    muestra TEXT NOT NULL,
+    proceso TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    valor REAL NOT NULL,
+    actualizado REAL NOT NULL,
+    PRIMARY KEY (muestra, proceso)
+);
+"""
+
+
+def activas():
+    return getattr(settings, 'METRICAS_ACTIVAS', True)
+
+
+def _intervalo():
+    return getattr(settings, 'METRICAS_INTERVALO', 10)
+
+
+def _ruta():
+    return str(getattr(settings, 'METRICAS_RUTA', settings.BASE_DIR / 'metricas.sqlite3'))
+
+
+def _conectar(ruta):
+    conexion = sqlite3.connect(ruta, timeout=5, isolation_level=None, check_same_thread=False)
+    conexion.execute('PRAGMA journal_mode=WAL')
+    conexion.execute('PRAGMA synchronous=NORMAL')
+    conexion.executescript(ESQUEMA)
+    return conexion
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ''
+    texto = ','.join('{}="{}"'.format(
+        clave, str(valor).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')) for clave, valor in pares)
+    return '{' + texto + '}'
+
+
+def _numero(valor):
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    return str(int(valor)) if valor == int(valor) else repr(valor)
+
+
+class Registro:
+    """Mediciones del proceso, pendientes de volcar al archivo compartido."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # El hilo de fondo y /metrics comparten la conexión al archivo
+        self._lock_volcado = threading.Lock()
+        self._contadores = {}    # (nombre, etiquetas) -> suma desde el último volcado
+        self._histogramas = {}   # (nombre, etiquetas) -> [conteo por bucket..., +Inf, suma]
+        self._medidores = {}     # (nombre, etiquetas) -> valor actual en este proceso
+        self._pid = None
+        self._conexion = None
+        self._ruta_conexion = None
+        self.id_proceso = None
+
+    # Registro (en memoria)
+
+    def contar(self, nombre, n=1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        self._arrancar()
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + n
+
+    def observar(self, nombre, valor, **etiquetas):
+        buckets = METRICAS[nombre][2]
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        # Primer bucket con le >= valor; len(buckets) es +Inf
+        indice = bisect_left(buckets, valor)
+        self._arrancar()
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = [0] * (len(buckets) + 2)
+            histograma[indice] += 1
+            histograma[-1] += valor
+
+    def ajustar(self, nombre, delta, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        self._arrancar()
+        with self._lock:
+            self._medidores[clave] = self._medidores.get(clave, 0) + delta
+
+    # Volcado
+
+    def _arrancar(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Hijo de un fork: lo pendiente lo vuelca el padre y las conexiones son suyas
+                self._contadores, self._histogramas, self._medidores = {}, {}, {}
+                self._conexion = None
+                self._lock_volcado = threading.Lock()
+            else:
+                atexit.register(self._volcar_al_salir)
+            self._pid = os.getpid()
+            self.id_proceso = f"{self._pid}-" + ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+            threading.Thread(target=self._bucle, name='metricas', daemon=True).start()
+
+    def _bucle(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(_intervalo())
+            try:
+                self.volcar()
+            except Exception:
+                logger.exception("No se pudieron volcar las métricas")
+
+    def _volcar_al_salir(self):
+        try:
+            self.volcar()
+        except Exception:
+            pass
+
+    def _filas(self, contadores, histogramas):
+        filas = []
+        for (nombre, etiquetas), n in contadores.items():
+            filas.append((nombre + _etiquetas(etiquetas), nombre, nombre + _etiquetas(etiquetas), 0, n))
+        for (nombre, etiquetas), conteos in histogramas.items():
+            serie = nombre + _etiquetas(etiquetas)
+            acumulado = 0
+            buckets = METRICAS[nombre][2] + (math.inf,)
+            for i, le in enumerate(buckets):
+                acumulado += conteos[i]
+                muestra = f"{nombre}_bucket" + _etiquetas(etiquetas + (('le', _numero(le)),))
+                filas.append((muestra, nombre, serie, i, acumulado))
+            filas.append((f"{nombre}_sum" + _etiquetas(etiquetas), nombre, serie, len(buckets), conteos[-1]))
+            filas.append((f"{nombre}_count" + _etiquetas(etiquetas), nombre, serie, len(buckets) + 1, acumulado))
+        return filas
+
+    def volcar(self):
+        """Suma lo pendiente de este proceso al archivo compartido y renueva sus medidores."""
+        with self._lock_volcado:
+            self._volcar()
+
+    def _volcar(self):
+        with self._lock:
+            contadores, self._contadores = self._contadores, {}
+            histogramas, self._histogramas = self._histogramas, {}
+            medidores = dict(self._medidores)
+        if not (contadores or histogramas or medidores):
+            return
+        ahora = time.time()
+        try:
+            if self._conexion is None or self._ruta_conexion != _ruta():
+                if self._conexion is not None:
+                    self._conexion.close()
+                self._ruta_conexion = _ruta()
+                self._conexion = _conectar(self._ruta_conexion)
+            with self._conexion:
+                self._conexion.execute('BEGIN IMMEDIATE')
+                self._conexion.executemany(
+                    "INSERT INTO sumas (muestra, nombre, serie, orden, valor) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (muestra) DO UPDATE SET valor = valor + excluded.valor",
+                    self._filas(contadores, histogramas))
+                self._conexion.executemany(
+                    "INSERT OR REPLACE INTO medidores (muestra, proceso, nombre, valor, actualizado) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(nombre + _etiquetas(etiquetas), self.id_proceso, nombre, valor, ahora)
+                     for (nombre, etiquetas), valor in medidores.items()])
+        except Exception:
+            # Se devuelve lo pendiente para el próximo volcado
+            with self._lock:
+                for clave, n in contadores.items():
+                    self._contadores[clave] = self._contadores.get(clave, 0) + n
+                for clave, conteos in histogramas.items():
+                    actual = self._histogramas.setdefault(clave, [0] * len(conteos))
+                    self._histogramas[clave] = [a + b for a, b in zip(actual, conteos)]
+            raise
+
+
+registro = Registro()
+
+
+def exposicion():
+    """El texto de /metrics: las sumas de todos los procesos y los medidores de los vivos."""
+    registro.volcar()
+    conexion = _conectar(_ruta())
+    try:
+        sumas = conexion.execute("SELECT nombre, muestra, valor FROM sumas ORDER BY nombre, serie, orden").fetchall()
+        vivos_desde = time.time() - 3 * _intervalo()
+        medidores = conexion.execute(
+            "SELECT nombre, muestra, SUM(valor) FROM medidores WHERE actualizado >= ? "
+            "GROUP BY nombre, muestra ORDER BY nombre, muestra", (vivos_desde,)).fetchall()
+        conexion.execute("DELETE FROM medidores WHERE actualizado < ?", (vivos_desde - 3600,))
+    finally:
+        conexion.close()
+    lineas, anterior = [], None
+    for nombre, muestra, valor in sumas + medidores:
+        if nombre not in METRICAS:
+            continue
+        if nombre != anterior:
+            tipo, ayuda, _ = METRICAS[nombre]
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+            anterior = nombre
+        lineas.append(f"{muestra} {_numero(valor)}")
+    return '\n'.join(lineas) + '\n'
+
+
+def _usuario(request):
+    """El usuario de la sesión de Django o del JWT de la app, o None."""
+    if request.user.is_authenticated:
+        return request.user
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework.request import Request
+    from usuarios.autenticacion import JWTClaimsAuthentication
+    try:
+        autenticado = JWTClaimsAuthentication().authenticate(Request(request))
+    except AuthenticationFailed:
+        return None
+    return autenticado[0] if autenticado else None
+
+
+def vista_metricas(request):
+    token = getattr(settings, 'METRICAS_TOKEN', None)
+    if not (token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')):
+        usuario = _usuario(request)
+        if usuario is None:
+            return HttpResponse(status=401)
+        if not usuario.is_staff:
+            return HttpResponse(status=403)
+    return HttpResponse(exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@contextmanager
+def tarea(nombre):
+    """Mide una tarea de fondo; si lanza una excepción además la cuenta como error."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if activas():
+            registro.contar('cafeteria_tarea_errores_total', tarea=nombre)
+        raise
+    finally:
+        if activas():
+            registro.observar('cafeteria_tarea_segundos', time.perf_counter() - inicio, tarea=nombre)
+
+
+class _ContadorConsultas:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+class MetricasMiddleware:
+    """
+    Duración y consultas SQL de cada petición por nombre de URL (las que no
+    resuelven a una vista van como 'sin_ruta'). En las respuestas en stream
+    la duración llega hasta que empieza el envío.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not activas():
+            return self.get_response(request)
+        consultas = _ContadorConsultas()
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(consultas):
+            respuesta = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+        coincidencia = request.resolver_match
+        vista = (coincidencia.url_name or coincidencia.view_name) if coincidencia else 'sin_ruta'
+        metodo = request.method if request.method in METODOS else 'otro'
+        registro.observar('cafeteria_peticion_segundos', duracion, vista=vista, metodo=metodo)
+        registro.observar('cafeteria_peticion_consultas', consultas.total, vista=vista, metodo=metodo)
+        registro.contar('cafeteria_peticiones_total', vista=vista, metodo=metodo, codigo=respuesta.status_code)
+        return respuesta
@@ -1,4 +1,6 @@
 import os
+import sys
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 
@@ -13,6 +15,10 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# Corriendo `manage.py test`: los archivos que comparten los procesos (caché,
+# canales, métricas) no se crean en el proyecto
+TESTING = sys.argv[1:2] == ['test']
+
 # Application definition
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -35,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'cafeteria_turnos.metricas.MetricasMiddleware',  # Latencia y consultas por vista (/metrics)
     'corsheaders.middleware.CorsMiddleware',  # CORS headers
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -69,20 +76,148 @@ ASGI_APPLICATION = 'cafeteria_turnos.asgi.application'  # Para Channels y WebSoc
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite admite un solo escritor: las transacciones toman el lock de escritura
+# al empezar (BEGIN IMMEDIATE, ver cafeteria_turnos/sqlite_inmediato) y esperan
+# a otro escritor hasta 'timeout' segundos; pasado eso la emisión de turnos
+# contesta 503 para que el cliente reintente.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'cafeteria_turnos.sqlite_inmediato',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': 2,
+        },
     }
 }
 
-# Channels: Configuración para desarrollo (en memoria, NO uses en producción)
-CHANNEL_LAYERS = {
+# Cachés: 'default' es local a cada proceso; 'compartida' es un directorio de
+# archivos que ven todos los workers del servidor, para lo que se invalida desde
+# otro proceso (CACHE_COMPARTIDA_DIR en el entorno para cambiar el directorio)
+CACHES = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'compartida': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': (tempfile.mkdtemp(prefix='cafeteria-cache-') if TESTING else
+                     os.environ.get('CACHE_COMPARTIDA_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'cafeteria_turnos_cache'))),
     },
 }
 
+# Channels: con CANALES_RUTA en el entorno, capa sobre ese archivo SQLite
+# compartido, que funciona con varios workers en el mismo servidor sin Redis
+# (ver cafeteria_turnos/capa_canales.py). Sin ella, y en los tests, la capa en
+# memoria de Channels, que solo sirve para un proceso: run_scheduler corre
+# aparte y se niega a arrancar con ella.
+CANALES_RUTA = None if TESTING else os.environ.get('CANALES_RUTA')
+if CANALES_RUTA:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'cafeteria_turnos.capa_canales.SQLiteChannelLayer',
+            'CONFIG': {
+                'ruta': CANALES_RUTA,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# Importación de la base de estudiantes (usuarios/importacion.py): filas por
+# lote, procesos que hashean contraseñas en el comando importar_estudiantes
+# (None = uno por núcleo; la vista usa siempre uno) e iteraciones
+# de PBKDF2 para las contraseñas importadas (None = las de Django; con menos,
+# Django las vuelve a hashear completas en el primer inicio de sesión)
+USUARIOS_IMPORTACION_LOTE = 1000
+USUARIOS_IMPORTACION_PROCESOS = None
+USUARIOS_IMPORTACION_ITERACIONES = None
+
+# Autenticación JWT por claims (usuarios/autenticacion.py): cada cuántos segundos
+# un proceso vuelve a leer la version_token de un usuario (lo que tarda una
+# revocación en llegar a los demás workers) y cuántos usuarios recuerda
+USUARIOS_JWT_REVALIDAR_SEGUNDOS = 30
+USUARIOS_JWT_LRU = 10000
+
+# Notificaciones push (notificaciones/push.py): transporte (None = sin push,
+# 'fcm' = FCM con la cuenta de servicio FCM_CUENTA_SERVICIO del proyecto
+# FCM_PROYECTO, 'http' = JSON de FCM a PUSH_URL), tokens por trozo y envíos
+# simultáneos (también el tamaño del pool de conexiones)
+PUSH_TRANSPORTE = None
+PUSH_URL = None
+PUSH_LOTE = 500
+PUSH_CONEXIONES = 16
+FCM_CUENTA_SERVICIO = None
+FCM_PROYECTO = None
+# Bandeja de salida de push (notificaciones/outbox.py, comando
+# procesar_notificaciones): envíos por lote, intentos antes de darlo por
+# muerto, espera del primer reintento (se duplica en cada uno) y días que se
+# guardan los enviados
+NOTIFICACIONES_OUTBOX_LOTE = 100
+NOTIFICACIONES_OUTBOX_INTENTOS = 5
+NOTIFICACIONES_OUTBOX_ESPERA_SEGUNDOS = 30
+NOTIFICACIONES_OUTBOX_RETENCION_DIAS = 7
+
+# Cada cuántos segundos el registro de cafeterías en memoria comprueba si otro
+# proceso las cambió (ver cafeteria/registro.py)
+CAFETERIA_REGISTRO_REVALIDAR_SEGUNDOS = 5
+
+# Asignador de códigos de turno: 'secuencial' (A-001, A-002... por cafetería y día),
+# 'pool' (6 caracteres barajados) o la ruta a una clase propia
+TURNOS_ASIGNADOR_CODIGO = 'secuencial'
+
+# Cada cuántos segundos la cola en memoria mira si otros workers escribieron
+# (un rango de ids de CambioTurno) y, solo entonces, se recarga (0 = nunca)
+TURNOS_COLA_RESINCRONIZAR_SEGUNDOS = 10
+
+# Rollover diario de turnos (turnos/archivo.py): días que se quedan en Turno
+# antes de pasar a TurnoArchivado (None = no archivar) y turnos por lote
+TURNOS_ARCHIVO_DIAS = 7
+TURNOS_ARCHIVO_LOTE = 1000
+# Días que se guardan las bajas de CambioTurno para ?since= del listado del
+# admin; un cliente que no sincroniza hace más tiempo debe recargar con since=0
+TURNOS_CAMBIOS_RETENCION_DIAS = 7
+
+# Cada cuántos segundos el planificador recalcula los percentiles de espera
+# de las estadísticas que cambiaron (turnos/estadisticas.py)
+TURNOS_ESTADISTICAS_SEGUNDOS = 60
+
+# Ventana en la que se agrupan los cambios de turno antes de enviarlos por WebSocket
+TURNOS_DIFUSION_VENTANA_MS = 100
+
+# Caché (alias de CACHES) con el "penalizado hasta" de cada usuario. Tiene que
+# ser compartida: la penalización masiva corre en el planificador y las
+# despenalizaciones en cualquier worker
+TURNOS_CACHE_PENALIZACIONES = 'compartida'
+# Cuánto se recuerda que un usuario no está penalizado
+TURNOS_PENALIZACION_CACHE_SEGUNDOS = 30
+
+# QR dinámico: 'tabla' (un QRActivo aleatorio por cafetería y minuto) o 'hmac'
+# (código firmado por ventana de tiempo, validado sin base de datos; ver qr/firmas.py)
+QR_MODO = 'tabla'
+# Secreto de las firmas (None = SECRET_KEY). Cambiarlo invalida los QR mostrados
+QR_SECRETO = None
+QR_VENTANA_SEGUNDOS = 60
+# Ventanas vecinas que se aceptan por demora del escaneo o diferencia de reloj
+QR_TOLERANCIA_VENTANAS = 1
+
+# Historial de QRActivo: días completos que se conservan (None = todos), si los
+# más viejos se resumen por día en QRResumenDiario, tamaño de los lotes de
+# borrado y pausa entre lotes del comando depurar_qr; el planificador no hace
+# pausas, reparte los lotes entre ticks (ver qr/retencion.py)
+QR_RETENCION_DIAS = 30
+QR_RETENCION_COMPACTAR = True
+QR_RETENCION_LOTE = 1000
+QR_RETENCION_PAUSA_MS = 50
+
+# Planificador de tareas por tiempo (manage.py run_scheduler)
+PLANIFICADOR_TICK_SEGUNDOS = 1
+PLANIFICADOR_RESINCRONIZAR_SEGUNDOS = 10
+PLANIFICADOR_ARRIENDO_SEGUNDOS = 15
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -125,7 +260,7 @@ AUTH_USER_MODEL = 'usuarios.Usuario'
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'usuarios.autenticacion.JWTClaimsAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -140,4 +275,14 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=6),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
-}
\ No newline at end of file
+}
+
+# Métricas Prometheus en /metrics (cafeteria_turnos/metricas.py). Cada proceso
+# vuelca lo suyo cada METRICAS_INTERVALO segundos a un SQLite compartido, así
+# /metrics suma todos los workers. /metrics solo lo leen admins o, con
+# METRICAS_TOKEN, quien mande "Authorization: Bearer <token>" (Prometheus).
+METRICAS_ACTIVAS = True
+METRICAS_RUTA = (os.path.join(tempfile.mkdtemp(prefix='cafeteria-metricas-'), 'metricas.sqlite3') if TESTING
+                 else BASE_DIR / 'metricas.sqlite3')
+METRICAS_INTERVALO = 10
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN') or None
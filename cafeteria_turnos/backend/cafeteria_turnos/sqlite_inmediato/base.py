@@ -0,0 +1,16 @@
+"""
+Backend SQLite cuyas transacciones empiezan con BEGIN IMMEDIATE.
+
+Con el BEGIN diferido de Django 4.2 una transacción que lee y después escribe
+(la emisión de un turno) puede chocar con otro escritor al pasar de lectura
+a escritura, y SQLite devuelve "database is locked" sin esperar. Tomando el
+lock de escritura al empezar, la espera queda en el busy timeout de SQLite
+(OPTIONS['timeout'] en settings.py). Es lo que Django 5.1 hace con
+OPTIONS['transaction_mode'] = 'IMMEDIATE'.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from .metricas import vista_metricas
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/usuarios/', include('usuarios.urls')),
@@ -8,4 +10,5 @@ urlpatterns = [
     path('api/turnos/', include('turnos.urls')),
     path('api/qr/', include('qr.urls')),
     path('api/notificaciones/', include('notificaciones.urls')),
+    path('metrics', vista_metricas, name='metricas'),
 ]
\ No newline at end of file
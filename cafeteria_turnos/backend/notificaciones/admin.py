@@ -1,8 +1,21 @@
 from django.contrib import admin
-from .models import Notificacion
+from django.utils import timezone
+from .models import EnvioPush, Notificacion
 
 @admin.register(Notificacion)
 class NotificacionAdmin(admin.ModelAdmin):
     list_display = ('usuario', 'titulo', 'enviada_en', 'leida')
     list_filter = ('leida',)
-    search_fields = ('usuario__username', 'titulo')
\ No newline at end of file
+    search_fields = ('usuario__username', 'titulo')
+
+@admin.register(EnvioPush)
+class EnvioPushAdmin(admin.ModelAdmin):
+    list_display = ('titulo', 'usuario', 'estado', 'intentos', 'creado_en', 'enviado_en')
+    list_filter = ('estado',)
+    search_fields = ('usuario__username', 'titulo')
+    actions = ['reintentar']
+
+    @admin.action(description='Reintentar los envíos seleccionados')
+    def reintentar(self, request, queryset):
+        queryset.exclude(estado=EnvioPush.ENVIADO).update(
+            estado=EnvioPush.PENDIENTE, intentos=0, disponible_en=timezone.now(), reclamado_por='')
@@ -0,0 +1,66 @@
+"""
+Servidor FCM falso para probar el envío push sin red.
+
+Responde como la API HTTP v1 (POST .../messages:send): 200 con el nombre del
+mensaje, o 404 UNREGISTERED si el token empieza con PREFIJO_NO_REGISTRADO.
+Con latencia_ms simula el tiempo de ida y vuelta al proveedor.
+
+    with servidor_fcm_falso(latencia_ms=20) as servidor:
+        with override_settings(PUSH_TRANSPORTE='http', PUSH_URL=servidor.url):
+            despachar(...)
+        servidor.recibidos  # tokens recibidos
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIJO_NO_REGISTRADO = 'no-registrado'
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, como FCM
+    # Sin esto, encabezados y cuerpo salen en dos envíos y el ACK retardado suma ~40 ms
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        servidor = self.server
+        cuerpo = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        token = cuerpo['message']['token']
+        if servidor.latencia:
+            time.sleep(servidor.latencia)
+        with servidor.lock:
+            servidor.recibidos.append(token)
+            numero = len(servidor.recibidos)
+        if token.startswith(PREFIJO_NO_REGISTRADO):
+            estado, respuesta = 404, {'error': {'code': 404, 'status': 'NOT_FOUND', 'details': [
+                {'@type': 'type.googleapis.com/google.firebase.fcm.v1.FcmError', 'errorCode': 'UNREGISTERED'}]}}
+        else:
+            estado, respuesta = 200, {'name': f'projects/falso/messages/{numero}'}
+        datos = json.dumps(respuesta).encode()
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def servidor_fcm_falso(latencia_ms=0):
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), _Manejador)
+    servidor.daemon_threads = True
+    servidor.latencia = latencia_ms / 1000
+    servidor.recibidos = []
+    servidor.lock = threading.Lock()
+    servidor.url = f'http://127.0.0.1:{servidor.server_address[1]}/v1/projects/falso/messages:send'
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    try:
+        yield servidor
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
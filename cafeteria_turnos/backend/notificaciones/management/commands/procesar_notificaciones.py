@@ -0,0 +1,43 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from cafeteria_turnos import metricas
+from notificaciones import outbox
+from notificaciones.push import obtener_transporte
+
+class Command(BaseCommand):
+    help = 'Envía los push pendientes de la bandeja de salida (EnvioPush) con reintentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Vaciar lo vencido y salir')
+        parser.add_argument('--pausa', type=float, default=1.0, help='Segundos de espera con la bandeja vacía')
+        parser.add_argument('--metricas-cada', type=float, default=60.0, help='Segundos entre registros de métricas')
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+        transporte = obtener_transporte()
+        if transporte is None:
+            raise CommandError('PUSH_TRANSPORTE no está configurado: no hay a dónde enviar')
+        ultimo_registro = 0
+        try:
+            while True:
+                inicio = time.perf_counter()
+                resultado = outbox.procesar_lote(transporte=transporte)
+                hubo_trabajo = any(resultado.values())
+                if hubo_trabajo and metricas.activas():
+                    # Los sondeos de la bandeja vacía no cuentan como tarea
+                    metricas.registro.observar('cafeteria_tarea_segundos', time.perf_counter() - inicio,
+                                               tarea='envio_push')
+                if hubo_trabajo:
+                    self.stdout.write(f"Lote: {resultado}")
+                if time.monotonic() - ultimo_registro >= options['metricas_cada']:
+                    ultimo_registro = time.monotonic()
+                    outbox.depurar_enviados()
+                    self.stdout.write(f"Bandeja: {outbox.metricas()}")
+                if not hubo_trabajo:
+                    if options['una_vez']:
+                        return
+                    time.sleep(options['pausa'])
+        except KeyboardInterrupt:
+            self.stdout.write('Worker de notificaciones detenido')
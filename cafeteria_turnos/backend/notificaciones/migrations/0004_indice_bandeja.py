@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificaciones', '0003_dispositivopush'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['usuario', 'enviada_en'], name='notificacion_usuario_fecha'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notificaciones', '0004_indice_bandeja'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvioPush',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('titulo', models.CharField(max_length=100)),
+                ('mensaje', models.TextField()),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviado', 'Enviado'), ('muerto', 'Sin entregar')], default='pendiente', max_length=10)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('reclamado_por', models.CharField(blank=True, max_length=32)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('enviado_en', models.DateTimeField(blank=True, null=True)),
+                ('notificacion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='notificaciones.notificacion')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'disponible_en'], name='envio_push_estado_disponible')],
+            },
+        ),
+    ]
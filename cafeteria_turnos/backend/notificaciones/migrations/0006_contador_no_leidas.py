@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def contar_no_leidas(apps, schema_editor):
+    Notificacion = apps.get_model('notificaciones', 'Notificacion')
+    NoLeidas = apps.get_model('notificaciones', 'NoLeidas')
+    conteos = (Notificacion.objects.filter(leida=False).values('usuario_id')
+               .annotate(cantidad=models.Count('id')).order_by())
+    NoLeidas.objects.bulk_create([NoLeidas(usuario_id=fila['usuario_id'], cantidad=fila['cantidad'])
+                                  for fila in conteos], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0002_version_token'),
+        ('notificaciones', '0005_bandeja_salida_push'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoLeidas',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='no_leidas', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(contar_no_leidas, migrations.RunPython.noop),
+    ]
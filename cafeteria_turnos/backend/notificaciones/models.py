@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from usuarios.models import Usuario
 
 class Notificacion(models.Model):
@@ -8,11 +9,61 @@ class Notificacion(models.Model):
     enviada_en = models.DateTimeField(auto_now_add=True)
     leida = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Bandeja de un usuario, de la más reciente a la más vieja
+            models.Index(fields=['usuario', 'enviada_en'], name='notificacion_usuario_fecha'),
+        ]
+
     def __str__(self):
         return f"Notificación para {self.usuario}: {self.titulo}"
     
+class NoLeidas(models.Model):
+    """
+    Notificaciones sin leer de cada usuario, mantenido al crear, marcar y
+    borrar notificaciones (ver notificaciones/no_leidas.py).
+    """
+    usuario = models.OneToOneField(Usuario, on_delete=models.CASCADE, primary_key=True, related_name='no_leidas')
+    cantidad = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.usuario}: {self.cantidad} sin leer"
+
 class DispositivoPush(models.Model):
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="dispositivos_push")
     token = models.CharField(max_length=255, unique=True)
     plataforma = models.CharField(max_length=20, choices=[("android", "Android"), ("ios", "iOS"), ("web", "Web")])
-    creado_en = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+class EnvioPush(models.Model):
+    """
+    Bandeja de salida de push: se escribe en la misma transacción que la
+    Notificacion y el comando procesar_notificaciones la envía después.
+    """
+    PENDIENTE = 'pendiente'
+    ENVIADO = 'enviado'
+    MUERTO = 'muerto'
+    ESTADOS = ((PENDIENTE, 'Pendiente'), (ENVIADO, 'Enviado'), (MUERTO, 'Sin entregar'))
+
+    notificacion = models.ForeignKey(Notificacion, on_delete=models.CASCADE, null=True, blank=True)
+    # Sin usuario es para todos los dispositivos
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, null=True, blank=True)
+    titulo = models.CharField(max_length=100)
+    mensaje = models.TextField()
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=PENDIENTE)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    # Próximo intento; al reclamarlo un worker se corre por el arriendo
+    disponible_en = models.DateTimeField(default=timezone.now)
+    reclamado_por = models.CharField(max_length=32, blank=True)
+    intentos = models.PositiveIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Lo que busca el worker: pendientes por próximo intento
+            models.Index(fields=['estado', 'disponible_en'], name='envio_push_estado_disponible'),
+        ]
+
+    def __str__(self):
+        return f"Push {self.titulo} ({self.estado})"
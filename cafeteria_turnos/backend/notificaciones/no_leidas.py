@@ -0,0 +1,60 @@
+"""
+Contador de notificaciones sin leer por usuario (NoLeidas).
+
+- Crear una notificación sin leer suma 1 (señal post_save).
+- Marcar como leídas es un solo UPDATE sobre Notificacion y resta las filas
+  que cambió, en la misma transacción (marcar_leidas).
+- Borrar una sin leer resta 1 (post_delete). Si se edita una notificación
+  desde el admin (leida puede ir y volver) el contador se recalcula.
+
+Un usuario sin fila (p. ej. creado antes de que existiera) se cuenta la
+primera vez que se consulta.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import NoLeidas, Notificacion
+
+
+def _contar_en_base(usuario_id):
+    return Notificacion.objects.filter(usuario_id=usuario_id, leida=False).count()
+
+
+def recalcular(usuario_id):
+    cantidad = _contar_en_base(usuario_id)
+    NoLeidas.objects.update_or_create(usuario_id=usuario_id, defaults={'cantidad': cantidad})
+    return cantidad
+
+
+def sumar(usuario_id, n=1):
+    if NoLeidas.objects.filter(usuario_id=usuario_id).update(cantidad=F('cantidad') + n):
+        return
+    try:
+        with transaction.atomic():
+            # La notificación recién creada ya está en la base: contar incluye la suma
+            NoLeidas.objects.create(usuario_id=usuario_id, cantidad=_contar_en_base(usuario_id))
+    except IntegrityError:
+        # Otra petición creó la fila entre el UPDATE y el INSERT
+        NoLeidas.objects.filter(usuario_id=usuario_id).update(cantidad=F('cantidad') + n)
+
+
+def restar(usuario_id, n=1):
+    if n:
+        NoLeidas.objects.filter(usuario_id=usuario_id).update(cantidad=Greatest(F('cantidad') - n, 0))
+
+
+def contar(usuario_id):
+    cantidad = NoLeidas.objects.filter(usuario_id=usuario_id).values_list('cantidad', flat=True).first()
+    return recalcular(usuario_id) if cantidad is None else cantidad
+
+
+def marcar_leidas(usuario_id, ids=None):
+    """Marca como leídas las notificaciones del usuario (todas, o las de ids). Devuelve cuántas cambiaron."""
+    with transaction.atomic():
+        pendientes = Notificacion.objects.filter(usuario_id=usuario_id, leida=False)
+        if ids is not None:
+            pendientes = pendientes.filter(id__in=ids)
+        n = pendientes.update(leida=True)
+        restar(usuario_id, n)
+    return n
@@ -0,0 +1,132 @@
+"""
+Bandeja de salida (outbox) de las notificaciones push.
+
+encolar() escribe un EnvioPush; llamado dentro de la transacción que crea la
+Notificacion, o se guardan los dos o ninguno, y la petición no espera al
+proveedor. El comando procesar_notificaciones vacía la bandeja:
+
+1. Reclama hasta NOTIFICACIONES_OUTBOX_LOTE envíos vencidos con un solo
+   UPDATE que les corre disponible_en por el arriendo y marca reclamado_por;
+   dos workers nunca reclaman el mismo envío, y si uno muere a la mitad sus
+   envíos vuelven a estar disponibles al vencer el arriendo.
+2. Envía cada uno con push.despachar. Justo antes renueva el arriendo de ese
+   envío, solo si sigue siendo suyo: si el lote tardó más que el arriendo y
+   otro worker ya lo retomó, lo salta en vez de duplicar el push. El
+   resultado también se guarda solo si el envío sigue reclamado por él.
+3. Si no se pudo enviar a ningún dispositivo (o falló el envío entero), lo
+   reintenta con espera exponencial: NOTIFICACIONES_OUTBOX_ESPERA_SEGUNDOS,
+   el doble, el cuádruple... Tras NOTIFICACIONES_OUTBOX_INTENTOS intentos
+   queda 'muerto' (dead letter) para revisarlo desde el admin. Un envío que
+   llegó a algunos dispositivos y a otros no se da por enviado, con el error
+   anotado: reintentarlo duplicaría el push en los que sí llegó.
+
+Los enviados se borran pasados NOTIFICACIONES_OUTBOX_RETENCION_DIAS días.
+"""
+import logging
+import random
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Avg, Count, F, Min, Q
+from django.utils import timezone
+
+from .models import DispositivoPush, EnvioPush
+from .push import despachar
+
+logger = logging.getLogger(__name__)
+
+# Cuánto tiene un worker para despachar lo que reclamó antes de que otro lo retome
+ARRIENDO = timedelta(minutes=5)
+
+
+def encolar(titulo, mensaje, usuario=None, notificacion=None):
+    """Agrega un push a la bandeja. Sin usuario va a todos los dispositivos."""
+    return EnvioPush.objects.create(usuario=usuario, notificacion=notificacion, titulo=titulo, mensaje=mensaje)
+
+
+def espera(intentos):
+    """Espera antes del siguiente intento, con un 10 % de variación para no sincronizar reintentos."""
+    base = getattr(settings, 'NOTIFICACIONES_OUTBOX_ESPERA_SEGUNDOS', 30) * 2 ** (intentos - 1)
+    return timedelta(seconds=base * random.uniform(0.9, 1.1))
+
+
+def reclamar(ahora=None, lote=None, worker=None):
+    ahora = ahora or timezone.now()
+    lote = lote or getattr(settings, 'NOTIFICACIONES_OUTBOX_LOTE', 100)
+    worker = worker or uuid.uuid4().hex
+    vencidos = (EnvioPush.objects.filter(estado=EnvioPush.PENDIENTE, disponible_en__lte=ahora)
+                .order_by('disponible_en').values('id')[:lote])
+    EnvioPush.objects.filter(id__in=vencidos, disponible_en__lte=ahora).update(
+        disponible_en=ahora + ARRIENDO, reclamado_por=worker)
+    return list(EnvioPush.objects.filter(reclamado_por=worker, estado=EnvioPush.PENDIENTE).order_by('id'))
+
+
+def procesar_lote(ahora=None, lote=None, transporte=None):
+    """Reclama y envía un lote. Devuelve {'enviados', 'reintentos', 'muertos'}."""
+    resultado = {'enviados': 0, 'reintentos': 0, 'muertos': 0}
+    max_intentos = getattr(settings, 'NOTIFICACIONES_OUTBOX_INTENTOS', 5)
+    worker = uuid.uuid4().hex
+    for envio in reclamar(ahora, lote, worker):
+        if not renovar(envio, worker):
+            # Se venció el arriendo y otro worker lo retomó
+            continue
+        dispositivos = DispositivoPush.objects.all()
+        if envio.usuario_id is not None:
+            dispositivos = dispositivos.filter(usuario_id=envio.usuario_id)
+        envio.intentos += 1
+        try:
+            resumen = despachar(dispositivos, envio.titulo, envio.mensaje, transporte=transporte)
+            error = f"{resumen['fallidos']} dispositivos fallaron" if resumen['fallidos'] else ''
+            entregado = resumen['enviados'] or not resumen['fallidos']
+        except Exception as e:
+            logger.exception("Push %s: falló el envío", envio.id)
+            error, entregado = repr(e), False
+
+        cambios = {'intentos': envio.intentos, 'ultimo_error': error[:1000], 'reclamado_por': ''}
+        if entregado:
+            cambios.update(estado=EnvioPush.ENVIADO, enviado_en=timezone.now())
+            resultado['enviados'] += 1
+        elif envio.intentos >= max_intentos:
+            cambios.update(estado=EnvioPush.MUERTO)
+            resultado['muertos'] += 1
+            logger.warning("Push %s sin entregar tras %s intentos: %s", envio.id, envio.intentos, error)
+        else:
+            cambios.update(disponible_en=timezone.now() + espera(envio.intentos))
+            resultado['reintentos'] += 1
+        if not EnvioPush.objects.filter(pk=envio.pk, reclamado_por=worker).update(**cambios):
+            logger.warning("Push %s: otro worker lo retomó durante el envío", envio.id)
+    return resultado
+
+
+def renovar(envio, worker):
+    """Corre el arriendo del envío si sigue reclamado por `worker`. Devuelve si lo conserva."""
+    return bool(EnvioPush.objects.filter(pk=envio.pk, reclamado_por=worker, estado=EnvioPush.PENDIENTE)
+                .update(disponible_en=timezone.now() + ARRIENDO))
+
+
+def depurar_enviados(ahora=None):
+    dias = getattr(settings, 'NOTIFICACIONES_OUTBOX_RETENCION_DIAS', 7)
+    corte = (ahora or timezone.now()) - timedelta(days=dias)
+    return EnvioPush.objects.filter(estado=EnvioPush.ENVIADO, enviado_en__lt=corte).delete()[0]
+
+
+def metricas(ahora=None):
+    """
+    Estado de la bandeja: pendientes, vencidos (ya deberían haberse enviado),
+    muertos, retraso_segundos (antigüedad del pendiente más viejo) y
+    entrega_promedio_segundos (de creado a enviado, última hora).
+    """
+    ahora = ahora or timezone.now()
+    conteos = EnvioPush.objects.aggregate(
+        pendientes=Count('id', filter=Q(estado=EnvioPush.PENDIENTE)),
+        vencidos=Count('id', filter=Q(estado=EnvioPush.PENDIENTE, disponible_en__lte=ahora)),
+        muertos=Count('id', filter=Q(estado=EnvioPush.MUERTO)),
+        mas_viejo=Min('creado_en', filter=Q(estado=EnvioPush.PENDIENTE)),
+    )
+    entrega = (EnvioPush.objects.filter(estado=EnvioPush.ENVIADO, enviado_en__gte=ahora - timedelta(hours=1))
+               .aggregate(promedio=Avg(F('enviado_en') - F('creado_en')))['promedio'])
+    mas_viejo = conteos.pop('mas_viejo')
+    conteos['retraso_segundos'] = max((ahora - mas_viejo).total_seconds(), 0) if mas_viejo else 0
+    conteos['entrega_promedio_segundos'] = entrega.total_seconds() if entrega is not None else None
+    return conteos
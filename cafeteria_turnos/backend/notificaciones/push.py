@@ -0,0 +1,166 @@
+"""
+Envío de notificaciones push a muchos dispositivos.
+
+despachar(dispositivos, titulo, mensaje) recorre el queryset de
+DispositivoPush con iterator() en trozos de PUSH_LOTE tokens (500, el tope
+de FCM por envío múltiple) y envía cada trozo en paralelo con
+PUSH_CONEXIONES hilos que comparten un pool de conexiones HTTP. Los tokens
+que el proveedor reporta como no registrados se borran al terminar (SQLite
+no aísla un cursor abierto de las escrituras de la misma conexión).
+
+El transporte se elige con PUSH_TRANSPORTE:
+- None: push deshabilitado (desarrollo), no se envía nada.
+- 'fcm': API HTTP v1 de FCM con pyfcm, usando FCM_CUENTA_SERVICIO (ruta al
+  JSON de la cuenta de servicio) y FCM_PROYECTO.
+- 'http': el mismo JSON de la API v1, sin credenciales, a PUSH_URL. Sirve
+  para el servidor FCM falso de fcm_falso.py o para una pasarela propia.
+- o la ruta a una clase con un método enviar(token, titulo, mensaje) que
+  devuelve ENVIADO, NO_REGISTRADO o FALLIDO.
+El transporte se crea una vez por proceso y reutiliza sus conexiones.
+requests (y su urllib3) y pyfcm se importan solo al crear o usar el
+transporte que los necesita, así el módulo carga sin ellos cuando push está
+deshabilitado (ver requirements.txt).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import DispositivoPush
+
+logger = logging.getLogger(__name__)
+
+ENVIADO = 'enviado'
+NO_REGISTRADO = 'no_registrado'
+FALLIDO = 'fallido'
+
+
+def _adaptador(conexiones):
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    # Reintenta los errores pasajeros del proveedor; un 404 (token no registrado) no se reintenta
+    reintentos = Retry(total=3, backoff_factor=0.2, status_forcelist=(429, 500, 502, 503, 504),
+                       allowed_methods=None, raise_on_status=False)
+    return HTTPAdapter(pool_connections=1, pool_maxsize=conexiones, max_retries=reintentos)
+
+
+class TransporteHTTP:
+    """POST del JSON de la API v1 de FCM a una URL, sin credenciales."""
+
+    def __init__(self, conexiones, url=None, timeout=10):
+        self.url = url or settings.PUSH_URL
+        self.timeout = timeout
+        self.adaptador = _adaptador(conexiones)
+        self.local = threading.local()
+
+    def _sesion(self):
+        import requests
+
+        # Una sesión por hilo; todas comparten el pool del adaptador
+        sesion = getattr(self.local, 'sesion', None)
+        if sesion is None:
+            sesion = self.local.sesion = requests.Session()
+            sesion.mount('http://', self.adaptador)
+            sesion.mount('https://', self.adaptador)
+        return sesion
+
+    def enviar(self, token, titulo, mensaje):
+        import requests
+
+        cuerpo = {'message': {'token': token, 'notification': {'title': titulo, 'body': mensaje}}}
+        try:
+            respuesta = self._sesion().post(self.url, json=cuerpo, timeout=self.timeout)
+        except requests.RequestException:
+            logger.warning("Push: no se pudo contactar a %s", self.url, exc_info=True)
+            return FALLIDO
+        if respuesta.status_code == 200:
+            return ENVIADO
+        if respuesta.status_code == 404:
+            return NO_REGISTRADO
+        return FALLIDO
+
+
+class TransporteFCM:
+    """API HTTP v1 de FCM con pyfcm."""
+
+    def __init__(self, conexiones):
+        from pyfcm import FCMNotification
+        self.cliente = FCMNotification(
+            service_account_file=getattr(settings, 'FCM_CUENTA_SERVICIO', None),
+            project_id=getattr(settings, 'FCM_PROYECTO', None),
+            adapter=_adaptador(conexiones),
+        )
+
+    def enviar(self, token, titulo, mensaje):
+        import requests
+        from pyfcm.errors import FCMError, FCMNotRegisteredError
+        try:
+            self.cliente.notify(fcm_token=token, notification_title=titulo, notification_body=mensaje)
+        except FCMNotRegisteredError:
+            return NO_REGISTRADO
+        except (FCMError, requests.RequestException):
+            logger.warning("Push: FCM rechazó un envío", exc_info=True)
+            return FALLIDO
+        return ENVIADO
+
+
+TRANSPORTES = {
+    'http': TransporteHTTP,
+    'fcm': TransporteFCM,
+}
+
+_transporte = (None, None)
+
+
+def _conexiones():
+    return getattr(settings, 'PUSH_CONEXIONES', 16)
+
+
+def obtener_transporte():
+    """El transporte de PUSH_TRANSPORTE (None si push está deshabilitado)."""
+    global _transporte
+    nombre = getattr(settings, 'PUSH_TRANSPORTE', None)
+    if nombre is None:
+        return None
+    clave = (nombre, _conexiones(), getattr(settings, 'PUSH_URL', None))
+    if _transporte[0] != clave:
+        clase = TRANSPORTES.get(nombre) or import_string(nombre)
+        _transporte = (clave, clase(_conexiones()))
+    return _transporte[1]
+
+
+def _trozos(iterable, tamano):
+    iterador = iter(iterable)
+    while trozo := list(islice(iterador, tamano)):
+        yield trozo
+
+
+def despachar(dispositivos, titulo, mensaje, transporte=None):
+    """
+    Envía la notificación a cada DispositivoPush del queryset y borra los
+    tokens no registrados. Devuelve {'enviados', 'fallidos', 'eliminados'}.
+    """
+    resumen = {'enviados': 0, 'fallidos': 0, 'eliminados': 0}
+    transporte = transporte or obtener_transporte()
+    if transporte is None:
+        return resumen
+    lote = getattr(settings, 'PUSH_LOTE', 500)
+    no_registrados = []
+    filas = dispositivos.order_by().values_list('id', 'token').iterator(chunk_size=lote)
+    with ThreadPoolExecutor(max_workers=_conexiones(), thread_name_prefix='push') as pool:
+        for trozo in _trozos(filas, lote):
+            resultados = pool.map(lambda fila: transporte.enviar(fila[1], titulo, mensaje), trozo)
+            for (dispositivo_id, _), resultado in zip(trozo, resultados):
+                if resultado == ENVIADO:
+                    resumen['enviados'] += 1
+                elif resultado == NO_REGISTRADO:
+                    no_registrados.append(dispositivo_id)
+                else:
+                    resumen['fallidos'] += 1
+    for trozo in _trozos(no_registrados, lote):
+        resumen['eliminados'] += DispositivoPush.objects.filter(id__in=trozo).delete()[0]
+    return resumen
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import no_leidas
+from .models import Notificacion
+
+
+@receiver(post_save, sender=Notificacion)
+def contar_notificacion(sender, instance, created, **kwargs):
+    if created:
+        if not instance.leida:
+            no_leidas.sumar(instance.usuario_id)
+    else:
+        no_leidas.recalcular(instance.usuario_id)
+
+
+@receiver(post_delete, sender=Notificacion)
+def descontar_notificacion(sender, instance, **kwargs):
+    if not instance.leida:
+        no_leidas.restar(instance.usuario_id)
@@ -1,7 +1,19 @@
+import importlib
+import sys
+from datetime import timedelta
+from unittest import mock
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from usuarios.models import Usuario
-from .models import Notificacion
+from .fcm_falso import PREFIJO_NO_REGISTRADO, servidor_fcm_falso
+from . import outbox, push
+from .models import DispositivoPush, EnvioPush, NoLeidas, Notificacion
+from .push import ENVIADO, FALLIDO, despachar
+from .utils import enviar_push
 
 class NotificacionesTests(APITestCase):
     def setUp(self):
@@ -20,4 +32,181 @@ class NotificacionesTests(APITestCase):
         url = reverse('marcar_notificacion_leida', args=[self.noti.id])
         response = self.client.post(url)
         self.noti.refresh_from_db()
-        self.assertTrue(self.noti.leida)
\ No newline at end of file
+        self.assertTrue(self.noti.leida)
+
+
+class PushTests(APITestCase):
+    def setUp(self):
+        self.user = Usuario.objects.create_user(username="user", password="userpass", codigo_estudiantil="U1")
+        self.otro = Usuario.objects.create_user(username="otro", password="otropass", codigo_estudiantil="U2")
+        for i in range(5):
+            token = f"{PREFIJO_NO_REGISTRADO}-{i}" if i % 2 else f"token-{i}"
+            DispositivoPush.objects.create(usuario=self.user, token=token, plataforma="android")
+        DispositivoPush.objects.create(usuario=self.otro, token="token-otro", plataforma="web")
+
+    def test_envia_por_trozos_y_borra_no_registrados(self):
+        with servidor_fcm_falso() as servidor:
+            with override_settings(PUSH_TRANSPORTE='http', PUSH_URL=servidor.url, PUSH_LOTE=2, PUSH_CONEXIONES=3):
+                resumen = despachar(DispositivoPush.objects.all(), "Hola", "Mensaje")
+        self.assertEqual(resumen, {'enviados': 4, 'fallidos': 0, 'eliminados': 2})
+        self.assertEqual(len(servidor.recibidos), 6)
+        self.assertFalse(DispositivoPush.objects.filter(token__startswith=PREFIJO_NO_REGISTRADO).exists())
+
+    def test_enviar_push_solo_al_usuario(self):
+        with servidor_fcm_falso() as servidor:
+            with override_settings(PUSH_TRANSPORTE='http', PUSH_URL=servidor.url):
+                resumen = enviar_push(self.otro, "Hola", "Mensaje")
+        self.assertEqual(servidor.recibidos, ["token-otro"])
+        self.assertEqual(resumen['enviados'], 1)
+
+    @override_settings(PUSH_TRANSPORTE=None)
+    def test_sin_transporte_no_envia(self):
+        self.assertEqual(enviar_push(self.user, "Hola", "Mensaje"), {'enviados': 0, 'fallidos': 0, 'eliminados': 0})
+        self.assertEqual(DispositivoPush.objects.count(), 6)
+
+    @override_settings(PUSH_TRANSPORTE=None)
+    def test_carga_sin_las_dependencias_de_los_transportes(self):
+        faltantes = dict.fromkeys(('requests', 'requests.adapters', 'urllib3', 'urllib3.util.retry', 'pyfcm'))
+        self.addCleanup(importlib.reload, push)
+        with mock.patch.dict(sys.modules, faltantes):
+            modulo = importlib.reload(push)
+            self.assertIsNone(modulo.obtener_transporte())
+
+
+class TransporteFijo:
+    def __init__(self, resultado):
+        self.resultado = resultado
+        self.enviados = []
+
+    def enviar(self, token, titulo, mensaje):
+        self.enviados.append(token)
+        return self.resultado
+
+
+@override_settings(NOTIFICACIONES_OUTBOX_INTENTOS=3, NOTIFICACIONES_OUTBOX_ESPERA_SEGUNDOS=10)
+class OutboxTests(APITestCase):
+    def setUp(self):
+        self.admin = Usuario.objects.create_superuser(username="admin", password="adminpass", codigo_estudiantil="A1")
+        self.user = Usuario.objects.create_user(username="user", password="userpass", codigo_estudiantil="U1")
+        DispositivoPush.objects.create(usuario=self.user, token="token-user", plataforma="android")
+
+    def test_crear_notificacion_encola_sin_enviar(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post(reverse('crear_notificacion'),
+                                    {"usuario": self.user.id, "titulo": "Hola", "mensaje": "Tu turno"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Notificacion.objects.count(), 1)
+        envio = EnvioPush.objects.get()
+        self.assertEqual((envio.usuario, envio.estado, envio.notificacion_id),
+                         (self.user, EnvioPush.PENDIENTE, response.data['id']))
+
+    def test_entrega_y_metricas(self):
+        outbox.encolar("Hola", "Tu turno", usuario=self.user)
+        self.assertEqual(outbox.metricas()['pendientes'], 1)
+        transporte = TransporteFijo(ENVIADO)
+        self.assertEqual(outbox.procesar_lote(transporte=transporte), {'enviados': 1, 'reintentos': 0, 'muertos': 0})
+        self.assertEqual(transporte.enviados, ["token-user"])
+        # Ya enviado: otra pasada no lo reclama
+        self.assertEqual(outbox.procesar_lote(transporte=transporte)['enviados'], 0)
+        metricas = outbox.metricas()
+        self.assertEqual((metricas['pendientes'], metricas['retraso_segundos']), (0, 0))
+        self.assertIsNotNone(metricas['entrega_promedio_segundos'])
+
+    def test_reintentos_con_espera_y_muerto(self):
+        envio = outbox.encolar("Hola", "Tu turno", usuario=self.user)
+        transporte = TransporteFijo(FALLIDO)
+        ahora = timezone.now()
+        self.assertEqual(outbox.procesar_lote(ahora, transporte=transporte)['reintentos'], 1)
+        envio.refresh_from_db()
+        self.assertEqual((envio.estado, envio.intentos), (EnvioPush.PENDIENTE, 1))
+        self.assertGreater(envio.disponible_en, ahora + timedelta(seconds=8))
+        # Antes de la espera no se reintenta
+        self.assertEqual(outbox.procesar_lote(ahora, transporte=transporte)['reintentos'], 0)
+        with self.assertLogs('notificaciones.outbox', 'WARNING'):
+            for _ in range(2):
+                outbox.procesar_lote(timezone.now() + timedelta(hours=1), transporte=transporte)
+        envio.refresh_from_db()
+        self.assertEqual((envio.estado, envio.intentos), (EnvioPush.MUERTO, 3))
+        self.assertEqual(len(transporte.enviados), 3)
+        self.assertEqual(outbox.metricas()['muertos'], 1)
+
+    def test_arriendo_vencido_no_duplica_ni_pisa(self):
+        primero = outbox.encolar("Uno", "Lento", usuario=self.user)
+        segundo = outbox.encolar("Dos", "Retomado", usuario=self.user)
+
+        def despachar_lento(*args, **kwargs):
+            # Mientras se envía el primero vence el arriendo y otro worker retoma los dos
+            EnvioPush.objects.update(reclamado_por='otro-worker')
+            return despachar(*args, **kwargs)
+
+        transporte = TransporteFijo(ENVIADO)
+        with mock.patch.object(outbox, 'despachar', side_effect=despachar_lento), \
+                self.assertLogs('notificaciones.outbox', 'WARNING'):
+            resultado = outbox.procesar_lote(transporte=transporte)
+        # El segundo no se envía: ya no es suyo
+        self.assertEqual(len(transporte.enviados), 1)
+        self.assertEqual(resultado['enviados'], 1)
+        # Y el resultado del primero no pisa el reclamo del otro worker
+        for envio in (primero, segundo):
+            envio.refresh_from_db()
+            self.assertEqual((envio.estado, envio.reclamado_por), (EnvioPush.PENDIENTE, 'otro-worker'))
+
+    def test_metricas_solo_admin(self):
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(reverse('outbox_metricas')).status_code, 403)
+        self.client.force_authenticate(user=self.admin)
+        self.assertEqual(self.client.get(reverse('outbox_metricas')).data['pendientes'], 0)
+
+
+class BandejaTests(APITestCase):
+    def setUp(self):
+        self.user = Usuario.objects.create_user(username="user", password="userpass", codigo_estudiantil="U1")
+        self.otro = Usuario.objects.create_user(username="otro", password="otropass", codigo_estudiantil="U2")
+        self.notis = [Notificacion.objects.create(usuario=self.user, titulo=f"N{i}", mensaje="m") for i in range(5)]
+        Notificacion.objects.create(usuario=self.otro, titulo="Otra", mensaje="m")
+        self.client.force_authenticate(user=self.user)
+
+    def no_leidas(self):
+        return self.client.get(reverse('notificaciones_no_leidas')).data['no_leidas']
+
+    def test_bandeja_paginada_por_cursor(self):
+        response = self.client.get(reverse('notificaciones_usuario'), {'page_size': 3})
+        self.assertEqual([n['titulo'] for n in response.data['results']], ["N4", "N3", "N2"])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([n['titulo'] for n in response.data['results']], ["N1", "N0"])
+        self.assertIsNone(response.data['next'])
+
+    def test_contador_mantenido(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.no_leidas(), 5)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.client.post(reverse('marcar_notificacion_leida', args=[self.notis[0].id]))
+        self.client.post(reverse('marcar_notificacion_leida', args=[self.notis[0].id]))
+        self.assertEqual(self.no_leidas(), 4)
+        self.notis[1].delete()
+        self.assertEqual(self.no_leidas(), 3)
+        # Editar desde el admin recalcula
+        self.notis[0].leida = False
+        self.notis[0].save()
+        self.assertEqual(self.no_leidas(), 4)
+        response = self.client.post(reverse('marcar_notificacion_leida', args=[9999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_marcar_varias_en_un_update(self):
+        url = reverse('marcar_notificaciones_leidas')
+        ids = [self.notis[0].id, self.notis[1].id, Notificacion.objects.get(usuario=self.otro).id]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {'ids': ids}, format='json')
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "notificaciones_notificacion"')]
+        self.assertEqual(len(updates), 1)
+        # La del otro usuario no se toca
+        self.assertEqual((response.data['marcadas'], response.data['no_leidas']), (2, 3))
+        response = self.client.post(url, {'todas': True}, format='json')
+        self.assertEqual((response.data['marcadas'], response.data['no_leidas']), (3, 0))
+        self.assertFalse(Notificacion.objects.get(usuario=self.otro).leida)
+        self.assertEqual(self.client.post(url, {}, format='json').status_code, 400)
+
+    def test_usuario_sin_contador_se_cuenta(self):
+        NoLeidas.objects.filter(usuario=self.user).delete()
+        self.assertEqual(self.no_leidas(), 5)
+        self.assertEqual(NoLeidas.objects.get(usuario=self.user).cantidad, 5)
@@ -2,18 +2,24 @@ from django.urls import path
 from .views import (
     NotificacionesUsuarioView,
     MarcarNotificacionLeidaView,
+    MarcarNotificacionesLeidasView,
+    NoLeidasCountView,
     NotificacionCreateView,
     NotificacionesListAdminView,
-    NotificacionDeleteView
+    NotificacionDeleteView,
+    OutboxMetricasView
 )
 from .views import RegistrarDispositivoPushView
 
 urlpatterns = [
     path('mias/', NotificacionesUsuarioView.as_view(), name='notificaciones_usuario'),
     path('marcar_leida/<int:pk>/', MarcarNotificacionLeidaView.as_view(), name='marcar_notificacion_leida'),
+    path('marcar_leidas/', MarcarNotificacionesLeidasView.as_view(), name='marcar_notificaciones_leidas'),
+    path('no_leidas/count/', NoLeidasCountView.as_view(), name='notificaciones_no_leidas'),
     path('crear/', NotificacionCreateView.as_view(), name='crear_notificacion'),  # solo admin
     path('admin/listar/', NotificacionesListAdminView.as_view(), name='notificaciones_list_admin'),
     path('admin/eliminar/<int:pk>/', NotificacionDeleteView.as_view(), name='notificacion_delete_admin'),
-    path('registrar_dispositivo/', RegistrarDispositivoPushView.as_view(), name='registrar_dispositivo_push')
+    path('registrar_dispositivo/', RegistrarDispositivoPushView.as_view(), name='registrar_dispositivo_push'),
+    path('admin/outbox/', OutboxMetricasView.as_view(), name='outbox_metricas'),
 
 ]
\ No newline at end of file
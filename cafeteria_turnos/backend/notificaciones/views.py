@@ -1,4 +1,5 @@
 from rest_framework import generics, permissions, status
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from .models import Notificacion
 from .serializers import NotificacionSerializer
@@ -8,8 +9,9 @@ from usuarios.models import Usuario
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.db import transaction
 from .models import DispositivoPush
-from .utils import enviar_push
+from . import no_leidas, outbox
 
 class RegistrarDispositivoPushView(APIView):
     permission_classes = [IsAuthenticated]
@@ -24,26 +26,64 @@ class RegistrarDispositivoPushView(APIView):
             defaults={"plataforma": plataforma}
         )
         return Response({"ok": True})
-# Listar notificaciones del usuario autenticado
+class BandejaCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    # El id crece con enviada_en y no se repite; usa el índice de usuario_id
+    ordering = '-id'
+
+# Listar notificaciones del usuario autenticado, paginadas por cursor
 class NotificacionesUsuarioView(generics.ListAPIView):
     serializer_class = NotificacionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = BandejaCursorPagination
 
     def get_queryset(self):
-        return Notificacion.objects.filter(usuario=self.request.user).order_by('-enviada_en')
+        return Notificacion.objects.filter(usuario=self.request.user)
+
+# Cantidad de notificaciones sin leer (contador mantenido, una consulta por clave primaria)
+class NoLeidasCountView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response({'no_leidas': no_leidas.contar(request.user.id)})
 
 # Marcar notificación como leída (propia)
 class MarcarNotificacionLeidaView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, pk):
-        try:
-            noti = Notificacion.objects.get(id=pk, usuario=request.user)
-            noti.leida = True
-            noti.save()
+        if no_leidas.marcar_leidas(request.user.id, ids=[pk]):
+            return Response({'ok': True})
+        if Notificacion.objects.filter(id=pk, usuario=request.user).exists():
+            # Ya estaba leída
             return Response({'ok': True})
-        except Notificacion.DoesNotExist:
-            return Response({'ok': False, 'mensaje': 'Notificación no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'ok': False, 'mensaje': 'Notificación no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+
+# Marcar varias como leídas en un solo UPDATE: {"ids": [...]} o {"todas": true}
+class MarcarNotificacionesLeidasView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    MAX_IDS = 1000
+
+    def post(self, request):
+        if request.data.get('todas') in (True, 'true', '1', 1):
+            ids = None
+        else:
+            datos = request.data
+            ids = datos.getlist('ids') if hasattr(datos, 'getlist') else datos.get('ids')
+            try:
+                ids = [int(i) for i in ids or []]
+            except (TypeError, ValueError):
+                return Response({'ok': False, 'mensaje': 'ids debe ser una lista de enteros'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if not ids:
+                return Response({'ok': False, 'mensaje': 'Envía ids o todas=true'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(ids) > self.MAX_IDS:
+                return Response({'ok': False, 'mensaje': f'Máximo {self.MAX_IDS} ids por petición'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        marcadas = no_leidas.marcar_leidas(request.user.id, ids=ids)
+        return Response({'ok': True, 'marcadas': marcadas, 'no_leidas': no_leidas.contar(request.user.id)})
 
 # Crear notificación para usuario específico (admin)
 class NotificacionCreateView(generics.CreateAPIView):
@@ -51,9 +91,11 @@ class NotificacionCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAdminUser]
 
     def perform_create(self, serializer):
-        serializer.save(enviada_en=timezone.now())
-        noti = serializer.save(enviada_en=timezone.now())
-        enviar_push(noti.usuario, noti.titulo, noti.mensaje)
+        # El push queda en la bandeja de salida, en la misma transacción; lo
+        # envía el comando procesar_notificaciones
+        with transaction.atomic():
+            noti = serializer.save(enviada_en=timezone.now())
+            outbox.encolar(noti.titulo, noti.mensaje, usuario=noti.usuario, notificacion=noti)
 
 # Listar todas las notificaciones (admin)
 class NotificacionesListAdminView(generics.ListAPIView):
@@ -67,4 +109,12 @@ class NotificacionesListAdminView(generics.ListAPIView):
 class NotificacionDeleteView(generics.DestroyAPIView):
     serializer_class = NotificacionSerializer
     permission_classes = [permissions.IsAdminUser]
-    queryset = Notificacion.objects.all()
\ No newline at end of file
+    queryset = Notificacion.objects.all()
+
+# Estado de la bandeja de salida de push (admin): pendientes, vencidos,
+# muertos y retraso del pendiente más viejo
+class OutboxMetricasView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(outbox.metricas())
@@ -1,8 +1,13 @@
 from django.contrib import admin
-from .models import QRActivo
+from .models import QRActivo, QRResumenDiario
 
 @admin.register(QRActivo)
 class QRActivoAdmin(admin.ModelAdmin):
     list_display = ('cafeteria', 'codigo', 'generado_en', 'expiracion')
     search_fields = ('codigo',)
-    list_filter = ('cafeteria',)
\ No newline at end of file
+    list_filter = ('cafeteria',)
+
+@admin.register(QRResumenDiario)
+class QRResumenDiarioAdmin(admin.ModelAdmin):
+    list_display = ('cafeteria', 'fecha', 'generados', 'primero', 'ultimo')
+    list_filter = ('cafeteria',)
@@ -0,0 +1,79 @@
+"""
+QR rotativos firmados (QR_MODO = 'hmac').
+
+En vez de guardar un código aleatorio por cafetería y minuto en QRActivo, el
+código de la ventana de tiempo w (QR_VENTANA_SEGUNDOS) es un HMAC-SHA256 de
+(cafeteria_id, w) con un secreto del servidor, como en TOTP (RFC 6238).
+Generarlo y validarlo es solo CPU: no se escriben ni se leen filas.
+
+Se aceptan los códigos de las QR_TOLERANCIA_VENTANAS ventanas vecinas, para
+cubrir el tiempo entre que se muestra el QR y se escanea y la diferencia de
+reloj entre servidores. Con QR_MODO = 'tabla' (por defecto) todo sigue
+funcionando con QRActivo.
+"""
+import base64
+import hashlib
+import hmac
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+
+_FECHA_HORA = serializers.DateTimeField()
+
+
+def modo_hmac():
+    return getattr(settings, 'QR_MODO', 'tabla') == 'hmac'
+
+
+def _secreto():
+    return (getattr(settings, 'QR_SECRETO', None) or settings.SECRET_KEY).encode()
+
+
+def _paso():
+    return getattr(settings, 'QR_VENTANA_SEGUNDOS', 60)
+
+
+def _instante(ventana):
+    return datetime.fromtimestamp(ventana * _paso(), tz=dt_timezone.utc)
+
+
+def ventana_actual(ahora=None):
+    return int((ahora or timezone.now()).timestamp()) // _paso()
+
+
+def codigo(cafeteria_id, ventana):
+    """Código de la cafetería para una ventana: 22 caracteres, como token_urlsafe(16)."""
+    firma = hmac.new(_secreto(), f'{cafeteria_id}:{ventana}'.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(firma[:16]).rstrip(b'=').decode()
+
+
+def qr_vigente(cafeteria_id, ahora=None):
+    """El QR de la ventana actual, con la misma forma que QRActivoSerializer."""
+    ventana = ventana_actual(ahora)
+    return {
+        'id': None,
+        'cafeteria': cafeteria_id,
+        'codigo': codigo(cafeteria_id, ventana),
+        'generado_en': _FECHA_HORA.to_representation(_instante(ventana)),
+        'expiracion': _FECHA_HORA.to_representation(_instante(ventana + 1)),
+    }
+
+
+def expiracion_valida(codigo_qr, cafeteria_id, ahora=None):
+    """
+    Devuelve hasta cuándo se acepta `codigo_qr` para la cafetería, o None si
+    no es el código de ninguna ventana dentro de la tolerancia.
+    """
+    try:
+        cafeteria_id = int(cafeteria_id)
+    except (TypeError, ValueError):
+        return None
+    tolerancia = getattr(settings, 'QR_TOLERANCIA_VENTANAS', 1)
+    actual = ventana_actual(ahora)
+    recibido = str(codigo_qr).encode()
+    for ventana in range(actual - tolerancia, actual + tolerancia + 1):
+        if hmac.compare_digest(codigo(cafeteria_id, ventana).encode(), recibido):
+            return _instante(ventana + 1 + tolerancia)
+    return None
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from cafeteria.models import Cafeteria
+from qr import firmas
 from qr.models import QRActivo
 
 class Command(BaseCommand):
@@ -7,7 +8,14 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         for cafeteria in Cafeteria.objects.all():
+            if firmas.modo_hmac():
+                # Los QR firmados no se guardan: solo se muestra el vigente
+                qr = firmas.qr_vigente(cafeteria.id)
+                self.stdout.write(self.style.SUCCESS(
+                    f"QR firmado de {cafeteria.nombre}: {qr['codigo']} (Expira: {qr['expiracion']})"
+                ))
+                continue
             qr = QRActivo.crear_o_actualizar_qr(cafeteria)
             self.stdout.write(self.style.SUCCESS(
                 f"QR actualizado para {cafeteria.nombre}: {qr.codigo} (Expira: {qr.expiracion})"
-            ))
\ No newline at end of file
+            ))
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from qr.retencion import corte_retencion, depurar_historial
+
+class Command(BaseCommand):
+    help = 'Borra por lotes los QR anteriores a QR_RETENCION_DIAS (y los resume por día si está activado)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None, help='Días completos que se conservan')
+        parser.add_argument('--sin-compactar', action='store_true', help='No guardar el resumen diario')
+
+    def handle(self, *args, **options):
+        corte = corte_retencion(dias=options['dias'])
+        if corte is None:
+            self.stdout.write('Retención desactivada (QR_RETENCION_DIAS = None)')
+            return
+        compactar = False if options['sin_compactar'] else None
+        resultado = depurar_historial(dias=options['dias'], compactar=compactar,
+                                      pausa_ms=getattr(settings, 'QR_RETENCION_PAUSA_MS', 50))
+        self.stdout.write(self.style.SUCCESS(
+            f"QRs anteriores a {corte:%Y-%m-%d}: "
+            f"{resultado['borrados']} borrados en {resultado['lotes']} lotes"
+        ))
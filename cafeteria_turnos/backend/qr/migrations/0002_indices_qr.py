@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qr', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='qractivo',
+            index=models.Index(fields=['cafeteria', 'expiracion'], name='qr_cafeteria_expiracion'),
+        ),
+        migrations.AddIndex(
+            model_name='qractivo',
+            index=models.Index(fields=['codigo', 'cafeteria'], name='qr_codigo_cafeteria'),
+        ),
+    ]
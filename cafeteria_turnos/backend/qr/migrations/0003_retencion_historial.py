@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cafeteria', '0002_alter_cafeteria_estado'),
+        ('qr', '0002_indices_qr'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QRResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('generados', models.PositiveIntegerField(default=0)),
+                ('primero', models.DateTimeField()),
+                ('ultimo', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='qractivo',
+            index=models.Index(fields=['cafeteria', 'generado_en'], name='qr_cafeteria_generado'),
+        ),
+        migrations.AddField(
+            model_name='qrresumendiario',
+            name='cafeteria',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cafeteria.cafeteria'),
+        ),
+        migrations.AddConstraint(
+            model_name='qrresumendiario',
+            constraint=models.UniqueConstraint(fields=('cafeteria', 'fecha'), name='qr_resumen_cafeteria_fecha'),
+        ),
+    ]
@@ -10,6 +10,16 @@ class QRActivo(models.Model):
     generado_en = models.DateTimeField(auto_now_add=True)
     expiracion = models.DateTimeField()  # Cuándo expira este QR
 
+    class Meta:
+        indexes = [
+            # QR vigente de una cafetería
+            models.Index(fields=['cafeteria', 'expiracion'], name='qr_cafeteria_expiracion'),
+            # Validación de un código escaneado
+            models.Index(fields=['codigo', 'cafeteria'], name='qr_codigo_cafeteria'),
+            # Historial por cafetería y rango de fechas, y depuración de los viejos
+            models.Index(fields=['cafeteria', 'generado_en'], name='qr_cafeteria_generado'),
+        ]
+
     def __str__(self):
         return f"QR {self.cafeteria} ({self.codigo})"
 
@@ -39,4 +49,21 @@ class QRActivo(models.Model):
             generado_en=ahora,
             expiracion=expiracion
         )
-        return qr
\ No newline at end of file
+        return qr
+
+
+class QRResumenDiario(models.Model):
+    """QRs generados por cafetería y día, para los días cuyo detalle ya se depuró (ver retencion.py)."""
+    cafeteria = models.ForeignKey('cafeteria.Cafeteria', on_delete=models.CASCADE)
+    fecha = models.DateField()
+    generados = models.PositiveIntegerField(default=0)
+    primero = models.DateTimeField()
+    ultimo = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cafeteria', 'fecha'], name='qr_resumen_cafeteria_fecha'),
+        ]
+
+    def __str__(self):
+        return f"{self.cafeteria} {self.fecha}: {self.generados} QRs"
@@ -0,0 +1,106 @@
+"""
+Retención del historial de QRActivo.
+
+La rotación deja una fila por cafetería y minuto. Se conservan
+QR_RETENCION_DIAS días completos de filas; las más viejas se borran por lotes
+de QR_RETENCION_LOTE, cada lote en su propia transacción corta para no
+acaparar el único escritor de SQLite. El comando depurar_qr hace además una
+pausa de QR_RETENCION_PAUSA_MS entre lotes; el planificador no duerme: hace
+unos lotes por tick y sigue en el próximo. Con QR_RETENCION_COMPACTAR cada lote, antes de borrarse,
+se suma a QRResumenDiario dentro de la misma transacción, así una depuración
+interrumpida nunca cuenta dos veces.
+
+La ejecuta el planificador una vez al día o el comando depurar_qr.
+"""
+import time
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from cafeteria.models import Cafeteria
+from .models import QRActivo, QRResumenDiario
+
+
+def corte_retencion(ahora=None, dias=None):
+    """Inicio (hora local) del día más viejo que se conserva completo, o None sin retención."""
+    dias = getattr(settings, 'QR_RETENCION_DIAS', 30) if dias is None else dias
+    if dias is None:
+        return None
+    fecha = timezone.localdate(ahora or timezone.now()) - timedelta(days=dias)
+    return timezone.make_aware(datetime.combine(fecha, dt_time.min))
+
+
+def depurar_historial(ahora=None, dias=None, compactar=None, lote=None, pausa_ms=0, max_lotes=None):
+    """
+    Borra (y si aplica compacta) los QRActivo anteriores al corte, con
+    pausa_ms milisegundos entre lotes. Con max_lotes se detiene después de
+    esa cantidad de lotes. Devuelve {'borrados', 'lotes', 'pendiente'}.
+    """
+    corte = corte_retencion(ahora, dias)
+    if corte is None:
+        return {'borrados': 0, 'lotes': 0, 'pendiente': False}
+    compactar = getattr(settings, 'QR_RETENCION_COMPACTAR', True) if compactar is None else compactar
+    lote = lote or getattr(settings, 'QR_RETENCION_LOTE', 1000)
+    pausa = pausa_ms / 1000
+    viejos = QRActivo.objects.filter(generado_en__lt=corte)
+
+    borrados = lotes = 0
+    # Por cafetería, para recorrer el índice (cafeteria, generado_en) por rango
+    for cafeteria_id in Cafeteria.objects.order_by('id').values_list('id', flat=True):
+        while True:
+            if max_lotes is not None and lotes >= max_lotes:
+                return {'borrados': borrados, 'lotes': lotes, 'pendiente': True}
+            if lotes and pausa:
+                time.sleep(pausa)
+            n = _depurar_lote(viejos.filter(cafeteria_id=cafeteria_id), cafeteria_id, lote, compactar)
+            borrados += n
+            lotes += bool(n)
+            if n < lote:
+                break
+    return {'borrados': borrados, 'lotes': lotes, 'pendiente': False}
+
+
+def _depurar_lote(qs, cafeteria_id, lote, compactar):
+    with transaction.atomic():
+        filas = list(qs.order_by('generado_en').values_list('id', 'generado_en')[:lote])
+        if not filas:
+            return 0
+        if compactar:
+            _acumular_resumen(cafeteria_id, [generado_en for _, generado_en in filas])
+        _borrar([id_ for id_, _ in filas])
+        return len(filas)
+
+
+def _borrar(ids, trozo=500):
+    # DELETE directo, sin señales: son QRs vencidos que ninguna vista con
+    # versión muestra, y .delete() cargaría cada fila para subir la versión
+    # una vez por fila. Por trozos, por el límite de parámetros de SQLite.
+    conexion = connections[router.db_for_write(QRActivo)]
+    tabla = conexion.ops.quote_name(QRActivo._meta.db_table)
+    with conexion.cursor() as cursor:
+        for i in range(0, len(ids), trozo):
+            parte = ids[i:i + trozo]
+            cursor.execute(f"DELETE FROM {tabla} WHERE id IN ({', '.join(['%s'] * len(parte))})", parte)
+
+
+def _acumular_resumen(cafeteria_id, instantes):
+    por_dia = defaultdict(list)
+    for instante in instantes:
+        por_dia[timezone.localdate(instante)].append(instante)
+    for fecha, del_dia in por_dia.items():
+        n, primero, ultimo = len(del_dia), min(del_dia), max(del_dia)
+        resumen, creado = QRResumenDiario.objects.get_or_create(
+            cafeteria_id=cafeteria_id, fecha=fecha,
+            defaults={'generados': n, 'primero': primero, 'ultimo': ultimo},
+        )
+        if not creado:
+            QRResumenDiario.objects.filter(pk=resumen.pk).update(
+                generados=F('generados') + n,
+                primero=Least('primero', primero),
+                ultimo=Greatest('ultimo', ultimo),
+            )
@@ -1,10 +1,19 @@
+from collections import Counter
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
-from .models import QRActivo
+from . import firmas
+from .models import QRActivo, QRResumenDiario
+from .retencion import depurar_historial
 from cafeteria.models import Cafeteria
 from usuarios.models import Usuario
 from django.utils import timezone
 from datetime import timedelta
+from unittest import mock
 
 class QRTests(APITestCase):
     def setUp(self):
@@ -23,4 +32,118 @@ class QRTests(APITestCase):
         data = {"codigo": "testQR", "cafeteria_id": self.cafe.id}
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, 200)
-        self.assertTrue(response.data["valido"])
\ No newline at end of file
+        self.assertTrue(response.data["valido"])
+
+    def test_qr_activo_304_hasta_que_vence(self):
+        url = reverse('qr_activo')
+        etag = self.client.get(url, {'cafeteria_id': self.cafe.id})['ETag']
+        response = self.client.get(url, {'cafeteria_id': self.cafe.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Vencido: el mismo ETag ya no vale aunque nadie haya tocado la tabla
+        with mock.patch('django.utils.timezone.now', return_value=self.qr.expiracion + timedelta(seconds=1)):
+            response = self.client.get(url, {'cafeteria_id': self.cafe.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(QR_MODO='hmac', QR_SECRETO='secreto-de-prueba', QR_VENTANA_SEGUNDOS=60, QR_TOLERANCIA_VENTANAS=1)
+class QRFirmadoTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierta", horario_apertura="08:00", horario_cierre="15:00")
+        self.otra = Cafeteria.objects.create(nombre="Norte", estado="abierta", horario_apertura="08:00", horario_cierre="15:00")
+        self.user = Usuario.objects.create_user(username="user", password="userpass", codigo_estudiantil="U1", rol="estudiante")
+        self.client.force_authenticate(user=self.user)
+
+    def test_qr_activo_se_calcula_sin_filas(self):
+        response = self.client.get(reverse('qr_activo'), {'cafeteria_id': self.cafe.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['codigo'], firmas.codigo(self.cafe.id, firmas.ventana_actual()))
+        self.assertFalse(QRActivo.objects.exists())
+        response = self.client.get(reverse('qr_activo'), {'cafeteria_id': 9999})
+        self.assertEqual(response.status_code, 404)
+
+    def test_tolerancia_de_ventanas(self):
+        ahora = timezone.now()
+        ventana = firmas.ventana_actual(ahora)
+        self.assertIsNotNone(firmas.expiracion_valida(firmas.codigo(self.cafe.id, ventana), self.cafe.id, ahora))
+        self.assertIsNotNone(firmas.expiracion_valida(firmas.codigo(self.cafe.id, ventana - 1), self.cafe.id, ahora))
+        self.assertIsNone(firmas.expiracion_valida(firmas.codigo(self.cafe.id, ventana - 2), self.cafe.id, ahora))
+        # El código de una cafetería no sirve en otra
+        self.assertIsNone(firmas.expiracion_valida(firmas.codigo(self.otra.id, ventana), self.cafe.id, ahora))
+        self.assertIsNone(firmas.expiracion_valida('basura', 'x', ahora))
+
+    def test_validar_no_consulta_qractivo(self):
+        codigo = self.client.get(reverse('qr_activo'), {'cafeteria_id': self.cafe.id}).data['codigo']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('validar_qr'), {"codigo": codigo, "cafeteria_id": self.cafe.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['cafeteria'], "Central")
+        self.assertFalse(any('qr_qractivo' in q['sql'] for q in ctx.captured_queries))
+        response = self.client.post(reverse('validar_qr'), {"codigo": codigo, "cafeteria_id": self.otra.id})
+        self.assertEqual(response.status_code, 400)
+
+    def test_crear_turno_con_qr_firmado(self):
+        codigo = firmas.codigo(self.cafe.id, firmas.ventana_actual())
+        with mock.patch('turnos.difusion.coalescedor.agregar'):
+            response = self.client.post(reverse('crear_turno'), {"cafeteria_id": self.cafe.id, "codigo_qr": codigo})
+            self.assertEqual(response.status_code, 200)
+            response = self.client.post(reverse('crear_turno'), {"cafeteria_id": self.otra.id, "codigo_qr": codigo})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['mensaje'], 'QR inválido')
+
+
+class RetencionHistorialTests(APITestCase):
+    def setUp(self):
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierta", horario_apertura="08:00", horario_cierre="15:00")
+        self.admin = Usuario.objects.create_superuser(username="admin", password="adminpass", codigo_estudiantil="A1")
+        self.ahora = timezone.now()
+        # Cinco QRs de hace 40 y 41 días (se guarda el día local de cada uno) y uno vigente
+        self.viejos = []
+        for i, dias in enumerate((40, 40, 40, 41, 41)):
+            qr = QRActivo.objects.create(cafeteria=self.cafe, codigo=f"viejo{i}", expiracion=self.ahora)
+            generado_en = self.ahora - timedelta(days=dias, minutes=i)
+            QRActivo.objects.filter(pk=qr.pk).update(generado_en=generado_en)
+            self.viejos.append(timezone.localdate(generado_en))
+        self.vigente = QRActivo.objects.create(cafeteria=self.cafe, codigo="vigente",
+                                               expiracion=self.ahora + timedelta(minutes=1))
+
+    def test_depura_por_lotes_y_compacta(self):
+        resultado = depurar_historial(self.ahora, dias=30, lote=2, pausa_ms=0)
+        self.assertEqual(resultado, {'borrados': 5, 'lotes': 3, 'pendiente': False})
+        self.assertEqual(list(QRActivo.objects.values_list('codigo', flat=True)), ["vigente"])
+        resumen = dict(QRResumenDiario.objects.values_list('fecha', 'generados'))
+        self.assertEqual(resumen, dict(Counter(self.viejos)))
+        # Otra pasada no encuentra nada ni vuelve a sumar
+        self.assertEqual(depurar_historial(self.ahora, dias=30, lote=2, pausa_ms=0)['borrados'], 0)
+        self.assertEqual(sum(resumen.values()), sum(QRResumenDiario.objects.values_list('generados', flat=True)))
+
+    def test_max_lotes_deja_pendiente(self):
+        resultado = depurar_historial(self.ahora, dias=30, lote=2, pausa_ms=0, max_lotes=1, compactar=False)
+        self.assertEqual(resultado, {'borrados': 2, 'lotes': 1, 'pendiente': True})
+        self.assertFalse(QRResumenDiario.objects.exists())
+
+    def test_sin_pausas_salvo_que_se_pidan(self):
+        with mock.patch('qr.retencion.time.sleep') as dormir:
+            self.assertTrue(depurar_historial(self.ahora, dias=30, lote=1, pausa_ms=20, max_lotes=2)['pendiente'])
+        dormir.assert_called_once_with(0.02)
+        # Como en el planificador: los lotes siguen en el próximo tick, sin dormir
+        with mock.patch('qr.retencion.time.sleep') as dormir:
+            self.assertTrue(depurar_historial(self.ahora, dias=30, lote=1, max_lotes=2)['pendiente'])
+        dormir.assert_not_called()
+
+    def test_historial_paginado_y_filtrado(self):
+        self.client.force_authenticate(user=self.admin)
+        url = reverse('qr_historial')
+        response = self.client.get(url, {'cafeteria_id': self.cafe.id, 'page_size': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([qr['codigo'] for qr in response.data['results']], ["vigente", "viejo0", "viejo1", "viejo2"])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([qr['codigo'] for qr in response.data['results']], ["viejo3", "viejo4"])
+        self.assertIsNone(response.data['next'])
+
+        fecha = self.viejos[4]
+        response = self.client.get(url, {'cafeteria_id': self.cafe.id, 'desde': fecha, 'hasta': fecha})
+        self.assertEqual([qr['codigo'] for qr in response.data['results']],
+                         [f"viejo{i}" for i, dia in enumerate(self.viejos) if dia == fecha])
+        response = self.client.get(url, {'cafeteria_id': self.cafe.id, 'desde': '2025-13-01'})
+        self.assertEqual(response.status_code, 400)
@@ -2,12 +2,16 @@ from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from .models import QRActivo
 from .serializers import QRActivoSerializer
-from cafeteria.models import Cafeteria
+from cafeteria import registro
 from django.utils import timezone
 from rest_framework.views import APIView
-from turnos.models import Turno
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.pagination import CursorPagination
+from datetime import datetime, time, timedelta
+from . import firmas
+from turnos.services import emitir_turno, TurnoRechazado
+from turnos.versiones import VistaCondicionalMixin, clave_qr
 from usuarios.models import Usuario  # O tu modelo de usuario/estudiante
-from cafeteria.models import Cafeteria
 
 class CrearTurnoPublicoView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -20,41 +24,51 @@ class CrearTurnoPublicoView(APIView):
         if codigo_estudiantil:
             try:
                 usuario = Usuario.objects.get(codigo_estudiantil=codigo_estudiantil)
-                cafeteria = Cafeteria.objects.get(id=cafeteria_id) if cafeteria_id else Cafeteria.objects.first()
             except Usuario.DoesNotExist:
                 return Response({'mensaje': 'Código estudiantil no válido.'}, status=400)
-            except Cafeteria.DoesNotExist:
-                return Response({'mensaje': 'Cafetería no válida.'}, status=400)
-            # Crear turno si no tiene uno pendiente
-            if Turno.objects.filter(usuario=usuario, estado="pendiente").exists():
-                return Response({'mensaje': 'Ya tienes un turno pendiente.'}, status=400)
-            turno = Turno.objects.create(usuario=usuario, cafeteria=cafeteria)
+            try:
+                turno = emitir_turno(usuario, cafeteria_id=cafeteria_id or None)
+            except TurnoRechazado as e:
+                return Response({'mensaje': e.mensaje}, status=e.status)
             return Response({
                 'codigo_turno': turno.codigo_turno,
                 'estudiante': usuario.username,
-                'cafeteria': cafeteria.nombre,
+                'cafeteria': turno.cafeteria.nombre,
                 'fecha': turno.generado_en
             })
 
         elif qr_codigo and cafeteria_id:
             ahora = timezone.now()
-            try:
-                qr = QRActivo.objects.get(codigo=qr_codigo, cafeteria_id=cafeteria_id, expiracion__gt=ahora)
-            except QRActivo.DoesNotExist:
+            if firmas.modo_hmac():
+                if firmas.expiracion_valida(qr_codigo, cafeteria_id, ahora) is None:
+                    return Response({'mensaje': 'QR no válido o expirado.'}, status=400)
+            elif not QRActivo.objects.filter(codigo=qr_codigo, cafeteria_id=cafeteria_id, expiracion__gt=ahora).exists():
                 return Response({'mensaje': 'QR no válido o expirado.'}, status=400)
             # Aquí implementa la lógica para obtener el usuario (por ejemplo, por token si es autenticado)
             return Response({'mensaje': 'Funcionalidad para QR debe implementarse según tu lógica.'}, status=400)
         else:
             return Response({'mensaje': 'Debes enviar codigo_estudiantil o qr_codigo y cafeteria_id.'}, status=400)
-# Obtener el QR vigente para una cafetería
-class QRActivoCafeteriaView(APIView):
+# Obtener el QR vigente para una cafetería (304 mientras siga siendo el mismo y no venza)
+class QRActivoCafeteriaView(VistaCondicionalMixin, generics.RetrieveAPIView):
     permission_classes = [permissions.AllowAny]
 
-    def get(self, request):
+    def get_clave_version(self, request):
+        cafeteria_id = request.query_params.get('cafeteria_id', '')
+        return clave_qr(cafeteria_id) if cafeteria_id.isdigit() else None
+
+    def get_vigente_hasta(self, datos):
+        return parse_datetime(datos['expiracion'])
+
+    def retrieve(self, request, *args, **kwargs):
         cafeteria_id = request.query_params.get('cafeteria_id')
         if not cafeteria_id:
             return Response({'error': 'cafeteria_id requerido'}, status=status.HTTP_400_BAD_REQUEST)
         ahora = timezone.now()
+        if firmas.modo_hmac():
+            # Se calcula al vuelo; solo hace falta saber que la cafetería existe
+            if registro.obtener(cafeteria_id) is None:
+                return Response({'error': 'No hay QR activo'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(firmas.qr_vigente(int(cafeteria_id), ahora))
         try:
             qr = QRActivo.objects.filter(cafeteria_id=cafeteria_id, expiracion__gt=ahora).latest('generado_en')
             data = QRActivoSerializer(qr).data
@@ -72,6 +86,14 @@ class ValidarQRView(APIView):
         if not codigo or not cafeteria_id:
             return Response({'error': 'codigo y cafeteria_id son requeridos'}, status=status.HTTP_400_BAD_REQUEST)
         ahora = timezone.now()
+        if firmas.modo_hmac():
+            # Sin consultas: la firma se comprueba en CPU y el nombre sale del registro
+            cafeteria = None
+            if firmas.expiracion_valida(codigo, cafeteria_id, ahora) is not None:
+                cafeteria = registro.obtener(cafeteria_id)
+            if cafeteria is None:
+                return Response({'valido': False, 'mensaje': 'QR no válido'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'valido': True, 'cafeteria': cafeteria.nombre})
         try:
             qr = QRActivo.objects.get(codigo=codigo, cafeteria_id=cafeteria_id)
             if qr.expiracion < ahora:
@@ -80,13 +102,41 @@ class ValidarQRView(APIView):
         except QRActivo.DoesNotExist:
             return Response({'valido': False, 'mensaje': 'QR no válido'}, status=status.HTTP_400_BAD_REQUEST)
 
-# (Opcional) Listar historial de QRs generados por cafetería (solo admin)
+class QRHistorialPagination(CursorPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    # Recorre el índice (cafeteria, generado_en); el id desempata
+    ordering = ('-generado_en', '-id')
+
+# (Opcional) Listar historial de QRs generados por cafetería (solo admin), por
+# páginas con cursor y con filtros ?desde= / ?hasta= (AAAA-MM-DD, inclusive)
 class QRHistorialView(generics.ListAPIView):
     serializer_class = QRActivoSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = QRHistorialPagination
+
+    def list(self, request, *args, **kwargs):
+        try:
+            self.rango = self._leer_rango(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+
+    def _leer_rango(self, params):
+        rango = {}
+        if not params.get('cafeteria_id', '0').isdigit():
+            raise ValueError('cafeteria_id debe ser un id')
+        for parametro, filtro, dias in (('desde', 'generado_en__gte', 0), ('hasta', 'generado_en__lt', 1)):
+            if params.get(parametro):
+                fecha = parse_date(params[parametro]) if len(params[parametro]) == 10 else None
+                if fecha is None:
+                    raise ValueError(f'{parametro} debe tener el formato AAAA-MM-DD')
+                rango[filtro] = timezone.make_aware(datetime.combine(fecha + timedelta(days=dias), time.min))
+        return rango
 
     def get_queryset(self):
         cafeteria_id = self.request.query_params.get('cafeteria_id')
         if cafeteria_id:
-            return QRActivo.objects.filter(cafeteria_id=cafeteria_id).order_by('-generado_en')
-        return QRActivo.objects.none()
\ No newline at end of file
+            return QRActivo.objects.filter(cafeteria_id=cafeteria_id, **self.rango).order_by('-generado_en')
+        return QRActivo.objects.none()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Turno, Penalizacion
+from .models import EstadisticaDiaria, Turno, TurnoArchivado, Penalizacion
 
 @admin.register(Turno)
 class TurnoAdmin(admin.ModelAdmin):
@@ -7,6 +7,17 @@ class TurnoAdmin(admin.ModelAdmin):
     list_filter = ('estado', 'cafeteria', 'fecha')
     search_fields = ('usuario__username',)
 
+@admin.register(TurnoArchivado)
+class TurnoArchivadoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'usuario', 'cafeteria', 'fecha', 'estado', 'archivado_en')
+    list_filter = ('estado', 'cafeteria')
+    search_fields = ('usuario__username',)
+
+@admin.register(EstadisticaDiaria)
+class EstadisticaDiariaAdmin(admin.ModelAdmin):
+    list_display = ('cafeteria', 'fecha', 'hora', 'emitidos', 'reclamados', 'penalizados', 'expirados', 'espera_p50')
+    list_filter = ('cafeteria', 'fecha')
+
 @admin.register(Penalizacion)
 class PenalizacionAdmin(admin.ModelAdmin):
     list_display = ('usuario', 'fecha', 'motivo', 'activa')
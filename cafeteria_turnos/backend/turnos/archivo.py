@@ -0,0 +1,154 @@
+"""
+Rollover diario de turnos y archivo.
+
+Cada día, poco después de medianoche (planificador) o con el comando
+rollover_turnos:
+
+1. Los turnos 'pendiente' de fechas pasadas pasan a 'expirado' con un solo
+   UPDATE. Si no, siguen en la cola en memoria, delante de los de hoy.
+2. Los turnos con fecha anterior a hoy - TURNOS_ARCHIVO_DIAS se mueven a
+   TurnoArchivado por lotes de TURNOS_ARCHIVO_LOTE, cada lote en su propia
+   transacción (copia y borrado juntos), como la retención de QRs. Cada
+   turno archivado queda en CambioTurno como baja, así el admin sincronizado
+   con ?since= lo saca de su lista; sus cambios anteriores se borran.
+3. Las bajas de CambioTurno con más de TURNOS_CAMBIOS_RETENCION_DIAS se
+   borran.
+
+Así Turno guarda solo los últimos días y las consultas calientes (turno
+actual, chequeo de duplicado, listado del admin) recorren una tabla chica.
+Las vistas de historial leen primero Turno y completan con el archivo
+(historial_usuario, modelo_para_fecha, turno_o_archivado).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import estadisticas
+from .cola import motor
+from .models import CambioTurno, Turno, TurnoArchivado
+from .utils import notificar_cambio_turno
+from .versiones import claves_cambio_turno, registrar_cambio
+
+CAMPOS = ('id', 'usuario_id', 'cafeteria_id', 'fecha', 'estado', 'generado_en', 'reclamado_en',
+          'codigo_turno', 'actualizado_en')
+
+
+def corte_archivo(ahora=None, dias=None):
+    """Primera fecha que se queda en Turno, o None si el archivo está desactivado."""
+    dias = getattr(settings, 'TURNOS_ARCHIVO_DIAS', 7) if dias is None else dias
+    if dias is None:
+        return None
+    return timezone.localdate(ahora or timezone.now()) - timedelta(days=dias)
+
+
+def expirar_pendientes(ahora=None):
+    """Marca 'expirado' los pendientes de fechas pasadas. Devuelve cuántos."""
+    ahora = ahora or timezone.now()
+    vencidos = Turno.objects.filter(estado='pendiente', fecha__lt=timezone.localdate(ahora))
+    with transaction.atomic():
+        filas = list(vencidos.values_list('id', 'cafeteria_id', 'codigo_turno', 'fecha', 'generado_en', 'usuario_id'))
+        if not filas:
+            return 0
+        n = Turno.objects.filter(id__in=[fila[0] for fila in filas]).update(estado='expirado', actualizado_en=ahora)
+        CambioTurno.anotar([(fila[0], fila[1], fila[3]) for fila in filas])
+        registrar_cambio(*claves_cambio_turno(*{fila[1] for fila in filas}, usuario_ids={fila[5] for fila in filas}))
+        estadisticas.transiciones_masivas([(fila[1], fila[3], fila[4]) for fila in filas], 'pendiente', 'expirado')
+
+        def confirmar():
+            # El UPDATE no dispara señales: la cola y el WebSocket se avisan a mano
+            motor.quitar_varios([fila[0] for fila in filas])
+            por_cafeteria = {}
+            for turno_id, cafeteria_id, codigo_turno, *_ in filas:
+                por_cafeteria.setdefault(cafeteria_id, []).append(
+                    {'id': turno_id, 'codigo_turno': codigo_turno, 'estado': 'expirado'})
+            for cafeteria_id, transiciones in por_cafeteria.items():
+                notificar_cambio_turno(cafeteria_id, transiciones)
+        transaction.on_commit(confirmar)
+    return n
+
+
+def archivar(ahora=None, dias=None, lote=None, max_lotes=None):
+    """
+    Mueve a TurnoArchivado los turnos anteriores al corte. Con max_lotes se
+    detiene después de esa cantidad de lotes. Devuelve {'archivados', 'lotes', 'pendiente'}.
+    """
+    corte = corte_archivo(ahora, dias)
+    if corte is None:
+        return {'archivados': 0, 'lotes': 0, 'pendiente': False}
+    lote = lote or getattr(settings, 'TURNOS_ARCHIVO_LOTE', 1000)
+    archivados = lotes = 0
+    while True:
+        if max_lotes is not None and lotes >= max_lotes:
+            return {'archivados': archivados, 'lotes': lotes, 'pendiente': True}
+        n = _archivar_lote(corte, lote)
+        archivados += n
+        lotes += bool(n)
+        if n < lote:
+            return {'archivados': archivados, 'lotes': lotes, 'pendiente': False}
+
+
+def _archivar_lote(corte, lote):
+    with transaction.atomic():
+        filas = list(Turno.objects.filter(fecha__lt=corte).order_by('id').values(*CAMPOS)[:lote])
+        if not filas:
+            return 0
+        TurnoArchivado.objects.bulk_create([TurnoArchivado(**fila) for fila in filas], batch_size=500)
+        # Sin señales: ninguno está en la cola, y las versiones y el registro
+        # de cambios se actualizan una vez por lote
+        ids = [fila['id'] for fila in filas]
+        mover = Turno.objects.filter(id__in=ids)
+        mover._raw_delete(router.db_for_write(Turno))
+        CambioTurno.anotar([(fila['id'], fila['cafeteria_id'], fila['fecha']) for fila in filas], eliminado=True)
+        CambioTurno.objects.filter(turno_id__in=ids, eliminado=False).delete()
+        registrar_cambio(*claves_cambio_turno(*{fila['cafeteria_id'] for fila in filas}))
+        return len(filas)
+
+
+def depurar_cambios(ahora=None):
+    """Borra las bajas de CambioTurno más viejas que TURNOS_CAMBIOS_RETENCION_DIAS. Devuelve cuántas."""
+    dias = getattr(settings, 'TURNOS_CAMBIOS_RETENCION_DIAS', 7)
+    limite = (ahora or timezone.now()) - timedelta(days=dias)
+    # La fila más alta se queda aunque sea vieja (ver CambioTurno)
+    ultimo = CambioTurno.objects.aggregate(ultimo=Max('id'))['ultimo']
+    if ultimo is None:
+        return 0
+    return CambioTurno.objects.filter(eliminado=True, creado_en__lt=limite, id__lt=ultimo).delete()[0]
+
+
+def rollover(ahora=None, max_lotes=None):
+    """Expira los pendientes de días pasados, archiva lo viejo y depura el registro de cambios."""
+    resultado = {'expirados': expirar_pendientes(ahora), **archivar(ahora, max_lotes=max_lotes)}
+    if not resultado['pendiente']:
+        depurar_cambios(ahora)
+    return resultado
+
+
+# --- Lectura ------------------------------------------------------------------
+
+def historial_usuario(usuario, columnas):
+    """Filas (values) de todos los turnos del usuario por fecha, de Turno y del archivo en una sola consulta."""
+    recientes = Turno.objects.filter(usuario=usuario).values(*columnas)
+    archivados = TurnoArchivado.objects.filter(usuario=usuario).values(*columnas)
+    return list(recientes.union(archivados, all=True).order_by('fecha', 'id'))
+
+
+def modelo_para_fecha(fecha):
+    """
+    Turno, o TurnoArchivado si la fecha es anterior al corte y Turno ya no
+    tiene turnos de ese día.
+    """
+    corte = corte_archivo()
+    if fecha is None or corte is None or fecha >= corte:
+        return Turno
+    if Turno.objects.filter(fecha=fecha).exists():
+        return Turno
+    return TurnoArchivado
+
+
+def turno_o_archivado(turno_id):
+    """El turno con ese id, buscado en Turno y después en el archivo; None si no existe."""
+    return (Turno.objects.filter(id=turno_id).select_related('usuario', 'cafeteria').first()
+            or TurnoArchivado.objects.filter(id=turno_id).select_related('usuario', 'cafeteria').first())
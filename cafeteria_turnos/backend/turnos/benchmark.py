@@ -0,0 +1,48 @@
+"""
+Utilidades compartidas por los comandos de benchmark (benchmark_*).
+
+Los benchmarks corren sobre una base de datos temporal creada igual que la
+de los tests, así nunca tocan los datos reales.
+"""
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def base_de_datos_temporal():
+    nombre_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+
+def cronometrar(funcion, repeticiones=1):
+    """Ejecuta `funcion` `repeticiones` veces y devuelve los segundos por ejecución."""
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    return (time.perf_counter() - inicio) / repeticiones
+
+
+class ContadorConsultas:
+    """
+    Cuenta las sentencias SQL ejecutadas (sin savepoints). A diferencia de
+    CaptureQueriesContext no guarda el SQL, así que no tiene tope.
+    """
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if 'SAVEPOINT' not in sql:
+            self.total += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def contar(self):
+        with connection.execute_wrapper(self):
+            yield self
+
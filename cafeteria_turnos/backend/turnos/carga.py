@@ -0,0 +1,226 @@
+"""
+Simulador de la hora pico (comando benchmark_carga).
+
+Recorre la aplicación entera (URLs, middleware, autenticación JWT y vistas)
+con el cliente de pruebas de DRF, sobre la base de datos temporal de los
+benchmarks. En cada ronda:
+
+- llega una oleada de estudiantes: los que usan la app entran con el login
+  (CustomTokenObtainPairView) y el resto va al kiosco público;
+- la pantalla de cada cafetería sondea su QR y el turno actual;
+- los que no tienen turno lo piden escaneando el QR de la pantalla, y los
+  que esperan sondean lo mismo que EstudiantePage (SONDEOS_ESTUDIANTE);
+- los admins pasan o entregan, alternando, el turno actual de cada cafetería.
+
+Las peticiones van una tras otra en un solo proceso: se mide lo que cuesta
+cada endpoint y cuántas peticiones por segundo sostiene un worker. La
+difusión por WebSocket no entra en la medición.
+
+resultado() es lo que se guarda como línea base en JSON; comparar() lista
+las regresiones de p95/p99 por endpoint y del rendimiento total.
+"""
+import random
+import time
+from collections import defaultdict
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from cafeteria.models import Cafeteria
+from qr.models import QRActivo
+from usuarios.models import Usuario
+from .cola import motor
+from .difusion import coalescedor
+from .estadisticas import percentiles
+
+CUANTILES = (50, 95, 99)
+# Con menos muestras el p99 es prácticamente el máximo y no se compara
+MIN_MUESTRAS_P99 = 100
+PASSWORD = 'hora-pico'
+# Lo que sondea EstudiantePage mientras el turno está pendiente: (nombre, vista)
+SONDEOS_ESTUDIANTE = (('dashboard', 'dashboard_estudiante'), ('turno actual', 'turno_actual'))
+
+
+class _Estudiante:
+    def __init__(self, usuario, cafeteria_id):
+        self.usuario = usuario
+        self.cafeteria_id = cafeteria_id
+        self.cliente = None
+        self.con_turno = False
+        self.atendido = False
+
+
+class SimuladorHoraPico:
+    def __init__(self, estudiantes=100, admins=2, cafeterias=2, llegadas=20, atencion=5, kiosco=0.3, semilla=0):
+        self.parametros = {
+            'estudiantes': estudiantes, 'admins': admins, 'cafeterias': cafeterias,
+            'llegadas': llegadas, 'atencion': atencion, 'kiosco': kiosco, 'semilla': semilla,
+        }
+        self.rng = random.Random(semilla)
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.segundos = 0.0
+        self.atendidos = 0
+
+    def preparar(self):
+        # Un solo hash para todos; el login igual lo verifica completo cada vez
+        clave = make_password(PASSWORD)
+        p = self.parametros
+        self.cafeterias = [
+            Cafeteria.objects.create(nombre=f"Cafetería {i}", estado="abierto",
+                                     horario_apertura="00:00", horario_cierre="23:59")
+            for i in range(p['cafeterias'])
+        ]
+        for cafeteria in self.cafeterias:
+            QRActivo.crear_o_actualizar_qr(cafeteria, duracion_minutos=60)
+        self.estudiantes = Usuario.objects.bulk_create([
+            Usuario(username=f"hp{i}", codigo_estudiantil=f"HP{i}", rol="estudiante", password=clave)
+            for i in range(p['estudiantes'])
+        ])
+        self.admins = Usuario.objects.bulk_create([
+            Usuario(username=f"hp-admin{i}", codigo_estudiantil=f"HPA{i}", rol="admin",
+                    is_staff=True, is_superuser=True, password=clave)
+            for i in range(p['admins'])
+        ])
+        motor.invalidar()
+
+    def _pedir(self, nombre, cliente, metodo, url, datos=None):
+        inicio = time.perf_counter()
+        if metodo == 'get':
+            respuesta = cliente.get(url, datos)
+        else:
+            respuesta = cliente.post(url, datos, format='json')
+        self.latencias[nombre].append(time.perf_counter() - inicio)
+        if respuesta.status_code >= 400:
+            self.errores[nombre] += 1
+        return respuesta
+
+    def _entrar(self, usuario):
+        cliente = APIClient()
+        respuesta = self._pedir('login', cliente, 'post', reverse('token_obtain_pair'),
+                                {'username': usuario.username, 'password': PASSWORD})
+        cliente.credentials(HTTP_AUTHORIZATION=f"Bearer {respuesta.data['access']}")
+        return cliente
+
+    def _pantallas(self, pantalla):
+        qrs = {}
+        for cafeteria in self.cafeterias:
+            qr = self._pedir('qr activo', pantalla, 'get', reverse('qr_activo'), {'cafeteria_id': cafeteria.id})
+            qrs[cafeteria.id] = qr.data.get('codigo')
+            self._pedir('turno actual', pantalla, 'get', reverse('turno_actual'), {'cafeteria_id': cafeteria.id})
+        return qrs
+
+    def _atender(self, admin, cafeteria, n, ronda):
+        for i in range(n):
+            actual = self._pedir('turno actual (admin)', admin, 'get', reverse('turno_actual'),
+                                 {'cafeteria_id': cafeteria.id}).data
+            if not actual:
+                return
+            if (ronda + i) % 2:
+                respuesta = self._pedir('entregar turno', admin, 'post',
+                                        reverse('entregar_turno_admin', args=[actual['id']]))
+            else:
+                respuesta = self._pedir('pasar turno', admin, 'post', reverse('pasar_turno', args=[actual['id']]))
+            if respuesta.status_code != 200:
+                return
+            self.atendidos += 1
+
+    def _pendientes(self):
+        return any(motor.siguientes(cafeteria.id, 1)[1] for cafeteria in self.cafeterias)
+
+    def ejecutar(self, max_rondas=1000):
+        p = self.parametros
+        # El cliente de pruebas se presenta como testserver
+        with mock.patch.object(coalescedor, 'agregar'), override_settings(ALLOWED_HOSTS=['testserver']):
+            inicio = time.perf_counter()
+            admins = [self._entrar(admin) for admin in self.admins]
+            pantalla = APIClient()
+            por_llegar, esperando = list(self.estudiantes), []
+            ronda = 0
+            while (por_llegar or esperando or self._pendientes()) and ronda < max_rondas:
+                ronda += 1
+                for usuario in por_llegar[:p['llegadas']]:
+                    estudiante = _Estudiante(usuario, self.rng.choice(self.cafeterias).id)
+                    if self.rng.random() < p['kiosco']:
+                        # En el kiosco no hay sesión que sondear: espera en la fila
+                        self._pedir('crear turno (kiosco)', APIClient(), 'post', reverse('crear_turno_publico'), {
+                            'codigo_estudiantil': usuario.codigo_estudiantil, 'cafeteria_id': estudiante.cafeteria_id})
+                        continue
+                    estudiante.cliente = self._entrar(usuario)
+                    esperando.append(estudiante)
+                del por_llegar[:p['llegadas']]
+
+                qrs = self._pantallas(pantalla)
+                for estudiante in esperando:
+                    if not estudiante.con_turno:
+                        respuesta = self._pedir('crear turno (QR)', estudiante.cliente, 'post', reverse('crear_turno'), {
+                            'cafeteria_id': estudiante.cafeteria_id, 'codigo_qr': qrs[estudiante.cafeteria_id]})
+                        estudiante.con_turno = respuesta.status_code == 200
+                        # Si se lo rechazan, se va
+                        estudiante.atendido = not estudiante.con_turno
+                        continue
+                    for nombre, vista in SONDEOS_ESTUDIANTE:
+                        datos = {'cafeteria_id': estudiante.cafeteria_id} if vista == 'turno_actual' else {}
+                        respuesta = self._pedir(nombre, estudiante.cliente, 'get', reverse(vista), datos)
+                        if vista == 'dashboard_estudiante':
+                            turno = respuesta.data.get('turno_hoy')
+                            estudiante.atendido = turno is not None and turno['estado'] != 'pendiente'
+                esperando = [e for e in esperando if not e.atendido]
+
+                for i, cafeteria in enumerate(self.cafeterias):
+                    self._atender(admins[i % len(admins)], cafeteria, p['atencion'], ronda)
+            self.segundos = time.perf_counter() - inicio
+        self.rondas = ronda
+        return self.resultado()
+
+    def resultado(self):
+        milisegundos = {nombre: [s * 1000 for s in valores] for nombre, valores in self.latencias.items()}
+        cuantiles = percentiles(milisegundos, CUANTILES)
+        peticiones = sum(len(valores) for valores in milisegundos.values())
+        return {
+            'parametros': self.parametros,
+            'rondas': self.rondas,
+            'segundos': round(self.segundos, 3),
+            'peticiones': peticiones,
+            'peticiones_por_segundo': round(peticiones / self.segundos, 1) if self.segundos else None,
+            'atendidos_por_minuto': round(self.atendidos * 60 / self.segundos, 1) if self.segundos else None,
+            'endpoints': {
+                nombre: {
+                    'n': len(milisegundos[nombre]),
+                    'errores': self.errores[nombre],
+                    **{f'p{q}_ms': round(valor, 2) for q, valor in zip(CUANTILES, cuantiles[nombre])},
+                }
+                for nombre in sorted(milisegundos)
+            },
+        }
+
+
+def comparar(actual, base, umbral=0.2, holgura_ms=1.0):
+    """
+    Regresiones de `actual` frente a la línea base: p95 o p99 de un endpoint
+    más de `umbral` (fracción) por encima de la base y por más de `holgura_ms`
+    (para no saltar por ruido en endpoints de décimas de milisegundo), más
+    errores que en la base, o peticiones por segundo `umbral` por debajo. El
+    p99 solo cuenta con MIN_MUESTRAS_P99 muestras en las dos corridas.
+    """
+    regresiones = []
+    for nombre, medidas_base in base['endpoints'].items():
+        medidas = actual['endpoints'].get(nombre)
+        if medidas is None:
+            continue
+        campos = ['p95_ms']
+        if min(medidas['n'], medidas_base['n']) >= MIN_MUESTRAS_P99:
+            campos.append('p99_ms')
+        for campo in campos:
+            antes, ahora = medidas_base[campo], medidas[campo]
+            if ahora > antes * (1 + umbral) and ahora - antes > holgura_ms:
+                regresiones.append(f"{nombre}: {campo} {antes:.2f} -> {ahora:.2f} ms")
+        if medidas['errores'] > medidas_base['errores']:
+            regresiones.append(f"{nombre}: errores {medidas_base['errores']} -> {medidas['errores']}")
+    antes, ahora = base['peticiones_por_segundo'], actual['peticiones_por_segundo']
+    if antes and ahora < antes * (1 - umbral):
+        regresiones.append(f"peticiones por segundo {antes:.1f} -> {ahora:.1f}")
+    return regresiones
@@ -0,0 +1,129 @@
+"""
+Asignadores de código de turno.
+
+Cada asignador entrega un código nuevo a partir de un contador atómico
+(ContadorTurno), de modo que emitir un código nunca requiere consultar si ya
+existe ni reintentar. El asignador activo se elige con el setting
+TURNOS_ASIGNADOR_CODIGO: 'secuencial', 'pool' o la ruta a una clase propia
+con un método asignar(cafeteria_id, fecha).
+"""
+import hashlib
+import string
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from .models import ContadorTurno
+
+ALFABETO = string.digits + string.ascii_uppercase
+
+
+def siguiente_valor(clave):
+    """
+    Incrementa el contador `clave` y devuelve su nuevo valor. El UPDATE toma
+    el bloqueo de la fila, así que dos emisiones concurrentes nunca obtienen
+    el mismo número. Si la base lo admite (SQLite 3.35+, PostgreSQL) es una
+    sola sentencia, UPDATE ... RETURNING; si no, o la primera vez de cada
+    clave, UPDATE y SELECT.
+    """
+    conexion = connections[router.db_for_write(ContadorTurno)]
+    contador = ContadorTurno.objects.filter(clave=clave)
+    with transaction.atomic():
+        if conexion.features.can_return_columns_from_insert:
+            tabla = conexion.ops.quote_name(ContadorTurno._meta.db_table)
+            with conexion.cursor() as cursor:
+                cursor.execute(f'UPDATE {tabla} SET valor = valor + 1 WHERE clave = %s RETURNING valor', [clave])
+                fila = cursor.fetchone()
+            if fila is not None:
+                return fila[0]
+        elif contador.update(valor=F('valor') + 1):
+            return contador.values_list('valor', flat=True).get()
+        try:
+            with transaction.atomic():
+                ContadorTurno.objects.create(clave=clave, valor=1)
+            return 1
+        except IntegrityError:
+            # Otra transacción creó la fila primero
+            contador.update(valor=F('valor') + 1)
+            return contador.values_list('valor', flat=True).get()
+
+
+class AsignadorSecuencial:
+    """
+    Números legibles por cafetería y día: A-001, A-002... La letra identifica
+    la cafetería y el contador se reinicia cada día.
+    """
+    def prefijo(self, cafeteria_id):
+        return string.ascii_uppercase[(cafeteria_id - 1) % 26]
+
+    def asignar(self, cafeteria_id, fecha):
+        numero = siguiente_valor(f"seq:{cafeteria_id}:{fecha.isoformat()}")
+        return f"{self.prefijo(cafeteria_id)}-{numero:03d}"
+
+
+class AsignadorPool:
+    """
+    Códigos alfanuméricos de 6 caracteres tomados de un pool barajado de todo
+    el espacio de códigos (36^6). El barajado es una permutación Feistel con
+    clave derivada de SECRET_KEY aplicada a un contador global, así que el
+    pool no se guarda en la base de datos y ningún código se repite hasta
+    agotar el espacio.
+    """
+    LONGITUD = 6
+    RONDAS = 4
+
+    def __init__(self):
+        self.tamano = len(ALFABETO) ** self.LONGITUD
+        self.clave = hashlib.sha256(f"turnos-pool:{settings.SECRET_KEY}".encode()).digest()
+
+    def _ronda(self, mitad, ronda):
+        h = hashlib.blake2b(mitad.to_bytes(2, 'big') + bytes([ronda]), digest_size=2, key=self.clave)
+        return int.from_bytes(h.digest(), 'big')
+
+    def _feistel(self, valor):
+        izq, der = valor >> 16, valor & 0xFFFF
+        for ronda in range(self.RONDAS):
+            izq, der = der, izq ^ self._ronda(der, ronda)
+        return (izq << 16) | der
+
+    def permutar(self, indice):
+        # Cycle walking: la permutación es sobre 32 bits, se reaplica hasta
+        # caer dentro del espacio de códigos.
+        valor = self._feistel(indice)
+        while valor >= self.tamano:
+            valor = self._feistel(valor)
+        return valor
+
+    def codificar(self, valor):
+        caracteres = []
+        for _ in range(self.LONGITUD):
+            valor, resto = divmod(valor, len(ALFABETO))
+            caracteres.append(ALFABETO[resto])
+        return ''.join(reversed(caracteres))
+
+    def asignar(self, cafeteria_id, fecha):
+        indice = (siguiente_valor('pool') - 1) % self.tamano
+        return self.codificar(self.permutar(indice))
+
+
+ASIGNADORES = {
+    'secuencial': AsignadorSecuencial,
+    'pool': AsignadorPool,
+}
+
+_asignador = None
+
+
+def obtener_asignador():
+    global _asignador
+    if _asignador is None:
+        nombre = getattr(settings, 'TURNOS_ASIGNADOR_CODIGO', 'secuencial')
+        clase = ASIGNADORES.get(nombre) or import_string(nombre)
+        _asignador = clase()
+    return _asignador
+
+
+def asignar_codigo(cafeteria_id, fecha):
+    return obtener_asignador().asignar(cafeteria_id, fecha)
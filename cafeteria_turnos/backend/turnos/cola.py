@@ -0,0 +1,234 @@
+"""
+Motor en memoria de la cola de turnos pendientes.
+
+Mantiene, por cafetería, los turnos pendientes ordenados por (fecha, id), que
+es el mismo orden en que se llaman. Se reconstruye desde la base de datos en
+el primer uso y luego se actualiza con las señales de Turno (ver signals.py),
+así que "turno actual", "posición en la cola" y "siguientes N" se responden
+sin consultar la base de datos.
+
+Como cada proceso tiene su propia copia, cada TURNOS_COLA_RESINCRONIZAR_SEGUNDOS
+el motor mira si otro worker escribió (0 desactiva la revisión). Basta leer
+los ids de CambioTurno posteriores a la última marca, un rango de la clave
+primaria: si todos los anotó este mismo proceso (ver CambioTurno.anotar) la
+copia ya está al día y no se recarga. La carga lee la base de datos
+sin el lock; los cambios que llegan por las señales mientras tanto se
+anotan en un diario y se vuelven a aplicar sobre la copia nueva al
+reemplazar la anterior, así no se pierden.
+"""
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Max
+
+
+def clave_turno(fecha, turno_id):
+    return (fecha.toordinal(), turno_id)
+
+
+class ColaCafeteria:
+    """Turnos pendientes de una cafetería, ordenados por (fecha, id)."""
+
+    def __init__(self):
+        self._claves = []
+        self._datos = {}
+
+    def __len__(self):
+        return len(self._claves)
+
+    def agregar(self, clave, datos):
+        turno_id = clave[1]
+        if turno_id in self._datos:
+            self._datos[turno_id] = datos
+            return
+        # bisect encuentra el lugar en O(log n), pero insertar y borrar corren
+        # el resto de la lista (O(n)); con las colas de un día es un memmove
+        # corto, y los turnos nuevos casi siempre van al final
+        bisect.insort(self._claves, clave)
+        self._datos[turno_id] = datos
+
+    def quitar(self, clave):
+        if self._datos.pop(clave[1], None) is None:
+            return
+        i = bisect.bisect_left(self._claves, clave)
+        del self._claves[i]
+
+    def actual(self):
+        if not self._claves:
+            return None
+        return self._datos[self._claves[0][1]]
+
+    def posicion(self, clave):
+        """Posición (1 = le toca ahora) del turno en la cola."""
+        return bisect.bisect_left(self._claves, clave) + 1
+
+    def siguientes(self, n):
+        return [self._datos[turno_id] for _, turno_id in self._claves[:n]]
+
+
+class MotorCola:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._colas = {}
+        self._indice = {}  # turno_id -> (cafeteria_id, usuario_id, clave)
+        self._cargado_en = None
+        self._diarios = []  # uno por reconstrucción en curso: cambios a repetir
+        self._marca = 0  # último id de CambioTurno que la copia ya refleja
+        self._propios = set()  # ids de CambioTurno escritos por este proceso
+
+    def invalidar(self):
+        with self._lock:
+            self._cargado_en = None
+
+    def reconstruir(self):
+        from .models import CambioTurno
+
+        diario = []
+        with self._lock:
+            self._diarios.append(diario)
+        try:
+            # La marca antes que los turnos: lo que se escriba entre medio se
+            # vuelve a ver en la próxima revisión
+            marca = CambioTurno.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+            colas, indice = self._leer()
+        except BaseException:
+            with self._lock:
+                self._diarios.remove(diario)
+            raise
+        with self._lock:
+            self._diarios.remove(diario)
+            self._colas, self._indice = colas, indice
+            # Si un propio se pierde aquí solo cuesta una recarga de más
+            self._marca, self._propios = marca, set()
+            # Lo que llegó durante la lectura puede no estar en la copia nueva
+            for cambio in diario:
+                if cambio[0] == 'registrar':
+                    self._registrar(*cambio[1:])
+                else:
+                    self._quitar(cambio[1])
+            self._cargado_en = time.monotonic()
+
+    def _leer(self):
+        from .models import Turno
+        from .serializers import TurnoSerializer
+
+        turnos = (Turno.objects.filter(estado='pendiente')
+                  .select_related('usuario', 'cafeteria').order_by('fecha', 'id'))
+        colas, indice = {}, {}
+        for turno in turnos:
+            clave = clave_turno(turno.fecha, turno.id)
+            cola = colas.setdefault(turno.cafeteria_id, ColaCafeteria())
+            cola._claves.append(clave)
+            cola._datos[turno.id] = TurnoSerializer(turno).data
+            indice[turno.id] = (turno.cafeteria_id, turno.usuario_id, clave)
+        return colas, indice
+
+    def _anotar(self, *cambio):
+        for diario in self._diarios:
+            diario.append(cambio)
+
+    def _avanzar_marca(self, marca):
+        self._marca = marca
+        self._propios = {cambio_id for cambio_id in self._propios if cambio_id > marca}
+
+    def anotar_propios(self, cambio_ids):
+        """Cambios que este proceso ya aplicó por las señales: no obligan a recargar."""
+        with self._lock:
+            self._propios.update(cambio_id for cambio_id in cambio_ids if cambio_id is not None)
+
+    def _hay_cambios_ajenos(self):
+        from .models import CambioTurno
+
+        marca = self._marca
+        nuevos = list(CambioTurno.objects.filter(id__gt=marca).values_list('id', flat=True))
+        with self._lock:
+            if any(cambio_id not in self._propios for cambio_id in nuevos):
+                return True
+            self._avanzar_marca(max(nuevos, default=marca))
+            self._cargado_en = time.monotonic()
+        return False
+
+    def _asegurar_cargado(self):
+        resincronizar = getattr(settings, 'TURNOS_COLA_RESINCRONIZAR_SEGUNDOS', 10)
+        cargado_en = self._cargado_en
+        if cargado_en is None:
+            self.reconstruir()
+        elif resincronizar and time.monotonic() - cargado_en > resincronizar and self._hay_cambios_ajenos():
+            self.reconstruir()
+
+    def registrar(self, turno, datos):
+        """Aplica el estado actual de un turno: entra a la cola si está pendiente, si no sale."""
+        # Los valores, no la instancia: el diario se repite más tarde
+        cambio = (turno.id, turno.estado, turno.fecha, turno.cafeteria_id, turno.usuario_id, datos)
+        with self._lock:
+            self._anotar('registrar', *cambio)
+            if self._cargado_en is None:
+                return  # Se verá en la próxima reconstrucción
+            self._registrar(*cambio)
+
+    def _registrar(self, turno_id, estado, fecha, cafeteria_id, usuario_id, datos):
+        if estado != 'pendiente':
+            self._quitar(turno_id)
+            return
+        clave = clave_turno(fecha, turno_id)
+        anterior = self._indice.get(turno_id)
+        if anterior and anterior[0] != cafeteria_id:
+            self._quitar(turno_id)
+        self._colas.setdefault(cafeteria_id, ColaCafeteria()).agregar(clave, datos)
+        self._indice[turno_id] = (cafeteria_id, usuario_id, clave)
+
+    def quitar(self, turno_id):
+        with self._lock:
+            self._anotar('quitar', turno_id)
+            self._quitar(turno_id)
+
+    def quitar_varios(self, turno_ids):
+        with self._lock:
+            for turno_id in turno_ids:
+                self._anotar('quitar', turno_id)
+                self._quitar(turno_id)
+
+    def _quitar(self, turno_id):
+        entrada = self._indice.pop(turno_id, None)
+        if entrada:
+            self._colas[entrada[0]].quitar(entrada[2])
+
+    def actual(self, cafeteria_id=None):
+        self._asegurar_cargado()
+        with self._lock:
+            if cafeteria_id is not None:
+                cola = self._colas.get(cafeteria_id)
+                return cola.actual() if cola else None
+            # Sin cafetería: el primero de todas las colas, como la consulta original
+            primeros = [(cola._claves[0], cola) for cola in self._colas.values() if cola]
+            if not primeros:
+                return None
+            return min(primeros, key=lambda p: p[0])[1].actual()
+
+    def posicion(self, turno_id):
+        """Devuelve (cafeteria_id, usuario_id, posicion, total) o None si el turno no está en la cola."""
+        self._asegurar_cargado()
+        with self._lock:
+            entrada = self._indice.get(turno_id)
+            if entrada is None:
+                return None
+            cafeteria_id, usuario_id, clave = entrada
+            cola = self._colas[cafeteria_id]
+            return cafeteria_id, usuario_id, cola.posicion(clave), len(cola)
+
+    def siguientes(self, cafeteria_id, n):
+        self._asegurar_cargado()
+        with self._lock:
+            cola = self._colas.get(cafeteria_id)
+            return (cola.siguientes(n), len(cola)) if cola else ([], 0)
+
+    def longitud(self, cafeteria_id):
+        self._asegurar_cargado()
+        with self._lock:
+            cola = self._colas.get(cafeteria_id)
+            return len(cola) if cola else 0
+
+
+motor = MotorCola()
@@ -1,19 +1,47 @@
 import json
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from cafeteria_turnos import metricas
+from .difusion import GRUPO_GENERAL, estado_cafeteria, grupo_cafeteria
+from .cola import motor
+
 class TurnoActualConsumer(AsyncWebsocketConsumer):
+    """
+    Empuja los cambios de turno. Con ?cafeteria_id=<id> solo recibe los de esa
+    cafetería; al conectar envía el estado actual para no tener que consultar
+    la API.
+    """
     async def connect(self):
-        await self.channel_layer.group_add('turno_actual', self.channel_name)
+        parametros = parse_qs(self.scope.get('query_string', b'').decode())
+        cafeteria_id = parametros.get('cafeteria_id', [''])[0]
+        self.cafeteria_id = int(cafeteria_id) if cafeteria_id.isdigit() else None
+        self.grupo = grupo_cafeteria(self.cafeteria_id) if self.cafeteria_id else GRUPO_GENERAL
+        await self.channel_layer.group_add(self.grupo, self.channel_name)
         await self.accept()
+        self.contado = metricas.activas()
+        if self.contado:
+            metricas.registro.ajustar('cafeteria_websockets_abiertos', 1, consumidor='turno_actual')
+            metricas.registro.contar('cafeteria_websockets_conexiones_total', consumidor='turno_actual')
+        await self.send(text_data=json.dumps(await self._estado_inicial(), default=str))
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard('turno_actual', self.channel_name)
+        if getattr(self, 'contado', False):
+            metricas.registro.ajustar('cafeteria_websockets_abiertos', -1, consumidor='turno_actual')
+        await self.channel_layer.group_discard(self.grupo, self.channel_name)
 
     async def receive(self, text_data):
         pass
 
+    @database_sync_to_async
+    def _estado_inicial(self):
+        if self.cafeteria_id:
+            estado = estado_cafeteria(self.cafeteria_id)
+        else:
+            estado = {'cafeteria_id': None, 'turno_actual': motor.actual(), 'en_cola': None}
+        return {'type': 'estado_inicial', **estado}
+
     async def turno_cambiado(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'turno_cambiado',
-            'message': '¡El turno ha cambiado!'
-        }))
\ No newline at end of file
+        await self.send(text_data=json.dumps(event, default=str))
@@ -0,0 +1,80 @@
+"""
+Estado completo del panel del estudiante en una sola respuesta: penalización
+activa, turno de hoy con su posición en la cola, historial reciente y estado
+de las cafeterías.
+
+La respuesta lleva un token de versión que resume todo lo anterior. El
+cliente lo devuelve en ?version= y, si nada cambió, recibe una respuesta
+mínima ({'sin_cambios': True}); el mismo token va como ETag para los GET
+condicionales (304). No hay espera en el servidor: los cambios se avisan por
+WebSocket y el cliente vuelve a preguntar.
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from cafeteria import registro
+from .cola import motor
+from .models import Penalizacion, Turno, TurnoArchivado
+from .serializers import TurnoListSerializer, TurnoSerializer
+from .services import DURACION_PENALIZACION
+
+HISTORIAL = 10
+
+
+def _penalizacion_activa(usuario, ahora):
+    penalizacion = (Penalizacion.objects
+                    .filter(usuario=usuario, activa=True, creada_en__gte=ahora - DURACION_PENALIZACION)
+                    .order_by('-creada_en').first())
+    if penalizacion is None:
+        return None
+    return {
+        'id': penalizacion.id,
+        'motivo': penalizacion.motivo,
+        'creada_en': penalizacion.creada_en,
+        'hasta': penalizacion.creada_en + DURACION_PENALIZACION,
+    }
+
+
+def _posicion(turno):
+    resultado = motor.posicion(turno['id'])
+    if resultado is None:
+        return None
+    _, _, posicion, total = resultado
+    return {'posicion': posicion, 'delante': posicion - 1, 'total': total}
+
+
+def armar_dashboard(usuario, ahora=None):
+    """
+    Devuelve (datos, version). Hace dos consultas (tres si el historial
+    reciente no llega a HISTORIAL y se completa con el archivo); la posición
+    sale del motor de la cola y las cafeterías del registro en memoria.
+    """
+    ahora = ahora or timezone.now()
+    hoy = timezone.localdate(ahora)
+    filas = list(Turno.objects.filter(usuario=usuario).order_by('-fecha', '-id')
+                 .values(*TurnoListSerializer.columnas)[:HISTORIAL])
+    if len(filas) < HISTORIAL:
+        # El resto del historial puede estar archivado
+        filas += TurnoArchivado.objects.filter(usuario=usuario).order_by('-fecha', '-id').values(
+            *TurnoListSerializer.columnas)[:HISTORIAL - len(filas)]
+    turnos = TurnoSerializer(filas, many=True).data
+    de_hoy = [t for t in turnos if t['fecha'] == hoy.isoformat()]
+    # Si hay uno pendiente es el que importa; si no, el último de hoy
+    turno_hoy = next((t for t in de_hoy if t['estado'] == 'pendiente'), de_hoy[0] if de_hoy else None)
+    datos = {
+        'penalizacion': _penalizacion_activa(usuario, ahora),
+        'turno_hoy': turno_hoy,
+        'posicion': _posicion(turno_hoy) if turno_hoy and turno_hoy['estado'] == 'pendiente' else None,
+        'historial': turnos,
+        'cafeterias': registro.lista(),
+    }
+    contenido = json.dumps(datos, cls=DjangoJSONEncoder, sort_keys=True)
+    version = hashlib.sha1(contenido.encode()).hexdigest()[:16]
+    if datos['penalizacion']:
+        # El tiempo restante cambia cada segundo: va fuera de la versión
+        restante = (datos['penalizacion']['hasta'] - ahora).total_seconds()
+        datos['penalizacion']['restante_segundos'] = max(0, int(restante))
+    return datos, version
@@ -0,0 +1,106 @@
+"""
+Difusión en tiempo real de los cambios de turno por el channel layer.
+
+Los cambios se acumulan durante una ventana corta
+(TURNOS_DIFUSION_VENTANA_MS) y se envían como un solo mensaje por cafetería
+con el delta: turno actual, largo de la cola y las transiciones de estado de
+la ventana. Así 20 cambios seguidos en 100 ms llegan a los clientes como un
+único mensaje.
+
+Cada mensaje va al grupo general 'turno_actual' y al grupo de su cafetería
+(ver grupo_cafeteria), que es al que se suscriben las pantallas de una sola
+cafetería.
+"""
+import itertools
+import logging
+import threading
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connections
+
+from .cola import motor
+
+logger = logging.getLogger(__name__)
+
+GRUPO_GENERAL = 'turno_actual'
+
+
+def grupo_cafeteria(cafeteria_id):
+    return f'turno_actual_{cafeteria_id}'
+
+
+def estado_cafeteria(cafeteria_id):
+    """Foto de la cola de una cafetería, la misma que lleva cada delta."""
+    return {
+        'cafeteria_id': cafeteria_id,
+        'turno_actual': motor.actual(cafeteria_id),
+        'en_cola': motor.longitud(cafeteria_id),
+    }
+
+
+def enviar_por_channel_layer(mensaje):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    enviar = async_to_sync(channel_layer.group_send)
+    enviar(GRUPO_GENERAL, mensaje)
+    enviar(grupo_cafeteria(mensaje['cafeteria_id']), mensaje)
+
+
+class Coalescedor:
+    """
+    Junta las transiciones que llegan dentro de una ventana y las envía como
+    un delta por cafetería. Si un turno cambia varias veces en la ventana
+    solo viaja su último estado.
+    """
+
+    def __init__(self, ventana=None, enviar=enviar_por_channel_layer):
+        self.ventana = ventana
+        self.enviar = enviar
+        self._lock = threading.Lock()
+        self._pendientes = {}  # cafeteria_id -> {turno_id: transición}
+        self._timer = None
+        self._secuencia = itertools.count(1)
+
+    def _ventana_segundos(self):
+        if self.ventana is not None:
+            return self.ventana
+        return getattr(settings, 'TURNOS_DIFUSION_VENTANA_MS', 100) / 1000
+
+    def agregar(self, cafeteria_id, transiciones):
+        with self._lock:
+            pendientes = self._pendientes.setdefault(cafeteria_id, {})
+            for transicion in transiciones:
+                pendientes[transicion['id']] = transicion
+            if self._timer is None:
+                self._timer = threading.Timer(self._ventana_segundos(), self.vaciar)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def vaciar(self):
+        """Envía lo acumulado. Lo llama el timer al cerrar la ventana."""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        try:
+            for cafeteria_id, transiciones in pendientes.items():
+                try:
+                    self.enviar({
+                        'type': 'turno_cambiado',
+                        'secuencia': next(self._secuencia),
+                        **estado_cafeteria(cafeteria_id),
+                        'transiciones': list(transiciones.values()),
+                    })
+                except Exception:
+                    logger.exception("No se pudo difundir el cambio de turno")
+        finally:
+            # El timer corre en su propio hilo: no dejar conexiones abiertas
+            if isinstance(threading.current_thread(), threading.Timer):
+                connections.close_all()
+
+
+coalescedor = Coalescedor()
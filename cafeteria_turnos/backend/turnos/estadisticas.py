@@ -0,0 +1,288 @@
+"""
+Estadísticas de servicio materializadas (EstadisticaDiaria), por cafetería,
+día y hora de emisión.
+
+Cada turno aporta a la fila de su hora: emitidos, su estado final
+(reclamados, penalizados o expirados) y su espera si fue reclamado. Cuando
+un turno cambia se suma la diferencia entre lo que aportaba y lo que aporta
+ahora con un UPDATE de F() (señales de Turno), y nada si no cambió lo que
+aporta. Si no se sabe qué aportaba (instancia armada a mano o con campos
+diferidos) la señal solo marca el día (EstadisticaPendiente) y el
+planificador lo rehace con reconstruir_pendientes. Los caminos masivos
+(penalización, rollover) llaman a transiciones_masivas, con un UPDATE por
+hora afectada. Las sumas se aplican al confirmar la transacción del cambio
+(on_commit), en una transacción corta propia: la fila de la hora es la
+misma para todas las emisiones y no debe alargar la transacción que emite.
+Si la base está ocupada la suma queda en memoria y va con la próxima; lo
+que se pierda si el proceso termina antes se corrige con
+recalcular_estadisticas. El archivo no toca las estadísticas: archivar no cambia los
+turnos.
+
+Los percentiles de espera no se pueden sumar. La fila queda con
+percentiles_al_dia=False y el planificador los rehace por lotes cada
+TURNOS_ESTADISTICAS_SEGUNDOS con recalcular_percentiles; la vista sirve los
+valores materializados, que pueden tener hasta un ciclo de atraso. Una
+consulta trae las esperas de esos días y se calculan con NumPy, todas las
+horas a la vez, o en Python puro si NumPy no está instalado (es opcional). reconstruir() rehace un rango desde Turno y TurnoArchivado
+(comando recalcular_estadisticas).
+"""
+import logging
+import threading
+from collections import defaultdict
+from itertools import chain
+
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EstadisticaDiaria, EstadisticaPendiente, Turno, TurnoArchivado
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 95)
+CATEGORIAS = {'usado': 'reclamados', 'entregado': 'reclamados', 'penalizado': 'penalizados', 'expirado': 'expirados'}
+CONTADORES = ('emitidos', 'reclamados', 'penalizados', 'expirados', 'esperas', 'espera_total')
+# Filas por lote al recalcular percentiles
+LOTE_PERCENTILES = 500
+# Días marcados que se rehacen por pasada del planificador
+LOTE_DIAS_PENDIENTES = 20
+
+
+def _aporte(campos):
+    """(clave, contadores) con los que un turno cuenta en su hora; campos como Turno.CAMPOS_ESTADISTICA."""
+    cafeteria_id, fecha, generado_en, estado, reclamado_en = campos
+    contadores = {'emitidos': 1}
+    categoria = CATEGORIAS.get(estado)
+    if categoria:
+        contadores[categoria] = 1
+    if categoria == 'reclamados' and reclamado_en is not None:
+        contadores['esperas'] = 1
+        contadores['espera_total'] = (reclamado_en - generado_en).total_seconds()
+    return (cafeteria_id, fecha, timezone.localtime(generado_en).hour), contadores
+
+
+def _acumular(deltas, campos, signo=1):
+    clave, contadores = _aporte(campos)
+    for campo, n in contadores.items():
+        deltas[clave][campo] += signo * n
+
+
+def turno_cambiado(original, actual):
+    """Aplica la diferencia entre lo que el turno aportaba (None si es nuevo) y lo que aporta (None si se borró)."""
+    deltas = defaultdict(lambda: defaultdict(float))
+    if original is not None:
+        _acumular(deltas, original, -1)
+    if actual is not None:
+        _acumular(deltas, actual)
+    _aplicar(deltas)
+
+
+def transiciones_masivas(turnos, anterior, nuevo):
+    """Turnos sin reclamar, (cafeteria_id, fecha, generado_en), que pasaron de un estado a otro con un UPDATE."""
+    deltas = defaultdict(lambda: defaultdict(float))
+    for cafeteria_id, fecha, generado_en in turnos:
+        _acumular(deltas, (cafeteria_id, fecha, generado_en, anterior, None), -1)
+        _acumular(deltas, (cafeteria_id, fecha, generado_en, nuevo, None))
+    _aplicar(deltas)
+
+
+def _aplicar(deltas):
+    filas = []
+    for clave, contadores in deltas.items():
+        contadores = {campo: n if campo == 'espera_total' else int(n) for campo, n in contadores.items() if n}
+        if contadores:
+            filas.append((clave, contadores))
+    if filas:
+        transaction.on_commit(lambda: _sumar_filas(filas), robust=True)
+
+
+_sin_sumar = []  # sumas de cambios ya confirmados que no entraron (base ocupada)
+_lock_sin_sumar = threading.Lock()
+
+
+def _sumar_filas(filas):
+    with _lock_sin_sumar:
+        filas = _sin_sumar + filas
+        _sin_sumar.clear()
+    try:
+        with transaction.atomic():
+            for clave, contadores in filas:
+                sumar(*clave, **contadores)
+    except OperationalError as e:
+        with _lock_sin_sumar:
+            _sin_sumar.extend(filas)
+        logger.warning('Estadísticas sin sumar (%s filas), van con la próxima: %s', len(filas), e)
+
+
+def sumar(cafeteria_id, fecha, hora, **contadores):
+    esperas_cambiaron = 'esperas' in contadores or 'espera_total' in contadores
+    cambios = {campo: F(campo) + n for campo, n in contadores.items()}
+    cambios['actualizado_en'] = timezone.now()
+    if esperas_cambiaron:
+        cambios['percentiles_al_dia'] = False
+    fila = EstadisticaDiaria.objects.filter(cafeteria_id=cafeteria_id, fecha=fecha, hora=hora)
+    if fila.update(**cambios):
+        return
+    try:
+        with transaction.atomic():
+            EstadisticaDiaria.objects.create(cafeteria_id=cafeteria_id, fecha=fecha, hora=hora,
+                                             percentiles_al_dia=not esperas_cambiaron, **contadores)
+    except IntegrityError:
+        # Otro turno de la misma hora creó la fila entre el UPDATE y el INSERT
+        fila.update(**cambios)
+
+
+# --- Percentiles ----------------------------------------------------------------
+
+def percentiles(grupos, cuantiles=PERCENTILES):
+    """
+    {clave: [valores]} -> {clave: (p50, p90, p95)} (o los cuantiles pedidos),
+    con la interpolación lineal de numpy.percentile. Con NumPy ordena todas
+    las muestras de una vez y lee los percentiles de todos los grupos con
+    índices vectorizados.
+    """
+    grupos = {clave: valores for clave, valores in grupos.items() if valores}
+    if not grupos:
+        return {}
+    try:
+        import numpy as np
+    except ImportError:
+        return {clave: _percentiles_python(sorted(valores), cuantiles) for clave, valores in grupos.items()}
+    claves = list(grupos)
+    cuentas = np.fromiter((len(grupos[clave]) for clave in claves), dtype=np.int64, count=len(claves))
+    valores = np.fromiter(chain.from_iterable(grupos[clave] for clave in claves), dtype=float,
+                          count=int(cuentas.sum()))
+    grupo_de = np.repeat(np.arange(len(claves)), cuentas)
+    # Ordena por valor dentro de cada grupo; los grupos quedan en su lugar
+    valores = valores[np.lexsort((valores, grupo_de))]
+    inicios = np.cumsum(cuentas) - cuentas
+    posiciones = inicios[:, None] + (cuentas[:, None] - 1) * (np.array(cuantiles) / 100)
+    bajo = np.floor(posiciones).astype(np.int64)
+    alto = np.minimum(bajo + 1, (inicios + cuentas - 1)[:, None])
+    resultado = valores[bajo] + (valores[alto] - valores[bajo]) * (posiciones - bajo)
+    return {clave: tuple(fila) for clave, fila in zip(claves, resultado.tolist())}
+
+
+def _percentiles_python(valores, cuantiles):
+    n = len(valores)
+    resultado = []
+    for p in cuantiles:
+        posicion = (n - 1) * p / 100
+        bajo = int(posicion)
+        alto = min(bajo + 1, n - 1)
+        resultado.append(valores[bajo] + (valores[alto] - valores[bajo]) * (posicion - bajo))
+    return tuple(resultado)
+
+
+def _esperas_de(dias):
+    """{(cafeteria_id, fecha, hora): [esperas]} de los turnos reclamados de esos (cafeteria_id, fecha)."""
+    grupos = defaultdict(list)
+    if not dias:
+        return grupos
+    filtro = {
+        'cafeteria_id__in': {cafeteria_id for cafeteria_id, _ in dias},
+        'fecha__in': {fecha for _, fecha in dias},
+        'estado__in': [estado for estado, categoria in CATEGORIAS.items() if categoria == 'reclamados'],
+        'reclamado_en__isnull': False,
+    }
+    for modelo in (Turno, TurnoArchivado):
+        for campos in modelo.objects.filter(**filtro).values_list(*Turno.CAMPOS_ESTADISTICA).iterator():
+            if (campos[0], campos[1]) in dias:
+                clave, contadores = _aporte(campos)
+                grupos[clave].append(contadores['espera_total'])
+    return grupos
+
+
+def recalcular_percentiles(limite=LOTE_PERCENTILES, **filtros):
+    """Recalcula los percentiles de hasta `limite` filas desactualizadas. Devuelve cuántas quedaron al día."""
+    pendientes = list(EstadisticaDiaria.objects.filter(percentiles_al_dia=False, **filtros).order_by('fecha')
+                      .values('id', 'cafeteria_id', 'fecha', 'hora', 'esperas', 'espera_total')[:limite])
+    if not pendientes:
+        return 0
+    calculados = percentiles(_esperas_de({(fila['cafeteria_id'], fila['fecha']) for fila in pendientes}))
+    actualizadas = 0
+    for fila in pendientes:
+        p50, p90, p95 = calculados.get((fila['cafeteria_id'], fila['fecha'], fila['hora']), (None, None, None))
+        # Si entró otra espera mientras se calculaba, la fila sigue pendiente
+        actualizadas += EstadisticaDiaria.objects.filter(
+            id=fila['id'], esperas=fila['esperas'], espera_total=fila['espera_total'],
+        ).update(espera_p50=p50, espera_p90=p90, espera_p95=p95, percentiles_al_dia=True)
+    return actualizadas
+
+
+# --- Reconstrucción ---------------------------------------------------------------
+
+def reconstruir(desde, hasta, cafeteria_id=None):
+    """Rehace las filas de un rango de fechas desde Turno y TurnoArchivado. Devuelve cuántas filas quedaron."""
+    filtro = {'fecha__gte': desde, 'fecha__lte': hasta}
+    if cafeteria_id is not None:
+        filtro['cafeteria_id'] = cafeteria_id
+    contadores = defaultdict(lambda: defaultdict(float))
+    esperas = defaultdict(list)
+    with transaction.atomic():
+        for modelo in (Turno, TurnoArchivado):
+            for campos in modelo.objects.filter(**filtro).values_list(*Turno.CAMPOS_ESTADISTICA).iterator():
+                clave, aporte = _aporte(campos)
+                for campo, n in aporte.items():
+                    contadores[clave][campo] += n
+                if 'esperas' in aporte:
+                    esperas[clave].append(aporte['espera_total'])
+        calculados = percentiles(esperas)
+        ahora = timezone.now()
+        filas = []
+        for clave, valores in contadores.items():
+            p50, p90, p95 = calculados.get(clave, (None, None, None))
+            filas.append(EstadisticaDiaria(
+                cafeteria_id=clave[0], fecha=clave[1], hora=clave[2], actualizado_en=ahora,
+                espera_p50=p50, espera_p90=p90, espera_p95=p95, percentiles_al_dia=True,
+                **{campo: n if campo == 'espera_total' else int(n) for campo, n in valores.items()},
+            ))
+        EstadisticaDiaria.objects.filter(**filtro).delete()
+        EstadisticaDiaria.objects.bulk_create(filas, batch_size=500)
+    return len(filas)
+
+
+def recalcular_dia(cafeteria_id, fecha):
+    return reconstruir(fecha, fecha, cafeteria_id)
+
+
+def marcar_dia(cafeteria_id, fecha):
+    """Deja el día para que el planificador lo rehaga; marcarlo dos veces no hace nada."""
+    EstadisticaPendiente.objects.bulk_create(
+        [EstadisticaPendiente(cafeteria_id=cafeteria_id, fecha=fecha)], ignore_conflicts=True)
+
+
+def reconstruir_pendientes(limite=LOTE_DIAS_PENDIENTES):
+    """Rehace hasta `limite` días marcados con marcar_dia. Devuelve cuántos rehizo."""
+    pendientes = list(EstadisticaPendiente.objects.order_by('marcado_en')
+                      .values_list('id', 'cafeteria_id', 'fecha')[:limite])
+    for id_, cafeteria_id, fecha in pendientes:
+        with transaction.atomic():
+            # La marca se borra antes de leer los turnos: si uno cambia mientras
+            # tanto vuelve a marcar el día y se rehace en la próxima pasada
+            EstadisticaPendiente.objects.filter(id=id_).delete()
+            recalcular_dia(cafeteria_id, fecha)
+    return len(pendientes)
+
+
+# --- Lectura -----------------------------------------------------------------------
+
+def consultar(desde, hasta, cafeteria_id=None):
+    """
+    (horas, dias): las filas por hora del rango (values), con los percentiles
+    materializados (percentiles_al_dia=False si el planificador todavía no los
+    recalculó), y los totales de cada cafetería por día sumados de esas filas.
+    """
+    filtro = {'fecha__gte': desde, 'fecha__lte': hasta}
+    if cafeteria_id is not None:
+        filtro['cafeteria_id'] = cafeteria_id
+    horas = list(EstadisticaDiaria.objects.filter(**filtro).order_by('fecha', 'cafeteria_id', 'hora').values(
+        'cafeteria_id', 'fecha', 'hora', *CONTADORES, 'espera_p50', 'espera_p90', 'espera_p95',
+        'percentiles_al_dia'))
+    dias = {}
+    for fila in horas:
+        total = dias.setdefault((fila['fecha'], fila['cafeteria_id']), {
+            'cafeteria_id': fila['cafeteria_id'], 'fecha': fila['fecha'], **dict.fromkeys(CONTADORES, 0)})
+        for campo in CONTADORES:
+            total[campo] += fila[campo]
+    return horas, list(dias.values())
@@ -0,0 +1,116 @@
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from cafeteria_turnos.capa_canales import SQLiteChannelLayer
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+async def medir_throughput(emisor, receptor, mensajes, suscriptores):
+    canales = [await receptor.new_channel() for _ in range(suscriptores)]
+    for canal in canales:
+        await emisor.group_add('bench', canal)
+
+    async def consumir(canal):
+        for _ in range(mensajes):
+            await receptor.receive(canal)
+
+    consumidores = [asyncio.ensure_future(consumir(canal)) for canal in canales]
+    inicio = time.perf_counter()
+    for i in range(mensajes):
+        await emisor.group_send('bench', {'type': 'turno_cambiado', 'secuencia': i})
+    await asyncio.gather(*consumidores)
+    segundos = time.perf_counter() - inicio
+    for canal in canales:
+        await emisor.group_discard('bench', canal)
+    return mensajes * suscriptores / segundos
+
+
+async def medir_latencia(emisor, receptor, mensajes):
+    canal = await receptor.new_channel()
+    latencias = []
+    for i in range(mensajes):
+        enviado = time.perf_counter()
+        await emisor.send(canal, {'type': 'ping', 'i': i})
+        await receptor.receive(canal)
+        latencias.append((time.perf_counter() - enviado) * 1000)
+    return latencias
+
+
+def eco(ruta, canal_ping, listo):
+    """Proceso aparte que contesta cada ping por el canal de respuesta."""
+    async def principal():
+        capa = SQLiteChannelLayer(ruta=ruta)
+        canal = await capa.new_channel()
+        canal_ping.put(canal)
+        listo.wait()
+        while True:
+            mensaje = await capa.receive(canal)
+            if mensaje['type'] == 'fin':
+                return
+            await capa.send(mensaje['responder_a'], {'type': 'pong', 'enviado': mensaje['enviado']})
+    asyncio.run(principal())
+
+
+async def medir_latencia_entre_procesos(capa, canal_eco, mensajes):
+    canal = await capa.new_channel()
+    latencias = []
+    for _ in range(mensajes):
+        enviado = time.perf_counter()
+        await capa.send(canal_eco, {'type': 'ping', 'responder_a': canal, 'enviado': enviado})
+        await capa.receive(canal)
+        # Ida y vuelta: la mitad aproxima la entrega en un sentido
+        latencias.append((time.perf_counter() - enviado) * 1000 / 2)
+    await capa.send(canal_eco, {'type': 'fin'})
+    return latencias
+
+
+class Command(BaseCommand):
+    help = 'Compara throughput y latencia del channel layer SQLite con el InMemoryChannelLayer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mensajes', type=int, default=1_000)
+        parser.add_argument('--suscriptores', type=int, default=20)
+
+    def handle(self, *args, **options):
+        mensajes, suscriptores = options['mensajes'], options['suscriptores']
+        ruta = os.path.join(tempfile.mkdtemp(), 'canales.sqlite3')
+        self.stdout.write(f"{mensajes:,} group_send a {suscriptores} suscriptores; {mensajes:,} pings de latencia")
+
+        memoria = InMemoryChannelLayer(capacity=mensajes * 2)
+        self._reportar('InMemory (1 proceso)', memoria, memoria, mensajes, suscriptores)
+        sqlite_a, sqlite_b = SQLiteChannelLayer(ruta=ruta), SQLiteChannelLayer(ruta=ruta)
+        self._reportar('SQLite (2 instancias)', sqlite_a, sqlite_b, mensajes, suscriptores)
+
+        contexto = multiprocessing.get_context('spawn')
+        canal_ping, listo = contexto.Queue(), contexto.Event()
+        proceso = contexto.Process(target=eco, args=(ruta, canal_ping, listo), daemon=True)
+        proceso.start()
+        canal_eco = canal_ping.get(timeout=30)
+        listo.set()
+        latencias = asyncio.run(medir_latencia_entre_procesos(SQLiteChannelLayer(ruta=ruta), canal_eco, mensajes))
+        proceso.join(timeout=30)
+        self.stdout.write(f"  {'SQLite (2 procesos)':<24}{'-':>14}  {self._latencias(latencias)}")
+        self.stdout.write(self.style.SUCCESS('Benchmark de channel layers terminado'))
+
+    def _reportar(self, nombre, emisor, receptor, mensajes, suscriptores):
+        async def medir():
+            throughput = await medir_throughput(emisor, receptor, mensajes, suscriptores)
+            latencias = await medir_latencia(emisor, receptor, mensajes)
+            return throughput, latencias
+        throughput, latencias = asyncio.run(medir())
+        self.stdout.write(f"  {nombre:<24}{throughput:>10,.0f} msg/s  {self._latencias(latencias)}")
+
+    def _latencias(self, latencias):
+        return (f"latencia p50 {statistics.median(latencias):.2f} ms, "
+                f"p99 {percentil(latencias, 99):.2f} ms")
@@ -0,0 +1,64 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from turnos.benchmark import base_de_datos_temporal
+from turnos.carga import SimuladorHoraPico, comparar
+
+
+class Command(BaseCommand):
+    help = ('Simula la hora pico (login, sondeo, emisión por QR y kiosco, atención de los admins) y reporta '
+            'p50/p95/p99 por endpoint; guarda o compara una línea base en JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--estudiantes', type=int, default=100)
+        parser.add_argument('--admins', type=int, default=2)
+        parser.add_argument('--cafeterias', type=int, default=2)
+        parser.add_argument('--llegadas', type=int, default=20, help='Estudiantes que llegan por ronda')
+        parser.add_argument('--atencion', type=int, default=5, help='Turnos que atiende cada cafetería por ronda')
+        parser.add_argument('--kiosco', type=float, default=0.3, help='Fracción que pide el turno en el kiosco')
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument('--guardar', metavar='RUTA', help='Guarda el resultado como línea base')
+        parser.add_argument('--comparar', metavar='RUTA', help='Falla si hay regresiones frente a esta línea base')
+        parser.add_argument('--umbral', type=float, default=0.2, help='Regresión tolerada (0.2 = 20 %%)')
+        parser.add_argument('--holgura-ms', type=float, default=1.0,
+                            help='Diferencia mínima de p95/p99 para contar como regresión')
+
+    def handle(self, *args, **options):
+        simulador = SimuladorHoraPico(**{campo: options[campo] for campo in (
+            'estudiantes', 'admins', 'cafeterias', 'llegadas', 'atencion', 'kiosco', 'semilla')})
+        with base_de_datos_temporal():
+            simulador.preparar()
+            resultado = simulador.ejecutar()
+        self._reportar(resultado)
+
+        if options['guardar']:
+            with open(options['guardar'], 'w') as archivo:
+                json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Línea base guardada en {options['guardar']}")
+        if options['comparar']:
+            with open(options['comparar']) as archivo:
+                base = json.load(archivo)
+            if base['parametros'] != resultado['parametros']:
+                self.stdout.write(self.style.WARNING(
+                    f"La línea base se tomó con otros parámetros: {base['parametros']}"))
+            regresiones = comparar(resultado, base, options['umbral'], options['holgura_ms'])
+            for regresion in regresiones:
+                self.stdout.write(self.style.ERROR(f"  {regresion}"))
+            if regresiones:
+                raise CommandError(f"{len(regresiones)} regresiones frente a {options['comparar']}")
+            self.stdout.write(self.style.SUCCESS('Sin regresiones frente a la línea base'))
+
+    def _reportar(self, resultado):
+        self.stdout.write(
+            f"{resultado['parametros']['estudiantes']} estudiantes en {resultado['rondas']} rondas: "
+            f"{resultado['peticiones']} peticiones en {resultado['segundos']:.1f} s, "
+            f"{resultado['peticiones_por_segundo']} peticiones/s, "
+            f"{resultado['atendidos_por_minuto']} turnos atendidos/min"
+        )
+        self.stdout.write(f"  {'endpoint':<24}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errores':>9}")
+        for nombre, medidas in resultado['endpoints'].items():
+            self.stdout.write(
+                f"  {nombre:<24}{medidas['n']:>6}{medidas['p50_ms']:>10.2f}{medidas['p95_ms']:>10.2f}"
+                f"{medidas['p99_ms']:>10.2f}{medidas['errores']:>9}"
+            )
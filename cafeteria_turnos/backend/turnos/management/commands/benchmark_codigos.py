@@ -0,0 +1,75 @@
+import random
+import string
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from cafeteria.models import Cafeteria
+from turnos.benchmark import ContadorConsultas, base_de_datos_temporal, cronometrar
+from turnos.codigos import AsignadorSecuencial, AsignadorPool
+from turnos.models import Turno
+from usuarios.models import Usuario
+
+
+def codigo_aleatorio_legado(cafeteria_id, fecha):
+    # Lo que hacían antes generar_codigo_turno/generar_codigo_unico
+    while True:
+        codigo = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+        if not Turno.objects.filter(cafeteria_id=cafeteria_id, fecha=fecha, codigo_turno=codigo).exists():
+            return codigo
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo de asignar códigos de turno a medida que crece el histórico'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--historicos', type=int, default=1_000_000)
+        parser.add_argument('--muestras', type=int, default=500)
+        parser.add_argument('--lote', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        with base_de_datos_temporal():
+            self._ejecutar(options['historicos'], options['muestras'], options['lote'])
+
+    def _ejecutar(self, historicos, muestras, lote):
+        cafeteria = Cafeteria.objects.create(nombre="Bench", estado="abierto", horario_apertura="07:00", horario_cierre="15:00")
+        usuario = Usuario.objects.create(username="bench", codigo_estudiantil="BENCH")
+        hoy = timezone.localdate()
+        asignadores = {
+            'aleatorio + exists (legado)': codigo_aleatorio_legado,
+            'secuencial': AsignadorSecuencial().asignar,
+            'pool': AsignadorPool().asignar,
+        }
+        puntos = sorted({0, *[p for p in (10_000, 100_000, 1_000_000) if p < historicos], historicos})
+        codigos_usados = set()
+        insertados = 0
+
+        self.stdout.write(f"{'históricos':>12}  {'asignador':<28}{'µs/código':>12}{'consultas':>11}")
+        for punto in puntos:
+            while insertados < punto:
+                n = min(lote, punto - insertados)
+                filas = []
+                for i in range(insertados, insertados + n):
+                    codigo = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+                    while codigo in codigos_usados:
+                        codigo = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+                    codigos_usados.add(codigo)
+                    # Unos 1000 turnos por día hacia atrás
+                    filas.append(Turno(usuario=usuario, cafeteria=cafeteria, fecha=hoy - timedelta(days=1 + i // 1000),
+                                       estado='usado', codigo_turno=codigo))
+                Turno.objects.bulk_create(filas, batch_size=2000)
+                insertados += n
+
+            for nombre, asignar in asignadores.items():
+                def emitir():
+                    with transaction.atomic():
+                        asignar(cafeteria.id, hoy)
+                with ContadorConsultas().contar() as contador:
+                    segundos = cronometrar(emitir, muestras)
+                consultas = contador.total
+                self.stdout.write(
+                    f"{punto:>12,}  {nombre:<28}{segundos * 1e6:>12.1f}{consultas / muestras:>11.1f}"
+                )
+        self.stdout.write(self.style.SUCCESS('Benchmark de códigos terminado'))
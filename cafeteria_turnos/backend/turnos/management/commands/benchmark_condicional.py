@@ -0,0 +1,89 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from cafeteria.models import Cafeteria
+from qr.models import QRActivo
+from turnos.benchmark import ContadorConsultas, base_de_datos_temporal
+from turnos.cola import motor
+from turnos.difusion import coalescedor
+from turnos.models import Turno
+from usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = 'Mide el sondeo de las vistas de lectura con y sin GET condicional (ETag)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rondas', type=int, default=100)
+        parser.add_argument('--turnos', type=int, default=500)
+        parser.add_argument('--cambio-cada', type=int, default=10,
+                            help='Rondas de sondeo entre un cambio de turno y el siguiente')
+
+    def handle(self, *args, **options):
+        # La difusión por WebSocket no es parte de la medición
+        with base_de_datos_temporal(), mock.patch.object(coalescedor, 'agregar'):
+            self._ejecutar(options['rondas'], options['turnos'], options['cambio_cada'])
+
+    def _preparar(self, n_turnos):
+        cafeterias = [Cafeteria.objects.create(nombre=f"Cafe {i}", estado="abierto",
+                                               horario_apertura="07:00", horario_cierre="15:00") for i in range(3)]
+        usuarios = Usuario.objects.bulk_create([
+            Usuario(username=f"bench{i}", codigo_estudiantil=f"B{i}") for i in range(n_turnos // 10)
+        ])
+        hoy = timezone.localdate()
+        Turno.objects.bulk_create([
+            Turno(usuario=usuarios[i % len(usuarios)], cafeteria=cafeterias[i % 3],
+                  fecha=hoy - timedelta(days=i // len(usuarios)), codigo_turno=f"B{i}")
+            for i in range(n_turnos)
+        ], batch_size=2000)
+        for cafeteria in cafeterias:
+            QRActivo.objects.create(cafeteria=cafeteria, codigo=f"qr{cafeteria.id}",
+                                    expiracion=timezone.now() + timedelta(hours=1))
+        admin = Usuario.objects.create_superuser(username="admin", password="x", codigo_estudiantil="ADM")
+        return cafeterias[0], usuarios[0], admin
+
+    def _ejecutar(self, rondas, n_turnos, cambio_cada):
+        cafeteria, estudiante, admin = self._preparar(n_turnos)
+        motor.invalidar()
+        sondeos = [
+            ('cafeterías', None, reverse('cafeteria_list'), {}),
+            ('turno actual', None, reverse('turno_actual'), {'cafeteria_id': cafeteria.id}),
+            ('QR activo', None, reverse('qr_activo'), {'cafeteria_id': cafeteria.id}),
+            ('mis turnos', estudiante, reverse('turnos_usuario'), {}),
+            ('turnos (admin)', admin, reverse('turnos_list_admin'), {}),
+        ]
+        self.stdout.write(f"{rondas} rondas de sondeo sobre {n_turnos:,} turnos, un cambio cada {cambio_cada} rondas")
+        for condicional in (False, True):
+            self.stdout.write(f"  {'con' if condicional else 'sin'} If-None-Match:")
+            for nombre, usuario, url, parametros in sondeos:
+                cliente = APIClient(HTTP_HOST='localhost')
+                if usuario:
+                    cliente.force_authenticate(user=usuario)
+                etag, no_modificados = None, 0
+                contador = ContadorConsultas()
+                segundos = 0.0
+                for ronda in range(rondas):
+                    if ronda and ronda % cambio_cada == 0:
+                        # Un cambio de turno cualquiera, como los que hace la cafetería
+                        turno = Turno.objects.filter(cafeteria=cafeteria).order_by('?').first()
+                        turno.estado = 'usado' if turno.estado == 'pendiente' else 'pendiente'
+                        turno.save()
+                    encabezados = {'HTTP_IF_NONE_MATCH': etag} if condicional and etag else {}
+                    with contador.contar():
+                        inicio = time.perf_counter()
+                        respuesta = cliente.get(url, parametros, **encabezados)
+                        segundos += time.perf_counter() - inicio
+                    if respuesta.status_code == 304:
+                        no_modificados += 1
+                    etag = respuesta.get('ETag', etag)
+                self.stdout.write(
+                    f"    {nombre:<16}{segundos / rondas * 1000:>8.2f} ms/sondeo"
+                    f"{contador.total / rondas:>7.1f} consultas/sondeo  {no_modificados / rondas:>5.0%} 304"
+                )
+        self.stdout.write(self.style.SUCCESS('Benchmark de GET condicional terminado'))
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cafeteria.models import Cafeteria
+from turnos.benchmark import ContadorConsultas, base_de_datos_temporal, cronometrar
+from turnos.models import Turno, Penalizacion
+from turnos.utils import penalizar_turnos_no_reclamados
+from usuarios.models import Usuario
+
+
+def penalizar_legado():
+    # El ciclo fila por fila que había antes en turnos.utils
+    ahora = timezone.now()
+    turnos = Turno.objects.filter(
+        estado='pendiente',
+        generado_en__lte=ahora - timedelta(seconds=30),
+        reclamado_en__isnull=True
+    )
+    for turno in turnos:
+        penalizacion_reciente = Penalizacion.objects.filter(
+            usuario=turno.usuario,
+            activa=True,
+            creada_en__gte=ahora - timedelta(minutes=15)
+        ).exists()
+        if not penalizacion_reciente:
+            Penalizacion.objects.create(
+                usuario=turno.usuario,
+                fecha=turno.fecha,
+                motivo='No reclamó su turno en 30 segundos',
+                activa=True
+            )
+        turno.estado = 'penalizado'
+        turno.save()
+
+
+class Command(BaseCommand):
+    help = 'Compara la penalización fila por fila con la versión por conjuntos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vencidos', type=int, default=10_000)
+        parser.add_argument('--usuarios', type=int, default=1_000)
+
+    def handle(self, *args, **options):
+        with base_de_datos_temporal():
+            self._ejecutar(options['vencidos'], options['usuarios'])
+
+    def _preparar(self, cafeteria, usuarios, vencidos):
+        Turno.objects.all().delete()
+        Penalizacion.objects.all().delete()
+        hoy = timezone.localdate()
+        # Un turno pendiente por usuario y día, hacia atrás
+        Turno.objects.bulk_create([
+            Turno(usuario=usuarios[i % len(usuarios)], cafeteria=cafeteria,
+                  fecha=hoy - timedelta(days=i // len(usuarios)), codigo_turno=f"B{i}")
+            for i in range(vencidos)
+        ], batch_size=2000)
+        Turno.objects.update(generado_en=timezone.now() - timedelta(minutes=5))
+
+    def _ejecutar(self, vencidos, n_usuarios):
+        cafeteria = Cafeteria.objects.create(nombre="Bench", estado="abierto", horario_apertura="07:00", horario_cierre="15:00")
+        usuarios = Usuario.objects.bulk_create([
+            Usuario(username=f"bench{i}", codigo_estudiantil=f"B{i}") for i in range(n_usuarios)
+        ])
+        self.stdout.write(f"{vencidos:,} turnos vencidos de {n_usuarios:,} usuarios")
+        for nombre, penalizar in (('fila por fila (legado)', penalizar_legado),
+                                  ('por conjuntos', penalizar_turnos_no_reclamados)):
+            self._preparar(cafeteria, usuarios, vencidos)
+            with ContadorConsultas().contar() as contador:
+                segundos = cronometrar(penalizar)
+            self.stdout.write(
+                f"  {nombre:<24}{segundos:>9.2f} s{contador.total:>9,} consultas  "
+                f"({Turno.objects.filter(estado='penalizado').count():,} turnos, "
+                f"{Penalizacion.objects.count():,} penalizaciones)"
+            )
+        self.stdout.write(self.style.SUCCESS('Benchmark de penalización terminado'))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from notificaciones.fcm_falso import PREFIJO_NO_REGISTRADO, servidor_fcm_falso
+from notificaciones.models import DispositivoPush
+from notificaciones.push import despachar
+from turnos.benchmark import ContadorConsultas, base_de_datos_temporal, cronometrar
+from usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = 'Envía un push a muchos dispositivos contra el servidor FCM falso y mide el rendimiento'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dispositivos', type=int, default=50_000)
+        parser.add_argument('--conexiones', default='16,64',
+                            help='Envíos simultáneos a probar, separados por coma')
+        parser.add_argument('--latencia-ms', type=float, default=5,
+                            help='Ida y vuelta simulada del proveedor por envío')
+        parser.add_argument('--no-registrados', type=float, default=0.01,
+                            help='Fracción de tokens que el proveedor da por no registrados')
+
+    def handle(self, *args, **options):
+        with base_de_datos_temporal(), servidor_fcm_falso(options['latencia_ms']) as servidor:
+            for conexiones in [int(n) for n in options['conexiones'].split(',')]:
+                self._preparar(options['dispositivos'], options['no_registrados'])
+                contador = ContadorConsultas()
+                with override_settings(PUSH_TRANSPORTE='http', PUSH_URL=servidor.url, PUSH_CONEXIONES=conexiones):
+                    with contador.contar():
+                        resumen = {}
+                        segundos = cronometrar(lambda: resumen.update(
+                            despachar(DispositivoPush.objects.all(), "Aviso", "Prueba de envío")))
+                self.stdout.write(
+                    f"{conexiones:>3} conexiones: {segundos:.2f} s, "
+                    f"{options['dispositivos'] / segundos:,.0f} envíos/s, {contador.total} consultas, {resumen}"
+                )
+
+    def _preparar(self, n, fraccion_no_registrados):
+        DispositivoPush.objects.all().delete()
+        usuario = Usuario.objects.first() or Usuario.objects.create_user(
+            username="push", password="x", codigo_estudiantil="PUSH")
+        cada = int(1 / fraccion_no_registrados) if fraccion_no_registrados else 0
+        DispositivoPush.objects.bulk_create([
+            DispositivoPush(usuario=usuario, plataforma="android",
+                            token=f"{PREFIJO_NO_REGISTRADO}-{i}" if cada and i % cada == 0 else f"token-{i}")
+            for i in range(n)
+        ], batch_size=5000)
@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from cafeteria.models import Cafeteria
+from qr import firmas
+from qr.models import QRActivo
+from turnos.benchmark import ContadorConsultas, base_de_datos_temporal, cronometrar
+from usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = 'Compara la validación de QR guardados en QRActivo contra QR firmados (HMAC)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--validaciones', type=int, default=20_000)
+        parser.add_argument('--cafeterias', type=int, default=10)
+        parser.add_argument('--historial-minutos', type=int, default=7 * 24 * 60,
+                            help='Filas de QRActivo por cafetería (una por minuto rotado)')
+
+    def handle(self, *args, **options):
+        with base_de_datos_temporal():
+            self._ejecutar(options['validaciones'], options['cafeterias'], options['historial_minutos'])
+
+    def _preparar(self, n_cafeterias, minutos):
+        cafeterias = [Cafeteria.objects.create(nombre=f"Cafe {i}", estado="abierto",
+                                               horario_apertura="07:00", horario_cierre="15:00")
+                      for i in range(n_cafeterias)]
+        ahora = timezone.now()
+        # El historial que deja la rotación de cada minuto en modo tabla
+        QRActivo.objects.bulk_create([
+            QRActivo(cafeteria=cafeteria, codigo=QRActivo.generar_codigo(),
+                     expiracion=ahora - timedelta(minutes=minuto))
+            for cafeteria in cafeterias for minuto in range(minutos, 0, -1)
+        ], batch_size=5000)
+        vigentes = [QRActivo.objects.create(cafeteria=cafeteria, codigo=f"vigente{cafeteria.id}",
+                                            expiracion=ahora + timedelta(hours=1))
+                    for cafeteria in cafeterias]
+        usuario = Usuario.objects.create_user(username="bench", password="x", codigo_estudiantil="B0")
+        return cafeterias, vigentes, usuario
+
+    def _ejecutar(self, n, n_cafeterias, minutos):
+        cafeterias, vigentes, usuario = self._preparar(n_cafeterias, minutos)
+        self.stdout.write(f"{n:,} validaciones, {n_cafeterias} cafeterías, "
+                          f"{QRActivo.objects.count():,} filas de QRActivo")
+
+        def tabla(i):
+            qr = vigentes[i % n_cafeterias]
+            return QRActivo.objects.filter(codigo=qr.codigo, cafeteria_id=qr.cafeteria_id,
+                                           expiracion__gt=timezone.now()).exists()
+
+        with override_settings(QR_MODO='hmac'):
+            codigos = {c.id: firmas.qr_vigente(c.id)['codigo'] for c in cafeterias}
+
+            def hmac_(i):
+                cafeteria = cafeterias[i % n_cafeterias]
+                return firmas.expiracion_valida(codigos[cafeteria.id], cafeteria.id) is not None
+
+            self.stdout.write("  Validación (solo la comprobación del código):")
+            for nombre, validar in (('tabla', tabla), ('hmac', hmac_)):
+                contador = ContadorConsultas()
+                indices = iter(range(n))
+                with contador.contar():
+                    segundos = cronometrar(lambda: validar(next(indices)), n)
+                self.stdout.write(f"    {nombre:<8}{1 / segundos:>12,.0f} validaciones/s"
+                                  f"{segundos * 1e6:>10.1f} µs{contador.total / n:>6.1f} consultas")
+
+        self.stdout.write("  POST /api/qr/validar/:")
+        cliente = APIClient(HTTP_HOST='localhost')
+        cliente.force_authenticate(user=usuario)
+        url = reverse('validar_qr')
+        peticiones = max(n // 10, 1)
+        for modo in ('tabla', 'hmac'):
+            with override_settings(QR_MODO=modo):
+                datos = [{'codigo': codigos[c.id] if modo == 'hmac' else f"vigente{c.id}", 'cafeteria_id': c.id}
+                         for c in cafeterias]
+                contador = ContadorConsultas()
+                indices = iter(range(peticiones))
+                with contador.contar():
+                    segundos = cronometrar(
+                        lambda: cliente.post(url, datos[next(indices) % n_cafeterias]), peticiones)
+                self.stdout.write(f"    {modo:<8}{1 / segundos:>12,.0f} peticiones/s"
+                                  f"{segundos * 1000:>10.2f} ms{contador.total / peticiones:>6.1f} consultas")
+        self.stdout.write(self.style.SUCCESS('Benchmark de validación de QR terminado'))
@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cafeteria.models import Cafeteria
+from turnos.benchmark import ContadorConsultas, base_de_datos_temporal, cronometrar
+from turnos.models import Turno
+from turnos.serializers import TurnoSerializer
+from usuarios.models import Usuario
+
+
+def legado(turnos):
+    # Como antes: instancias sin select_related y serializer de modelo por fila
+    return [TurnoSerializer(turno).data for turno in turnos]
+
+
+def con_select_related(turnos):
+    return [TurnoSerializer(turno).data for turno in turnos.select_related('usuario', 'cafeteria')]
+
+
+def rapido(turnos):
+    return TurnoSerializer(turnos, many=True).data
+
+
+class Command(BaseCommand):
+    help = 'Compara la serialización de listados de turnos antes y después de la lectura por values()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turnos', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        with base_de_datos_temporal():
+            self._ejecutar(options['turnos'])
+
+    def _ejecutar(self, n_turnos):
+        cafeterias = [Cafeteria.objects.create(nombre=f"Cafe {i}", estado="abierto",
+                                               horario_apertura="07:00", horario_cierre="15:00") for i in range(3)]
+        usuarios = Usuario.objects.bulk_create([
+            Usuario(username=f"bench{i}", codigo_estudiantil=f"B{i}") for i in range(n_turnos // 10)
+        ])
+        hoy = timezone.localdate()
+        Turno.objects.bulk_create([
+            Turno(usuario=usuarios[i % len(usuarios)], cafeteria=cafeterias[i % 3],
+                  fecha=hoy - timedelta(days=i // len(usuarios)), codigo_turno=f"B{i}")
+            for i in range(n_turnos)
+        ], batch_size=2000)
+        turnos = Turno.objects.order_by('-fecha')
+        self.stdout.write(f"Serializar {n_turnos:,} turnos")
+        referencia = None
+        for nombre, serializar in (('legado (N+1)', legado),
+                                   ('select_related', con_select_related),
+                                   ('values() rápido', rapido)):
+            resultado = []
+            with ContadorConsultas().contar() as contador:
+                segundos = cronometrar(lambda: resultado.append(serializar(turnos.all())))
+            datos = [dict(fila) for fila in resultado[0]]
+            referencia = referencia or datos
+            self.stdout.write(
+                f"  {nombre:<18}{segundos:>8.2f} s{n_turnos / segundos:>10,.0f} filas/s"
+                f"{contador.total:>8,} consultas  {'mismo JSON' if datos == referencia else 'JSON DISTINTO'}"
+            )
+        self.stdout.write(self.style.SUCCESS('Benchmark de serialización terminado'))
@@ -5,5 +5,8 @@ class Command(BaseCommand):
     help = 'Penaliza turnos no reclamados en 30 segundos'
 
     def handle(self, *args, **kwargs):
-        penalizar_turnos_no_reclamados()
-        self.stdout.write(self.style.SUCCESS('Penalizaciones ejecutadas'))
\ No newline at end of file
+        resultado = penalizar_turnos_no_reclamados()
+        self.stdout.write(self.style.SUCCESS(
+            f"Penalizaciones ejecutadas: {resultado['turnos_penalizados']} turnos penalizados, "
+            f"{resultado['penalizaciones_creadas']} penalizaciones creadas"
+        ))
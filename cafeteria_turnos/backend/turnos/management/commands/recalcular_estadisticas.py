@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from turnos.estadisticas import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Rehace EstadisticaDiaria de un rango de fechas desde Turno y TurnoArchivado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='AAAA-MM-DD (por defecto, hace 30 días)')
+        parser.add_argument('--hasta', help='AAAA-MM-DD (por defecto, hoy)')
+        parser.add_argument('--cafeteria', type=int, default=None)
+
+    def handle(self, *args, **options):
+        hoy = timezone.localdate()
+        desde = parse_date(options['desde']) if options['desde'] else hoy - timedelta(days=30)
+        hasta = parse_date(options['hasta']) if options['hasta'] else hoy
+        if desde is None or hasta is None:
+            raise CommandError('Las fechas deben tener el formato AAAA-MM-DD')
+        filas = reconstruir(desde, hasta, options['cafeteria'])
+        self.stdout.write(self.style.SUCCESS(f"Estadísticas del {desde} al {hasta}: {filas} filas por hora"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from turnos.archivo import archivar, corte_archivo, depurar_cambios, expirar_pendientes
+
+class Command(BaseCommand):
+    help = 'Expira los turnos pendientes de días pasados y archiva los anteriores a TURNOS_ARCHIVO_DIAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None, help='Días que se quedan en Turno')
+
+    def handle(self, *args, **options):
+        expirados = expirar_pendientes()
+        self.stdout.write(f"Pendientes de días pasados expirados: {expirados}")
+        self.stdout.write(f"Bajas viejas del registro de cambios borradas: {depurar_cambios()}")
+        corte = corte_archivo(dias=options['dias'])
+        if corte is None:
+            self.stdout.write('Archivo desactivado (TURNOS_ARCHIVO_DIAS = None)')
+            return
+        resultado = archivar(dias=options['dias'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Turnos anteriores a {corte:%Y-%m-%d}: {resultado['archivados']} archivados en {resultado['lotes']} lotes"
+        ))
@@ -0,0 +1,22 @@
+import asyncio
+import logging
+
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+from turnos.planificador import Planificador
+
+class Command(BaseCommand):
+    help = 'Ejecuta el planificador de penalizaciones y rotación de QR (reemplaza el cron de penalizar_turnos y actualizar_qr)'
+
+    def handle(self, *args, **kwargs):
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+        if isinstance(get_channel_layer(), InMemoryChannelLayer):
+            # Los cambios de este proceso no llegarían a los WebSockets de los workers
+            raise CommandError('La capa de canales es en memoria: configure CANALES_RUTA (la misma que los '
+                               'workers) para que los cambios del planificador lleguen a los WebSockets')
+        planificador = Planificador()
+        self.stdout.write(self.style.SUCCESS(f"Planificador iniciado como {planificador.titular}"))
+        try:
+            asyncio.run(planificador.ejecutar())
+        except KeyboardInterrupt:
+            self.stdout.write('Planificador detenido')
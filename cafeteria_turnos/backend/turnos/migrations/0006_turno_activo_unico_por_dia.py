@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turnos', '0005_penalizacion_creada_en'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='turno',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ('pendiente', 'entregado', 'penalizado'))), fields=('usuario', 'cafeteria', 'fecha'), name='turno_activo_unico_por_dia'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turnos', '0006_turno_activo_unico_por_dia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorTurno',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=50, unique=True)),
+                ('valor', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='turno',
+            name='codigo_turno',
+            field=models.CharField(blank=True, max_length=10, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='turno',
+            constraint=models.UniqueConstraint(fields=('cafeteria', 'fecha', 'codigo_turno'), name='codigo_turno_unico_por_dia'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turnos', '0007_contador_turno_codigo_por_dia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArriendoTarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('titular', models.CharField(max_length=100)),
+                ('expira_en', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:51
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turnos', '0008_arriendotarea'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contadorturno',
+            name='actualizado_en',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turnos', '0009_contadorturno_actualizado_en'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurnoEliminado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('turno_id', models.BigIntegerField()),
+                ('cafeteria_id', models.BigIntegerField()),
+                ('fecha', models.DateField()),
+                ('cambio', models.BigIntegerField(db_index=True)),
+                ('eliminado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='turno',
+            name='actualizado_en',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='turno',
+            name='cambio',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+    ]
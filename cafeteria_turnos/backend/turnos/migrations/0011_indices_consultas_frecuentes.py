@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turnos', '0010_turno_cambio_turnoeliminado'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='penalizacion',
+            index=models.Index(condition=models.Q(('activa', True)), fields=['usuario', 'creada_en'], name='penalizacion_activa_usuario'),
+        ),
+        migrations.AddIndex(
+            model_name='turno',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['fecha', 'id'], name='turno_pendiente_cola'),
+        ),
+        migrations.AddIndex(
+            model_name='turno',
+            index=models.Index(condition=models.Q(('estado', 'pendiente'), ('reclamado_en__isnull', True)), fields=['generado_en'], name='turno_pendiente_vence'),
+        ),
+        migrations.AddIndex(
+            model_name='turno',
+            index=models.Index(fields=['usuario', 'fecha', 'cafeteria', 'estado'], name='turno_usuario_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='turno',
+            index=models.Index(fields=['fecha', 'estado'], name='turno_fecha_estado'),
+        ),
+    ]
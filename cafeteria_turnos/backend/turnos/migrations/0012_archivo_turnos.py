@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cafeteria', '0002_alter_cafeteria_estado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('turnos', '0011_indices_consultas_frecuentes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurnoArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('fecha', models.DateField()),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('usado', 'Usado'), ('entregado', 'Entregado'), ('penalizado', 'Penalizado'), ('expirado', 'Expirado')], max_length=20)),
+                ('generado_en', models.DateTimeField()),
+                ('reclamado_en', models.DateTimeField(blank=True, null=True)),
+                ('codigo_turno', models.CharField(blank=True, max_length=10, null=True)),
+                ('cambio', models.BigIntegerField(default=0)),
+                ('actualizado_en', models.DateTimeField()),
+                ('archivado_en', models.DateTimeField(auto_now_add=True)),
+                ('cafeteria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cafeteria.cafeteria')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['usuario', 'fecha'], name='turno_archivado_usuario'), models.Index(fields=['fecha', 'estado'], name='turno_archivado_fecha')],
+            },
+        ),
+    ]
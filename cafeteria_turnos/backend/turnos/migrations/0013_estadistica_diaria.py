@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cafeteria', '0002_alter_cafeteria_estado'),
+        ('turnos', '0012_archivo_turnos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('hora', models.PositiveSmallIntegerField()),
+                ('emitidos', models.IntegerField(default=0)),
+                ('reclamados', models.IntegerField(default=0)),
+                ('penalizados', models.IntegerField(default=0)),
+                ('expirados', models.IntegerField(default=0)),
+                ('esperas', models.IntegerField(default=0)),
+                ('espera_total', models.FloatField(default=0)),
+                ('espera_p50', models.FloatField(blank=True, null=True)),
+                ('espera_p90', models.FloatField(blank=True, null=True)),
+                ('espera_p95', models.FloatField(blank=True, null=True)),
+                ('percentiles_al_dia', models.BooleanField(default=True)),
+                ('actualizado_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cafeteria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cafeteria.cafeteria')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('percentiles_al_dia', False)), fields=['fecha'], name='estadistica_percentiles_pend')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='estadisticadiaria',
+            constraint=models.UniqueConstraint(fields=('fecha', 'cafeteria', 'hora'), name='estadistica_por_hora'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cafeteria', '0002_alter_cafeteria_estado'),
+        ('turnos', '0013_estadistica_diaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('marcado_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cafeteria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cafeteria.cafeteria')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='estadisticapendiente',
+            constraint=models.UniqueConstraint(fields=('cafeteria', 'fecha'), name='estadistica_pendiente_por_dia'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:21
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def registrar_turnos(apps, schema_editor):
+    # Un cambio por turno vigente y una baja por turno eliminado, en el orden
+    # del número de cambio anterior, para que since=0 traiga todo
+    Turno = apps.get_model('turnos', 'Turno')
+    TurnoEliminado = apps.get_model('turnos', 'TurnoEliminado')
+    CambioTurno = apps.get_model('turnos', 'CambioTurno')
+    filas = sorted(
+        [(cambio, id_, cafeteria_id, fecha, False)
+         for id_, cafeteria_id, fecha, cambio in Turno.objects.values_list('id', 'cafeteria_id', 'fecha', 'cambio')]
+        + [(cambio, id_, cafeteria_id, fecha, True)
+           for id_, cafeteria_id, fecha, cambio in TurnoEliminado.objects.values_list(
+               'turno_id', 'cafeteria_id', 'fecha', 'cambio')],
+        key=lambda fila: (fila[0], fila[1]),
+    )
+    CambioTurno.objects.bulk_create([
+        CambioTurno(turno_id=id_, cafeteria_id=cafeteria_id, fecha=fecha, eliminado=eliminado)
+        for _, id_, cafeteria_id, fecha, eliminado in filas
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turnos', '0014_estadistica_pendiente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioTurno',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('turno_id', models.BigIntegerField()),
+                ('cafeteria_id', models.BigIntegerField()),
+                ('fecha', models.DateField()),
+                ('eliminado', models.BooleanField(default=False)),
+                ('creado_en', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(registrar_turnos, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='TurnoEliminado',
+        ),
+        migrations.RemoveField(
+            model_name='turno',
+            name='cambio',
+        ),
+        migrations.RemoveField(
+            model_name='turnoarchivado',
+            name='cambio',
+        ),
+        migrations.AddIndex(
+            model_name='cambioturno',
+            index=models.Index(fields=['turno_id'], name='cambio_turno_turno'),
+        ),
+    ]
@@ -1,6 +1,8 @@
-from django.db import models
-import random
-import string
+from django.db import models, transaction
+from django.utils import timezone
+
+# Estados que cuentan como "ya tiene turno hoy" para el mismo usuario/cafetería
+ESTADOS_ACTIVOS = ('pendiente', 'entregado', 'penalizado')
 
 class Turno(models.Model):
     ESTADOS = (
@@ -10,26 +12,70 @@ class Turno(models.Model):
         ('penalizado', 'Penalizado'),
         ('expirado', 'Expirado'),
     )
+    ESTADOS_ACTIVOS = ESTADOS_ACTIVOS
+
     usuario = models.ForeignKey('usuarios.Usuario', on_delete=models.CASCADE)
     cafeteria = models.ForeignKey('cafeteria.Cafeteria', on_delete=models.CASCADE)
     fecha = models.DateField()
     estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
     generado_en = models.DateTimeField(auto_now_add=True)
     reclamado_en = models.DateTimeField(null=True, blank=True)
-    codigo_turno = models.CharField(max_length=10, unique=True, blank=True, null=True)  
+    codigo_turno = models.CharField(max_length=10, blank=True, null=True)
+    # Hora de la última modificación; lo que cambió para el admin (?since=)
+    # sale de CambioTurno
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cafeteria', 'fecha', 'codigo_turno'],
+                name='codigo_turno_unico_por_dia',
+            ),
+            models.UniqueConstraint(
+                fields=['usuario', 'cafeteria', 'fecha'],
+                condition=models.Q(estado__in=ESTADOS_ACTIVOS),
+                name='turno_activo_unico_por_dia',
+            ),
+        ]
+        indexes = [
+            # Cola de pendientes (turno actual, motor de la cola)
+            models.Index(fields=['fecha', 'id'], condition=models.Q(estado='pendiente'), name='turno_pendiente_cola'),
+            # Pendientes sin reclamar por hora de emisión (penalización, planificador)
+            models.Index(fields=['generado_en'], condition=models.Q(estado='pendiente', reclamado_en__isnull=True),
+                         name='turno_pendiente_vence'),
+            # Turnos de un usuario por fecha (mis turnos, panel, chequeo de duplicado)
+            models.Index(fields=['usuario', 'fecha', 'cafeteria', 'estado'], name='turno_usuario_fecha'),
+            # Filtro por día del listado del admin
+            models.Index(fields=['fecha', 'estado'], name='turno_fecha_estado'),
+        ]
+
+    # Lo que cuenta en EstadisticaDiaria (ver estadisticas.py)
+    CAMPOS_ESTADISTICA = ('cafeteria_id', 'fecha', 'generado_en', 'estado', 'reclamado_en')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        turno = super().from_db(db, field_names, values)
+        turno._estadistica_original = turno.campos_estadistica()
+        return turno
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._estadistica_original = self.campos_estadistica()
+
+    def campos_estadistica(self):
+        # None si falta alguno: leer un campo diferido haría una consulta
+        if not all(campo in self.__dict__ for campo in self.CAMPOS_ESTADISTICA):
+            return None
+        return tuple(self.__dict__[campo] for campo in self.CAMPOS_ESTADISTICA)
 
     def save(self, *args, **kwargs):
+        from .codigos import asignar_codigo
         if not self.codigo_turno:
-            self.codigo_turno = self.generar_codigo_unico()
+            self.codigo_turno = asignar_codigo(self.cafeteria_id, self.fecha)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'actualizado_en'}
         super().save(*args, **kwargs)
 
-    @staticmethod
-    def generar_codigo_unico(longitud=6):
-        while True:
-            codigo = ''.join(random.choices(string.ascii_uppercase + string.digits, k=longitud))
-            if not Turno.objects.filter(codigo_turno=codigo).exists():
-                return codigo
-
     def __str__(self):
         return f"Turno {self.usuario} {self.fecha} ({self.estado}) [{self.codigo_turno}]"
 
@@ -40,5 +86,160 @@ class Penalizacion(models.Model):
     activa = models.BooleanField(default=True)
     creada_en = models.DateTimeField(auto_now_add=True)  # NUEVO campo para medir los 15 minutos
 
+    class Meta:
+        indexes = [
+            # Penalización vigente de un usuario (usuario_penalizado, emisión, panel)
+            models.Index(fields=['usuario', 'creada_en'], condition=models.Q(activa=True),
+                         name='penalizacion_activa_usuario'),
+        ]
+
+    def __str__(self):
+        return f"Penalización {self.usuario} {self.fecha} ({'activa' if self.activa else 'inactiva'})"
+
+class CambioTurno(models.Model):
+    """
+    Registro de cambios de Turno para la sincronización incremental del admin
+    (?since=): una fila por turno creado o modificado, y una con eliminado=True
+    cuando sale de Turno (borrado o archivado). El id autoincremental es la
+    marca de ?since=; como cada transacción toma el único escritor de SQLite
+    al empezar (BEGIN IMMEDIATE), los ids quedan en orden de confirmación.
+    Cada cambio es un INSERT, sin una fila contador compartida.
+
+    SQLite vuelve a usar el id más alto si esa fila se borra, y un cliente
+    con ese since= se perdería el cambio nuevo: la fila más alta nunca se
+    borra (la baja se inserta antes de borrar los cambios viejos del turno).
+    """
+    turno_id = models.BigIntegerField()
+    cafeteria_id = models.BigIntegerField()
+    fecha = models.DateField()
+    eliminado = models.BooleanField(default=False)
+    creado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Limpieza al archivar o borrar un turno
+            models.Index(fields=['turno_id'], name='cambio_turno_turno'),
+        ]
+
+    @classmethod
+    def anotar(cls, turnos, eliminado=False):
+        """Un cambio por cada (turno_id, cafeteria_id, fecha), con un solo INSERT."""
+        from .cola import motor
+
+        ahora = timezone.now()
+        cambios = cls.objects.bulk_create([cls(turno_id=turno_id, cafeteria_id=cafeteria_id, fecha=fecha,
+                                               eliminado=eliminado, creado_en=ahora)
+                                           for turno_id, cafeteria_id, fecha in turnos], batch_size=500)
+        # Las señales de este proceso ya los aplican a su cola en memoria. Al
+        # confirmar: un id de una transacción deshecha puede reusarlo otro worker
+        ids = [cambio.id for cambio in cambios]
+        transaction.on_commit(lambda: motor.anotar_propios(ids))
+
+    def __str__(self):
+        return f"Cambio {self.id}: turno {self.turno_id}{' eliminado' if self.eliminado else ''}"
+
+class TurnoArchivado(models.Model):
+    """
+    Turnos de días anteriores a TURNOS_ARCHIVO_DIAS, movidos fuera de Turno
+    por el rollover diario (ver archivo.py). Mismas columnas e id que tenían
+    en Turno.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    usuario = models.ForeignKey('usuarios.Usuario', on_delete=models.CASCADE)
+    cafeteria = models.ForeignKey('cafeteria.Cafeteria', on_delete=models.CASCADE)
+    fecha = models.DateField()
+    estado = models.CharField(max_length=20, choices=Turno.ESTADOS)
+    generado_en = models.DateTimeField()
+    reclamado_en = models.DateTimeField(null=True, blank=True)
+    codigo_turno = models.CharField(max_length=10, blank=True, null=True)
+    actualizado_en = models.DateTimeField()
+    archivado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Historial de un usuario y listado del admin por día
+            models.Index(fields=['usuario', 'fecha'], name='turno_archivado_usuario'),
+            models.Index(fields=['fecha', 'estado'], name='turno_archivado_fecha'),
+        ]
+
+    def __str__(self):
+        return f"Turno archivado {self.usuario} {self.fecha} ({self.estado}) [{self.codigo_turno}]"
+
+class EstadisticaDiaria(models.Model):
+    """
+    Estadísticas de servicio por cafetería, día y hora de emisión, mantenidas
+    al cambiar cada turno (ver estadisticas.py). Los pendientes son
+    emitidos - reclamados - penalizados - expirados; la espera es
+    reclamado_en - generado_en, en segundos.
+    """
+    cafeteria = models.ForeignKey('cafeteria.Cafeteria', on_delete=models.CASCADE)
+    fecha = models.DateField()
+    hora = models.PositiveSmallIntegerField()
+    emitidos = models.IntegerField(default=0)
+    reclamados = models.IntegerField(default=0)  # usados o entregados
+    penalizados = models.IntegerField(default=0)
+    expirados = models.IntegerField(default=0)
+    esperas = models.IntegerField(default=0)  # reclamados con hora de reclamo
+    espera_total = models.FloatField(default=0)
+    espera_p50 = models.FloatField(null=True, blank=True)
+    espera_p90 = models.FloatField(null=True, blank=True)
+    espera_p95 = models.FloatField(null=True, blank=True)
+    # False cuando cambiaron las esperas y faltan recalcular los percentiles
+    percentiles_al_dia = models.BooleanField(default=True)
+    actualizado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'cafeteria', 'hora'], name='estadistica_por_hora'),
+        ]
+        indexes = [
+            models.Index(fields=['fecha'], condition=models.Q(percentiles_al_dia=False),
+                         name='estadistica_percentiles_pend'),
+        ]
+
+    def __str__(self):
+        return f"{self.cafeteria_id} {self.fecha} {self.hora:02d}h: {self.emitidos} emitidos"
+
+class EstadisticaPendiente(models.Model):
+    """
+    Día de una cafetería cuyas estadísticas hay que rehacer desde los turnos
+    porque un turno cambió sin que se supiera qué aportaba antes; el
+    planificador lo rehace (ver estadisticas.py).
+    """
+    cafeteria = models.ForeignKey('cafeteria.Cafeteria', on_delete=models.CASCADE)
+    fecha = models.DateField()
+    marcado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cafeteria', 'fecha'], name='estadistica_pendiente_por_dia'),
+        ]
+
     def __str__(self):
-        return f"Penalización {self.usuario} {self.fecha} ({'activa' if self.activa else 'inactiva'})"
\ No newline at end of file
+        return f"{self.cafeteria_id} {self.fecha}: estadísticas por rehacer"
+
+class ContadorTurno(models.Model):
+    """
+    Contador atómico usado por los asignadores de código de turno y por las
+    versiones de datos del GET condicional (ver versiones.py). Cada clave es
+    una secuencia independiente.
+    """
+    clave = models.CharField(max_length=50, unique=True)
+    valor = models.BigIntegerField(default=0)
+    actualizado_en = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.clave} = {self.valor}"
+
+class ArriendoTarea(models.Model):
+    """
+    Arriendo (lease) con vencimiento para que una tarea de fondo corra en un
+    solo proceso aunque se lance en varios workers.
+    """
+    nombre = models.CharField(max_length=50, unique=True)
+    titular = models.CharField(max_length=100)
+    expira_en = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.nombre} ({self.titular} hasta {self.expira_en})"
+
@@ -0,0 +1,63 @@
+"""
+Caché de "penalizado hasta" por usuario.
+
+Una penalización vale hasta creada_en + DURACION_PENALIZACION, así que la
+entrada de un usuario penalizado vence sola a esa hora. La de un usuario sin
+penalización vive TURNOS_PENALIZACION_CACHE_SEGUNDOS. Las entradas se
+invalidan al crear, desactivar o borrar penalizaciones (señales de
+Penalizacion, DespenalizarTurnoAdminView y la penalización masiva), y otra
+vez después del commit.
+
+Se usa la caché TURNOS_CACHE_PENALIZACIONES de CACHES, que tiene que ser
+compartida entre procesos (la 'compartida' de archivos, Redis...): la
+penalización masiva corre en el planificador y las despenalizaciones en
+cualquier worker, y con una caché local a cada proceso su invalidación no
+llegaría a los demás.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+DURACION_PENALIZACION = timedelta(minutes=15)
+
+
+def _cache():
+    return caches[getattr(settings, 'TURNOS_CACHE_PENALIZACIONES', 'compartida')]
+
+
+def _clave(usuario_id):
+    return f'turnos:penalizado_hasta:{usuario_id}'
+
+
+def consultar(usuario_id, ahora):
+    """
+    Devuelve la hora hasta la que el usuario está penalizado, False si se
+    sabe que no lo está, o None si no hay dato en la caché.
+    """
+    hasta = _cache().get(_clave(usuario_id))
+    if hasta is None:
+        return None
+    if hasta > ahora.timestamp():
+        return datetime.fromtimestamp(hasta, tz=dt_timezone.utc)
+    return False
+
+
+def recordar(usuario_id, hasta, ahora):
+    """Guarda el resultado leído de la base de datos (hasta=None: no penalizado)."""
+    if hasta is not None and hasta > ahora:
+        _cache().set(_clave(usuario_id), hasta.timestamp(), timeout=(hasta - ahora).total_seconds())
+    else:
+        _cache().set(_clave(usuario_id), 0, timeout=getattr(settings, 'TURNOS_PENALIZACION_CACHE_SEGUNDOS', 30))
+
+
+def olvidar(*usuario_ids):
+    _cache().delete_many([_clave(usuario_id) for usuario_id in usuario_ids])
+
+
+def olvidar_al_confirmar(*usuario_ids):
+    # Se borra ya y otra vez al confirmar: entre medio otra solicitud pudo
+    # leer de la base de datos el estado viejo y volver a guardarlo
+    olvidar(*usuario_ids)
+    transaction.on_commit(lambda: olvidar(*usuario_ids))
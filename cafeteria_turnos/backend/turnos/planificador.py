@@ -0,0 +1,285 @@
+"""
+Planificador asyncio de las tareas por tiempo: penalizar turnos no
+reclamados, rotar el QR de cada cafetería al vencer, depurar a diario el
+historial de QRs (qr/retencion.py), hacer el rollover diario de turnos
+después de medianoche (archivo.py) y poner al día las estadísticas
+(estadisticas.py): rehacer los días marcados y recalcular los percentiles
+de espera.
+
+Los vencimientos (generado_en + TIEMPO_RECLAMO de cada turno pendiente y la
+expiración del QR vigente de cada cafetería) se guardan en una rueda de
+temporizadores con ranuras de PLANIFICADOR_TICK_SEGUNDOS, así cada tarea se
+ejecuta a más tardar un tick después de su hora. La rueda se rellena desde la
+base de datos cada PLANIFICADOR_RESINCRONIZAR_SEGUNDOS, bastante antes de que
+venzan los turnos nuevos creados por otros procesos.
+
+Con QR_MODO = 'hmac' los QR no se rotan aquí (ver qr/firmas.py).
+
+Un arriendo en la base de datos (ArriendoTarea) garantiza que solo un
+proceso ejecute las tareas; los demás quedan en espera para relevarlo.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from cafeteria.models import Cafeteria
+from cafeteria_turnos.metricas import tarea
+from qr import firmas
+from qr.models import QRActivo
+from qr.retencion import depurar_historial
+from . import estadisticas
+from .archivo import rollover
+from .models import ArriendoTarea, Turno
+from .utils import TIEMPO_RECLAMO, penalizar_turnos_no_reclamados
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_ARRIENDO = 'planificador'
+# Lotes de la depuración de QRs y del rollover por tick, sin pausas entre
+# ellos: lo que queda sigue en el próximo tick, así no se frenan las demás tareas
+LOTES_RETENCION_POR_TICK = 5
+
+
+class RuedaTemporizadores:
+    """
+    Rueda de temporizadores (hashed timing wheel). Cada entrada se guarda en la
+    ranura de su tick de vencimiento; avanzar la rueda solo revisa las ranuras
+    de los ticks transcurridos, sin importar cuántas entradas haya en total.
+    """
+
+    def __init__(self, tick=1.0, ranuras=512):
+        self.tick = tick
+        self.n_ranuras = ranuras
+        self._ranuras = [{} for _ in range(ranuras)]
+        self._ubicacion = {}  # clave -> índice de ranura
+        self._siguiente_tick = None
+
+    def __len__(self):
+        return len(self._ubicacion)
+
+    def __contains__(self, clave):
+        return clave in self._ubicacion
+
+    def _tick_de(self, instante):
+        return int(instante // self.tick)
+
+    def agregar(self, clave, vence_en, dato=None):
+        """Programa (o reprograma) `clave` para el instante `vence_en` (segundos epoch)."""
+        # Redondeo hacia arriba: una entrada nunca sale antes de su hora
+        tick = -int(-vence_en // self.tick)
+        if self._siguiente_tick is not None and tick < self._siguiente_tick:
+            # Ya vencido: sale en el próximo avance
+            tick = self._siguiente_tick
+        self.cancelar(clave)
+        indice = tick % self.n_ranuras
+        self._ranuras[indice][clave] = (tick, dato)
+        self._ubicacion[clave] = indice
+
+    def cancelar(self, clave):
+        indice = self._ubicacion.pop(clave, None)
+        if indice is not None:
+            del self._ranuras[indice][clave]
+
+    def claves(self):
+        return list(self._ubicacion)
+
+    def avanzar(self, ahora):
+        """Devuelve las entradas (clave, dato) vencidas hasta `ahora` y las quita de la rueda."""
+        objetivo = self._tick_de(ahora)
+        desde = self._siguiente_tick if self._siguiente_tick is not None else objetivo - self.n_ranuras + 1
+        if objetivo < desde:
+            return []
+        vencidas = []
+        # Si pasaron más ticks que ranuras basta con una vuelta completa
+        for tick in range(max(desde, objetivo - self.n_ranuras + 1), objetivo + 1):
+            ranura = self._ranuras[tick % self.n_ranuras]
+            for clave, (vence, dato) in list(ranura.items()):
+                if vence <= objetivo:
+                    del ranura[clave]
+                    del self._ubicacion[clave]
+                    vencidas.append((clave, dato))
+        self._siguiente_tick = objetivo + 1
+        return vencidas
+
+
+def tomar_arriendo(nombre, titular, duracion, ahora=None):
+    """
+    Toma o renueva el arriendo `nombre` para `titular`. Devuelve True si el
+    titular lo tiene hasta ahora + duracion.
+    """
+    ahora = ahora or timezone.now()
+    expira_en = ahora + duracion
+    with transaction.atomic():
+        tomado = ArriendoTarea.objects.filter(nombre=nombre).filter(
+            Q(titular=titular) | Q(expira_en__lte=ahora)
+        ).update(titular=titular, expira_en=expira_en)
+        if tomado:
+            return True
+        try:
+            with transaction.atomic():
+                ArriendoTarea.objects.create(nombre=nombre, titular=titular, expira_en=expira_en)
+            return True
+        except IntegrityError:
+            return False
+
+
+def liberar_arriendo(nombre, titular):
+    ArriendoTarea.objects.filter(nombre=nombre, titular=titular).delete()
+
+
+class Planificador:
+    def __init__(self, titular=None):
+        self.tick = getattr(settings, 'PLANIFICADOR_TICK_SEGUNDOS', 1)
+        self.resincronizar_cada = getattr(settings, 'PLANIFICADOR_RESINCRONIZAR_SEGUNDOS', 10)
+        self.duracion_arriendo = timedelta(seconds=getattr(settings, 'PLANIFICADOR_ARRIENDO_SEGUNDOS', 15))
+        self.titular = titular or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.rueda = RuedaTemporizadores(tick=self.tick)
+        self.es_lider = False
+        self._arriendo_renovado_en = None
+        self._resincronizado_en = None
+        self._detener = None
+
+    def resincronizar(self, ahora):
+        """Carga en la rueda los vencimientos de turnos pendientes y QRs vigentes."""
+        for clave in (('retencion_qr',), ('rollover_turnos',), ('estadisticas',)):
+            if clave not in self.rueda:
+                # Al tomar el liderazgo y después cada tanto
+                self.rueda.agregar(clave, ahora.timestamp())
+        pendientes = dict(Turno.objects.filter(
+            estado='pendiente', reclamado_en__isnull=True
+        ).values_list('id', 'generado_en'))
+        for clave in self.rueda.claves():
+            if clave[0] == 'turno' and clave[1] not in pendientes:
+                self.rueda.cancelar(clave)
+        for turno_id, generado_en in pendientes.items():
+            self.rueda.agregar(('turno', turno_id), (generado_en + TIEMPO_RECLAMO).timestamp())
+
+        if firmas.modo_hmac():
+            # Los QR firmados rotan solos con el reloj: no hay filas que crear
+            for clave in self.rueda.claves():
+                if clave[0] == 'qr':
+                    self.rueda.cancelar(clave)
+            self._resincronizado_en = ahora
+            return
+        expiraciones = dict(QRActivo.objects.values('cafeteria_id')
+                            .annotate(ultima=Max('expiracion')).values_list('cafeteria_id', 'ultima'))
+        for cafeteria_id in Cafeteria.objects.values_list('id', flat=True):
+            # Sin QR vigente: se genera en el próximo tick
+            expiracion = expiraciones.get(cafeteria_id) or ahora
+            self.rueda.agregar(('qr', cafeteria_id), max(expiracion, ahora).timestamp())
+        self._resincronizado_en = ahora
+
+    def rotar_qr(self, cafeteria_id, ahora):
+        try:
+            cafeteria = Cafeteria.objects.get(id=cafeteria_id)
+        except Cafeteria.DoesNotExist:
+            return None
+        qr = QRActivo.crear_o_actualizar_qr(cafeteria)
+        self.rueda.agregar(('qr', cafeteria_id), qr.expiracion.timestamp())
+        return qr
+
+    def depurar_qr(self, ahora):
+        resultado = depurar_historial(ahora, max_lotes=LOTES_RETENCION_POR_TICK)
+        if resultado['borrados']:
+            logger.info("Planificador: historial de QR %s", resultado)
+        siguiente = ahora + (timedelta(seconds=self.tick) if resultado['pendiente'] else timedelta(days=1))
+        self.rueda.agregar(('retencion_qr',), siguiente.timestamp())
+        return resultado
+
+    def rollover_turnos(self, ahora):
+        resultado = rollover(ahora, max_lotes=LOTES_RETENCION_POR_TICK)
+        if resultado['expirados'] or resultado['archivados']:
+            logger.info("Planificador: rollover de turnos %s", resultado)
+        if resultado['pendiente']:
+            siguiente = ahora + timedelta(seconds=self.tick)
+        else:
+            # Cinco minutos después de la próxima medianoche local
+            manana = timezone.localtime(ahora).replace(hour=0, minute=5, second=0, microsecond=0) + timedelta(days=1)
+            siguiente = timezone.make_aware(manana.replace(tzinfo=None))
+        self.rueda.agregar(('rollover_turnos',), siguiente.timestamp())
+        return resultado
+
+    def percentiles_estadisticas(self, ahora):
+        dias = estadisticas.reconstruir_pendientes()
+        actualizadas = estadisticas.recalcular_percentiles()
+        # Si quedaron días o filas pendientes se sigue en el próximo tick
+        lleno = dias >= estadisticas.LOTE_DIAS_PENDIENTES or actualizadas >= estadisticas.LOTE_PERCENTILES
+        espera = self.tick if lleno else getattr(
+            settings, 'TURNOS_ESTADISTICAS_SEGUNDOS', 60)
+        self.rueda.agregar(('estadisticas',), (ahora + timedelta(seconds=espera)).timestamp())
+        return actualizadas
+
+    def paso(self, ahora=None):
+        """
+        Un tick del planificador: renueva el arriendo, resincroniza si toca y
+        ejecuta lo vencido. Devuelve la lista de claves ejecutadas.
+        """
+        ahora = ahora or timezone.now()
+        if (self._arriendo_renovado_en is None
+                or ahora - self._arriendo_renovado_en >= self.duracion_arriendo / 3):
+            era_lider = self.es_lider
+            self.es_lider = tomar_arriendo(NOMBRE_ARRIENDO, self.titular, self.duracion_arriendo, ahora)
+            self._arriendo_renovado_en = ahora
+            if self.es_lider and not era_lider:
+                # Otro proceso pudo haber cambiado todo mientras estábamos en espera
+                self._resincronizado_en = None
+        if not self.es_lider:
+            return []
+        if (self._resincronizado_en is None
+                or (ahora - self._resincronizado_en).total_seconds() >= self.resincronizar_cada):
+            self.resincronizar(ahora)
+
+        vencidas = self.rueda.avanzar(ahora.timestamp())
+        # Una sola pasada masiva penaliza todos los turnos vencidos a la vez
+        if any(clave[0] == 'turno' for clave, _ in vencidas):
+            with tarea('penalizar_turnos'):
+                resultado = penalizar_turnos_no_reclamados(ahora)
+            if resultado['turnos_penalizados']:
+                logger.info("Planificador: %s", resultado)
+        for clave, _ in vencidas:
+            if clave[0] == 'qr':
+                with tarea('rotar_qr'):
+                    self.rotar_qr(clave[1], ahora)
+            elif clave[0] == 'retencion_qr':
+                with tarea('retencion_qr'):
+                    self.depurar_qr(ahora)
+            elif clave[0] == 'rollover_turnos':
+                with tarea('rollover_turnos'):
+                    self.rollover_turnos(ahora)
+            elif clave[0] == 'estadisticas':
+                with tarea('estadisticas'):
+                    self.percentiles_estadisticas(ahora)
+        return [clave for clave, _ in vencidas]
+
+    async def ejecutar(self):
+        self._detener = asyncio.Event()
+        logger.info("Planificador %s iniciado", self.titular)
+        try:
+            while not self._detener.is_set():
+                inicio = time.monotonic()
+                try:
+                    await sync_to_async(self.paso, thread_sensitive=True)()
+                except Exception:
+                    logger.exception("Error en el tick del planificador")
+                espera = max(0.0, self.tick - (time.monotonic() - inicio))
+                try:
+                    await asyncio.wait_for(self._detener.wait(), timeout=espera)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if self.es_lider:
+                await sync_to_async(liberar_arriendo, thread_sensitive=True)(NOMBRE_ARRIENDO, self.titular)
+
+    def detener(self):
+        if self._detener is not None:
+            self._detener.set()
@@ -1,7 +1,93 @@
+from types import SimpleNamespace
+
+from django.db.models import Manager, QuerySet
+from django.db.models.query import ModelIterable
 from rest_framework import serializers
 from .models import Turno, Penalizacion
 from cafeteria.serializers import CafeteriaSerializer  
 
+# Campo de DRF usado solo por su to_representation, para que las fechas
+# salgan con el mismo formato que en los serializers de modelo
+_FECHA = serializers.DateField()
+
+
+def _plan(serializer, columnas, prefijo=''):
+    """
+    (nombre, tipo, datos) por campo del serializer, para armar el JSON de una
+    fila de values() con sus columnas: 'campo' lee la columna y usa el
+    to_representation del campo; 'anidado' repite con el serializer anidado
+    sobre las columnas '<campo>__...'; 'texto' es un StringRelatedField y usa
+    el __str__ del modelo relacionado sobre sus columnas declaradas.
+    """
+    plan = []
+    for nombre, campo in serializer.fields.items():
+        if campo.write_only:
+            continue
+        columna = prefijo + campo.source.replace('.', '__')
+        if isinstance(campo, serializers.BaseSerializer):
+            plan.append((nombre, 'anidado', _plan(campo, columnas, columna + '__')))
+        elif isinstance(campo, serializers.RelatedField):
+            modelo = serializer.Meta.model._meta.get_field(campo.source).related_model
+            subcolumnas = {c[len(columna) + 2:]: c for c in columnas if c.startswith(columna + '__')}
+            plan.append((nombre, 'texto', (modelo.__str__, subcolumnas)))
+        else:
+            plan.append((nombre, 'campo', (columna, campo.to_representation)))
+    return plan
+
+
+def _armar(plan, fila):
+    datos = {}
+    for nombre, tipo, extra in plan:
+        if tipo == 'campo':
+            columna, representar = extra
+            valor = fila[columna]
+            datos[nombre] = None if valor is None else representar(valor)
+        elif tipo == 'anidado':
+            datos[nombre] = _armar(extra, fila)
+        else:
+            # __str__ del modelo sin construir la instancia: solo lee esos atributos
+            a_texto, subcolumnas = extra
+            datos[nombre] = a_texto(SimpleNamespace(**{attr: fila[c] for attr, c in subcolumnas.items()}))
+    return datos
+
+
+class ListaRapidaSerializer(serializers.ListSerializer):
+    """
+    Serializa listas leyendo solo las columnas necesarias con values() (un
+    JOIN, sin instancias de modelo por fila). Produce el mismo JSON que el
+    serializer hijo: cada fila se arma con los campos del hijo (ver _plan),
+    así que las subclases solo declaran las columnas, incluidas las que usa
+    el __str__ de cada StringRelatedField. Si recibe instancias ya cargadas
+    (una página del paginador, por ejemplo) usa el serializer normal.
+    """
+    columnas = ()
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        if isinstance(data, QuerySet) and data._iterable_class is ModelIterable:
+            data = data.values(*self.columnas)
+        return [self.fila_a_json(item) if isinstance(item, dict) else self.child.to_representation(item)
+                for item in data]
+
+    def fila_a_json(self, fila):
+        if getattr(self, '_plan_filas', None) is None:
+            self._plan_filas = _plan(self.child, self.columnas)
+        return _armar(self._plan_filas, fila)
+
+
+class TurnoListSerializer(ListaRapidaSerializer):
+    columnas = (
+        'id', 'codigo_turno', 'usuario__username', 'usuario__rol', 'fecha', 'estado', 'generado_en', 'reclamado_en',
+        'cafeteria__id', 'cafeteria__nombre', 'cafeteria__estado', 'cafeteria__horario_apertura',
+        'cafeteria__horario_cierre', 'cafeteria__updated_at',
+    )
+
+
+class PenalizacionListSerializer(ListaRapidaSerializer):
+    columnas = ('id', 'usuario__username', 'usuario__rol', 'fecha', 'motivo', 'activa')
+
+
 class TurnoSerializer(serializers.ModelSerializer):
     usuario = serializers.StringRelatedField()
     cafeteria = CafeteriaSerializer()  
@@ -18,10 +104,40 @@ class TurnoSerializer(serializers.ModelSerializer):
             'generado_en', 
             'reclamado_en'
         ]
+        list_serializer_class = TurnoListSerializer
 
 class PenalizacionSerializer(serializers.ModelSerializer):
     usuario = serializers.StringRelatedField()
 
     class Meta:
         model = Penalizacion
-        fields = ['id', 'usuario', 'fecha', 'motivo', 'activa']
\ No newline at end of file
+        fields = ['id', 'usuario', 'fecha', 'motivo', 'activa']
+        list_serializer_class = PenalizacionListSerializer
+
+class EstadisticaSerializer(serializers.Serializer):
+    """
+    Fila de estadisticas.consultar (una hora, o el total de un día sin hora
+    ni percentiles) con los pendientes, la tasa de no presentados
+    (penalizados + expirados) y la espera promedio en segundos.
+    """
+    def to_representation(self, fila):
+        emitidos, esperas = fila['emitidos'], fila['esperas']
+        no_presentados = fila['penalizados'] + fila['expirados']
+        datos = {
+            'cafeteria': fila['cafeteria_id'],
+            'fecha': _FECHA.to_representation(fila['fecha']),
+            'emitidos': emitidos,
+            'reclamados': fila['reclamados'],
+            'penalizados': fila['penalizados'],
+            'expirados': fila['expirados'],
+            'pendientes': emitidos - fila['reclamados'] - no_presentados,
+            'tasa_no_presentados': round(no_presentados / emitidos, 4) if emitidos else None,
+            'espera_promedio': round(fila['espera_total'] / esperas, 1) if esperas else None,
+        }
+        if 'hora' in fila:
+            datos['hora'] = fila['hora']
+            for p in ('p50', 'p90', 'p95'):
+                valor = fila[f'espera_{p}']
+                datos[f'espera_{p}'] = None if valor is None else round(valor, 1)
+            datos['percentiles_al_dia'] = fila['percentiles_al_dia']
+        return datos
@@ -0,0 +1,132 @@
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import Exists, Subquery
+from django.utils import timezone
+
+from cafeteria import registro
+from qr import firmas
+from qr.models import QRActivo
+from usuarios.models import Usuario
+from . import penalizaciones
+from .codigos import asignar_codigo
+from .models import Turno, Penalizacion
+from .penalizaciones import DURACION_PENALIZACION
+
+
+class TurnoRechazado(Exception):
+    """
+    Se lanza cuando no se puede emitir un turno. Lleva el mensaje y el status
+    HTTP que cada vista devuelve al cliente.
+    """
+    def __init__(self, mensaje, status=400):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.status = status
+
+
+def cafeteria_esta_abierta(cafeteria):
+    return bool(cafeteria.estado) and cafeteria.estado.lower() in ('abierto', 'abierta')
+
+
+def consulta_chequeos(usuario, cafeteria_id, fecha, ahora, codigo_qr, con_penalizacion=True):
+    """
+    Los chequeos de la emisión en una sola fila, leída desde el usuario (la
+    cafetería sale del registro en memoria): turno duplicado, (si aplica) la
+    expiración del QR y, con con_penalizacion, la creación de la penalización
+    vigente. Con QR_MODO = 'hmac' el QR no se consulta: se valida con qr.firmas.
+    """
+    anotaciones = {
+        'duplicado': Exists(Turno.objects.filter(
+            usuario=usuario,
+            cafeteria_id=cafeteria_id,
+            fecha=fecha,
+            estado__in=Turno.ESTADOS_ACTIVOS,
+        )),
+    }
+    if con_penalizacion:
+        anotaciones['penalizado_desde'] = Subquery(
+            Penalizacion.objects.filter(
+                usuario=usuario,
+                activa=True,
+                creada_en__gte=ahora - DURACION_PENALIZACION,
+            ).order_by('-creada_en').values('creada_en')[:1]
+        )
+    if codigo_qr is not None and not firmas.modo_hmac():
+        anotaciones['qr_expiracion'] = Subquery(
+            QRActivo.objects.filter(codigo=codigo_qr, cafeteria_id=cafeteria_id)
+            .order_by('-expiracion').values('expiracion')[:1]
+        )
+    return Usuario.objects.filter(pk=usuario.pk).annotate(**anotaciones).values(*anotaciones)
+
+
+def _expiracion_qr(chequeos, cafeteria, codigo_qr, ahora):
+    if firmas.modo_hmac():
+        return firmas.expiracion_valida(codigo_qr, cafeteria.id, ahora)
+    return chequeos['qr_expiracion']
+
+
+def _insertar_turno(usuario, cafeteria, fecha):
+    # El código se asigna dentro del mismo savepoint: si el insert choca con
+    # la restricción de turno activo, el contador tampoco avanza.
+    try:
+        with transaction.atomic():
+            return Turno.objects.create(
+                usuario=usuario,
+                cafeteria=cafeteria,
+                fecha=fecha,
+                codigo_turno=asignar_codigo(cafeteria.id, fecha),
+            )
+    except IntegrityError as e:
+        raise TurnoRechazado('Ya tienes un turno para hoy') from e
+
+
+def emitir_turno(usuario, cafeteria_id=None, codigo_qr=None):
+    """
+    Emite un turno para el usuario en la cafetería indicada (o la primera si
+    no se indica). Valida QR, penalización, cafetería abierta y turno
+    duplicado en una sola consulta (la cafetería sale del registro en
+    memoria, ver cafeteria/registro.py), y deja que la restricción única de la base
+    de datos resuelva las solicitudes concurrentes del mismo usuario.
+    La penalización sale de la caché (ver penalizaciones.py) cuando está ahí:
+    un usuario penalizado se rechaza sin tocar la base de datos.
+    Lanza TurnoRechazado si no se puede emitir, con status 503 si la base de
+    datos sigue bloqueada por otro escritor pasado su timeout.
+    """
+    try:
+        return _emitir_turno(usuario, cafeteria_id, codigo_qr)
+    except OperationalError as e:
+        # SQLite: otro escritor tuvo la base más que el timeout de DATABASES
+        if 'locked' not in str(e):
+            raise
+        raise TurnoRechazado('El servicio está ocupado, intenta de nuevo en unos segundos', status=503) from e
+
+
+def _emitir_turno(usuario, cafeteria_id, codigo_qr):
+    ahora = timezone.now()
+    fecha = timezone.localdate()
+    penalizado = penalizaciones.consultar(usuario.id, ahora)
+    if penalizado:
+        raise TurnoRechazado('Usuario penalizado, no puede generar turno', status=403)
+    cafeteria = registro.primera() if cafeteria_id is None else registro.obtener(cafeteria_id)
+    if cafeteria is None:
+        if codigo_qr is not None:
+            raise TurnoRechazado('QR inválido')
+        raise TurnoRechazado('Cafetería no encontrada', status=404)
+    with transaction.atomic():
+        chequeos = consulta_chequeos(usuario, cafeteria.id, fecha, ahora, codigo_qr,
+                                     con_penalizacion=penalizado is None).get()
+        if codigo_qr is not None:
+            expiracion = _expiracion_qr(chequeos, cafeteria, codigo_qr, ahora)
+            if expiracion is None:
+                raise TurnoRechazado('QR inválido')
+            if expiracion < ahora:
+                raise TurnoRechazado('QR expirado')
+        if penalizado is None:
+            desde = chequeos['penalizado_desde']
+            penalizaciones.recordar(usuario.id, desde + DURACION_PENALIZACION if desde else None, ahora)
+            if desde:
+                raise TurnoRechazado('Usuario penalizado, no puede generar turno', status=403)
+        if not cafeteria_esta_abierta(cafeteria):
+            raise TurnoRechazado('La cafetería está cerrada')
+        if chequeos['duplicado']:
+            raise TurnoRechazado('Ya tienes un turno para hoy')
+        return _insertar_turno(usuario, cafeteria, fecha)
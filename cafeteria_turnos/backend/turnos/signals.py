@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from cafeteria.models import Cafeteria
+from qr.models import QRActivo
+from . import estadisticas
+from .cola import motor
+from .models import CambioTurno, Penalizacion, Turno
+from .penalizaciones import olvidar_al_confirmar
+from .serializers import TurnoSerializer
+from .utils import notificar_cambio_turno
+from .versiones import (claves_cambio_turno, clave_penalizaciones_usuario, clave_qr, clave_turnos,
+                        registrar_cambio)
+
+
+@receiver(post_save, sender=Turno)
+def actualizar_cola(sender, instance, **kwargs):
+    # Solo los turnos pendientes necesitan su representación en la cola
+    datos = TurnoSerializer(instance).data if instance.estado == 'pendiente' else None
+    transicion = {'id': instance.id, 'codigo_turno': instance.codigo_turno, 'estado': instance.estado}
+    registrar_cambio(*claves_cambio_turno(instance.cafeteria_id, usuario_ids=[instance.usuario_id]))
+    CambioTurno.anotar([(instance.id, instance.cafeteria_id, instance.fecha)])
+
+    def confirmar():
+        motor.registrar(instance, datos)
+        notificar_cambio_turno(instance.cafeteria_id, [transicion])
+    transaction.on_commit(confirmar)
+
+
+@receiver(post_delete, sender=Turno)
+def quitar_de_cola(sender, instance, **kwargs):
+    transicion = {'id': instance.id, 'codigo_turno': instance.codigo_turno, 'estado': 'eliminado'}
+    registrar_cambio(*claves_cambio_turno(instance.cafeteria_id, usuario_ids=[instance.usuario_id]))
+    # Sus cambios anteriores ya no sirven: queda solo la baja, insertada
+    # primero para no liberar el id más alto (ver CambioTurno)
+    CambioTurno.anotar([(instance.id, instance.cafeteria_id, instance.fecha)], eliminado=True)
+    CambioTurno.objects.filter(turno_id=instance.id, eliminado=False).delete()
+
+    def confirmar():
+        motor.quitar(transicion['id'])
+        notificar_cambio_turno(instance.cafeteria_id, [transicion])
+    transaction.on_commit(confirmar)
+
+
+@receiver(post_save, sender=Turno)
+def actualizar_estadisticas(sender, instance, created, **kwargs):
+    actual = instance.campos_estadistica()
+    original = None if created else getattr(instance, '_estadistica_original', None)
+    if not created and (original is None or actual is None):
+        # No se sabe qué aportaba antes (instancia armada a mano o con campos
+        # diferidos): el planificador rehace el día
+        estadisticas.marcar_dia(instance.cafeteria_id, instance.fecha)
+    elif original != actual:
+        estadisticas.turno_cambiado(original, actual)
+    instance._estadistica_original = actual
+
+
+@receiver(post_delete, sender=Turno)
+def descontar_estadisticas(sender, instance, **kwargs):
+    original = getattr(instance, '_estadistica_original', None) or instance.campos_estadistica()
+    if original is None:
+        estadisticas.marcar_dia(instance.cafeteria_id, instance.fecha)
+    else:
+        estadisticas.turno_cambiado(original, None)
+
+
+@receiver(post_save, sender=Cafeteria)
+@receiver(post_delete, sender=Cafeteria)
+def versionar_cafeteria(sender, instance, **kwargs):
+    # Los turnos llevan su cafetería anidada: también cambian
+    registrar_cambio('cafeterias', clave_turnos(), clave_turnos(instance.id))
+
+
+@receiver(post_save, sender=QRActivo)
+@receiver(post_delete, sender=QRActivo)
+def versionar_qr(sender, instance, **kwargs):
+    registrar_cambio(clave_qr(instance.cafeteria_id))
+
+
+@receiver(post_save, sender=Penalizacion)
+@receiver(post_delete, sender=Penalizacion)
+def olvidar_penalizacion(sender, instance, **kwargs):
+    olvidar_al_confirmar(instance.usuario_id)
+    registrar_cambio(clave_penalizaciones_usuario(instance.usuario_id))
@@ -1,14 +1,57 @@
+import importlib.util
+import io
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from usuarios.models import Usuario
+from cafeteria import registro
 from cafeteria.models import Cafeteria
+from notificaciones.models import Notificacion
 from qr.models import QRActivo
-from .models import Penalizacion
+from .models import CambioTurno, EstadisticaDiaria, EstadisticaPendiente, Penalizacion, Turno, TurnoArchivado
+from .serializers import PenalizacionSerializer, TurnoSerializer
+from .services import consulta_chequeos, emitir_turno, TurnoRechazado
+from .codigos import AsignadorSecuencial, AsignadorPool
+from .cola import motor
+from .archivo import archivar, rollover
+from . import estadisticas
+from .carga import SimuladorHoraPico, comparar
+from .dashboard import armar_dashboard
+from .utils import penalizar_turnos_no_reclamados, usuario_penalizado
+from .versiones import clave_turnos, clave_turnos_usuario, leer_version, registrar_cambio
+from .planificador import Planificador, RuedaTemporizadores, tomar_arriendo
+from .difusion import Coalescedor, coalescedor, GRUPO_GENERAL
+from .views import TurnosListAdminView
 from django.utils import timezone
 from datetime import timedelta
+from cafeteria_turnos.capa_canales import SQLiteChannelLayer
+from cafeteria_turnos import metricas
+from . import penalizaciones
+
+
+def limpiar_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
 
 class TurnoTests(APITestCase):
     def setUp(self):
+        # La caché de penalizaciones sobrevive entre tests que reusan ids de usuario
+        limpiar_caches()
         self.user = Usuario.objects.create_user(username="user", password="userpass", codigo_estudiantil="U1", rol="estudiante")
         self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierta", horario_apertura="08:00", horario_cierre="15:00")
         self.qr = QRActivo.objects.create(
@@ -32,4 +75,1059 @@ class TurnoTests(APITestCase):
         url = reverse('crear_turno')
         data = {"cafeteria_id": self.cafe.id, "codigo_qr": "testQR"}
         response = self.client.post(url, data)
-        self.assertEqual(response.status_code, 403)
\ No newline at end of file
+        self.assertEqual(response.status_code, 403)
+
+    def test_emision_una_consulta_de_chequeos(self):
+        registro.lista()  # Registro de cafeterías ya cargado
+        # Usuario con turnos anteriores: su contador de versión ya existe y
+        # todas las versiones van en un solo UPDATE
+        registrar_cambio(clave_turnos_usuario(self.user.id))
+        with CaptureQueriesContext(connection) as ctx:
+            emitir_turno(self.user, cafeteria_id=self.cafe.id, codigo_qr="testQR")
+        sentencias = [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        # Chequeos + contador del código (UPDATE ... RETURNING, y el primero del
+        # día INSERT) + insert del turno + versiones del GET condicional + fila
+        # del registro de cambios. Ningún contador global de por medio, y la
+        # estadística de la hora se suma al confirmar, fuera de la transacción.
+        self.assertEqual(len(sentencias), 6)
+        self.assertTrue(sentencias[0].startswith('SELECT'))
+        self.assertTrue(sentencias[1].endswith('RETURNING valor'))
+        self.assertTrue(sentencias[3].startswith('INSERT INTO "turnos_turno"'))
+        self.assertTrue(sentencias[4].startswith('UPDATE "turnos_contadorturno"'))
+        self.assertTrue(sentencias[5].startswith('INSERT INTO "turnos_cambioturno"'))
+        self.assertFalse([sql for sql in sentencias if 'cambios:turnos' in sql])
+        # Con el registro caliente la cafetería no se consulta
+        self.assertFalse([sql for sql in sentencias if '"cafeteria_cafeteria"' in sql])
+
+    def test_registro_de_cafeterias_se_invalida(self):
+        registro.lista()
+        self.cafe.estado = "cerrado"
+        self.cafe.save()
+        with self.assertRaisesMessage(TurnoRechazado, 'La cafetería está cerrada'):
+            emitir_turno(self.user, cafeteria_id=self.cafe.id)
+        # Un cambio de otro proceso (sin señal) se ve al revalidar por updated_at
+        Cafeteria.objects.filter(pk=self.cafe.pk).update(estado="abierto", updated_at=timezone.now())
+        with override_settings(CAFETERIA_REGISTRO_REVALIDAR_SEGUNDOS=0):
+            self.assertEqual(emitir_turno(self.user, cafeteria_id=self.cafe.id).cafeteria.estado, "abierto")
+
+    def test_turno_duplicado(self):
+        emitir_turno(self.user, cafeteria_id=self.cafe.id)
+        self.client.force_authenticate(user=self.user)
+        url = reverse('crear_turno')
+        data = {"cafeteria_id": self.cafe.id, "codigo_qr": "testQR"}
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["mensaje"], "Ya tienes un turno para hoy")
+
+class CachePenalizacionesTests(APITestCase):
+    def setUp(self):
+        limpiar_caches()
+        self.user = Usuario.objects.create_user(username="user", password="userpass", codigo_estudiantil="U1", rol="estudiante")
+        self.admin = Usuario.objects.create_superuser(username="admin", password="adminpass", codigo_estudiantil="A1")
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierta", horario_apertura="08:00", horario_cierre="15:00")
+
+    def _penalizar(self):
+        Penalizacion.objects.create(usuario=self.user, fecha=timezone.localdate(), motivo="Test", activa=True)
+        with self.assertRaises(TurnoRechazado):
+            emitir_turno(self.user, cafeteria_id=self.cafe.id)
+
+    def test_penalizado_en_cache_se_rechaza_sin_consultas(self):
+        self._penalizar()
+        with self.assertNumQueries(0):
+            with self.assertRaises(TurnoRechazado) as ctx:
+                emitir_turno(self.user, cafeteria_id=self.cafe.id)
+        self.assertEqual(ctx.exception.status, 403)
+        self.assertTrue(usuario_penalizado(self.user))
+
+    def test_no_penalizado_en_cache_omite_el_chequeo(self):
+        self.assertFalse(usuario_penalizado(self.user))
+        with CaptureQueriesContext(connection) as ctx:
+            emitir_turno(self.user, cafeteria_id=self.cafe.id)
+        self.assertNotIn('turnos_penalizacion', ctx.captured_queries[0]['sql'])
+
+    def test_despenalizar_invalida_la_cache(self):
+        self._penalizar()
+        turno = Turno.objects.create(usuario=self.user, cafeteria=self.cafe, codigo_turno="P1", fecha=timezone.localdate(), estado="penalizado")
+        self.client.force_authenticate(user=self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('despenalizar_turno_admin', args=[turno.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(usuario_penalizado(self.user))
+
+    def test_eliminar_penalizacion_invalida_la_cache(self):
+        self._penalizar()
+        penalizacion = Penalizacion.objects.get(usuario=self.user)
+        self.client.force_authenticate(user=self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('penalizacion_delete_admin', args=[penalizacion.id]))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(usuario_penalizado(self.user))
+
+    def test_penalizacion_masiva_invalida_la_cache(self):
+        self.assertFalse(usuario_penalizado(self.user))
+        turno = Turno.objects.create(usuario=self.user, cafeteria=self.cafe, codigo_turno="P1", fecha=timezone.localdate())
+        Turno.objects.filter(pk=turno.pk).update(generado_en=timezone.now() - timedelta(minutes=1))
+        with mock.patch.object(coalescedor, 'agregar'), self.captureOnCommitCallbacks(execute=True):
+            penalizar_turnos_no_reclamados()
+        self.assertTrue(usuario_penalizado(self.user))
+
+    def test_invalidacion_llega_a_otro_proceso(self):
+        # Dos cachés sobre el mismo directorio hacen del planificador y de un worker web
+        directorio = tempfile.mkdtemp()
+        planificador, worker = FileBasedCache(directorio, {}), FileBasedCache(directorio, {})
+        ahora = timezone.now()
+        with mock.patch.object(penalizaciones, '_cache', return_value=worker):
+            self.assertFalse(usuario_penalizado(self.user))
+            self.assertIs(penalizaciones.consultar(self.user.id, ahora), False)
+        with mock.patch.object(penalizaciones, '_cache', return_value=planificador):
+            with self.captureOnCommitCallbacks(execute=True):
+                Penalizacion.objects.create(usuario=self.user, fecha=timezone.localdate(), motivo="Test", activa=True)
+        with mock.patch.object(penalizaciones, '_cache', return_value=worker):
+            self.assertIsNone(penalizaciones.consultar(self.user.id, ahora))
+            self.assertTrue(usuario_penalizado(self.user))
+        with mock.patch.object(penalizaciones, '_cache', return_value=planificador):
+            with self.captureOnCommitCallbacks(execute=True):
+                Penalizacion.objects.filter(usuario=self.user).delete()
+        with mock.patch.object(penalizaciones, '_cache', return_value=worker):
+            self.assertFalse(usuario_penalizado(self.user))
+
+class EmisionConcurrenteTests(TransactionTestCase):
+    def setUp(self):
+        limpiar_caches()
+        # La difusión por WebSocket no es parte de esta prueba
+        patcher = mock.patch.object(coalescedor, 'agregar')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+        self.usuarios = [
+            Usuario.objects.create(username=f"u{i}", codigo_estudiantil=f"C{i}", rol="estudiante")
+            for i in range(20)
+        ]
+
+    def _emitir(self, usuario):
+        # Como el cliente: con la base ocupada la emisión contesta 503 y se reintenta
+        try:
+            while True:
+                try:
+                    emitir_turno(usuario, cafeteria_id=self.cafe.id)
+                    return 'creado'
+                except TurnoRechazado as e:
+                    if e.status != 503:
+                        return e.mensaje
+                time.sleep(0.005)
+        finally:
+            connection.close()
+
+    def test_emisiones_concurrentes_un_turno_por_usuario(self):
+        # 300 solicitudes en paralelo: 15 toques simultáneos por cada usuario
+        solicitudes = [u for u in self.usuarios for _ in range(15)]
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            resultados = list(pool.map(self._emitir, solicitudes))
+        self.assertEqual(resultados.count('creado'), len(self.usuarios))
+        self.assertEqual(set(resultados) - {'creado'}, {'Ya tienes un turno para hoy'})
+        self.assertEqual(Turno.objects.count(), len(self.usuarios))
+        for usuario in self.usuarios:
+            self.assertEqual(Turno.objects.filter(usuario=usuario).count(), 1)
+        # Las sumas que chocaron con la base ocupada van con la siguiente
+        estadisticas._sumar_filas([])
+        self.assertEqual(sum(EstadisticaDiaria.objects.values_list('emitidos', flat=True)), len(self.usuarios))
+
+    def test_base_bloqueada_contesta_503_sin_esperar(self):
+        bloqueada = OperationalError('database is locked')
+        with mock.patch('turnos.services._emitir_turno', side_effect=bloqueada) as emitir:
+            with self.assertRaises(TurnoRechazado) as contexto:
+                emitir_turno(self.usuarios[0], cafeteria_id=self.cafe.id)
+        self.assertEqual(contexto.exception.status, 503)
+        # Un solo intento: la espera es el timeout de SQLite, no reintentos en la solicitud
+        self.assertEqual(emitir.call_count, 1)
+
+
+class AsignadorCodigoTests(APITestCase):
+    def setUp(self):
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+        self.hoy = timezone.localdate()
+
+    def test_secuencial_por_cafeteria_y_dia(self):
+        asignador = AsignadorSecuencial()
+        prefijo = asignador.prefijo(self.cafe.id)
+        self.assertEqual(asignador.asignar(self.cafe.id, self.hoy), f"{prefijo}-001")
+        self.assertEqual(asignador.asignar(self.cafe.id, self.hoy), f"{prefijo}-002")
+        self.assertEqual(asignador.asignar(self.cafe.id, self.hoy + timedelta(days=1)), f"{prefijo}-001")
+
+    def test_pool_sin_repetidos(self):
+        asignador = AsignadorPool()
+        codigos = [asignador.asignar(self.cafe.id, self.hoy) for _ in range(2000)]
+        self.assertEqual(len(set(codigos)), len(codigos))
+        self.assertTrue(all(len(c) == 6 and c.isalnum() for c in codigos))
+
+    def test_asignar_sin_consultar_turnos(self):
+        with CaptureQueriesContext(connection) as ctx:
+            AsignadorPool().asignar(self.cafe.id, self.hoy)
+            AsignadorSecuencial().asignar(self.cafe.id, self.hoy)
+        self.assertFalse(any('turnos_turno"' in q['sql'] for q in ctx.captured_queries))
+
+
+class ColaTurnosTests(APITestCase):
+    def setUp(self):
+        limpiar_caches()
+        # La difusión corre en un timer aparte y no es parte de esta prueba
+        patcher = mock.patch.object(coalescedor, 'agregar')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        motor.invalidar()
+        self.admin = Usuario.objects.create_superuser(username="admin", password="adminpass", codigo_estudiantil="A1", rol="admin")
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+        self.usuarios = [
+            Usuario.objects.create_user(username=f"u{i}", password="x", codigo_estudiantil=f"C{i}", rol="estudiante")
+            for i in range(3)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.turnos = [emitir_turno(u, cafeteria_id=self.cafe.id) for u in self.usuarios]
+
+    def tearDown(self):
+        motor.invalidar()
+
+    def test_turno_actual_sin_consultas_en_estado_estable(self):
+        url = reverse('turno_actual')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data["id"], self.turnos[0].id)
+        self.assertEqual(response.data["codigo_turno"], self.turnos[0].codigo_turno)
+
+    def test_posicion_se_actualiza_al_pasar_turno(self):
+        self.client.force_authenticate(user=self.usuarios[2])
+        url = reverse('posicion_turno', args=[self.turnos[2].id])
+        self.assertEqual(self.client.get(url).data["posicion"], 3)
+
+        self.client.force_authenticate(user=self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('pasar_turno', args=[self.turnos[0].id]))
+
+        self.client.force_authenticate(user=self.usuarios[2])
+        response = self.client.get(url)
+        self.assertEqual(response.data["posicion"], 2)
+        self.assertEqual(response.data["total"], 2)
+
+    def test_posicion_de_turno_ajeno(self):
+        self.client.force_authenticate(user=self.usuarios[0])
+        response = self.client.get(reverse('posicion_turno', args=[self.turnos[2].id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_siguientes(self):
+        response = self.client.get(reverse('cola_turnos'), {"cafeteria_id": self.cafe.id, "n": 2})
+        self.assertEqual(response.data["total"], 3)
+        self.assertEqual([t["id"] for t in response.data["siguientes"]], [t.id for t in self.turnos[:2]])
+
+    @override_settings(TURNOS_COLA_RESINCRONIZAR_SEGUNDOS=10)
+    def test_resincroniza_solo_con_cambios_de_otro_proceso(self):
+        motor.posicion(self.turnos[0].id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.turnos[0].estado = 'usado'
+            self.turnos[0].save()
+        with mock.patch.object(motor, '_leer', wraps=motor._leer) as leer:
+            # Vencido el plazo, los cambios propios no obligan a recargar: un SELECT de ids
+            motor._cargado_en -= 60
+            with self.assertNumQueries(1):
+                self.assertEqual(motor.posicion(self.turnos[1].id)[2:], (1, 2))
+            leer.assert_not_called()
+            # Otro worker pasó el turno: esa fila no la anotó este proceso
+            Turno.objects.filter(id=self.turnos[1].id).update(estado='usado')
+            CambioTurno.objects.create(turno_id=self.turnos[1].id, cafeteria_id=self.cafe.id, fecha=self.turnos[1].fecha)
+            motor._cargado_en -= 60
+            self.assertEqual(motor.posicion(self.turnos[2].id)[2:], (1, 1))
+            leer.assert_called_once()
+
+    def test_cambios_durante_la_reconstruccion_no_se_pierden(self):
+        leer = motor._leer
+        nuevo = Usuario.objects.create_user(username="nuevo", password="x", codigo_estudiantil="C9", rol="estudiante")
+
+        def leer_con_cambios():
+            colas, indice = leer()
+            # Otro hilo confirma cambios después de la lectura y antes del reemplazo
+            with self.captureOnCommitCallbacks(execute=True):
+                self.turnos[0].estado = 'usado'
+                self.turnos[0].save()
+                self.extra = emitir_turno(nuevo, cafeteria_id=self.cafe.id)
+            return colas, indice
+        with mock.patch.object(motor, '_leer', side_effect=leer_con_cambios):
+            motor.reconstruir()
+        self.assertIsNone(motor.posicion(self.turnos[0].id))
+        self.assertEqual(motor.posicion(self.extra.id)[2:], (3, 3))
+
+
+class PenalizacionMasivaTests(APITestCase):
+    def setUp(self):
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+        self.usuarios = [
+            Usuario.objects.create(username=f"u{i}", codigo_estudiantil=f"C{i}", rol="estudiante")
+            for i in range(30)
+        ]
+        hoy = timezone.localdate()
+        for usuario in self.usuarios:
+            for dias in range(2):
+                Turno.objects.create(usuario=usuario, cafeteria=self.cafe, fecha=hoy - timedelta(days=dias))
+        Turno.objects.update(generado_en=timezone.now() - timedelta(minutes=1))
+        # El UPDATE no pasa por las señales: las estadísticas se rehacen
+        estadisticas.reconstruir(hoy - timedelta(days=1), hoy)
+        # Un usuario ya penalizado hace poco no recibe otra penalización
+        Penalizacion.objects.create(usuario=self.usuarios[0], fecha=hoy, motivo="Previa", activa=True)
+
+    def test_penaliza_por_conjuntos(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resultado = penalizar_turnos_no_reclamados()
+        self.assertEqual(resultado, {'turnos_penalizados': 60, 'penalizaciones_creadas': 29})
+        self.assertEqual(Turno.objects.filter(estado='penalizado').count(), 60)
+        self.assertEqual(Penalizacion.objects.filter(usuario=self.usuarios[0]).count(), 1)
+        self.assertEqual(Penalizacion.objects.count(), 30)
+        # SELECT de vencidos, SELECT de ya penalizados, UPDATE, un INSERT en el
+        # registro de cambios, un INSERT y las versiones:
+        # un UPDATE y, como es la primera penalización de estos usuarios, un
+        # SELECT, un INSERT y un UPDATE para sus contadores nuevos
+        sentencias = [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        # (las estadísticas se suman al confirmar)
+        self.assertEqual(len(sentencias), 9)
+
+    def test_turnos_recientes_no_se_penalizan(self):
+        Turno.objects.update(generado_en=timezone.now())
+        self.assertEqual(penalizar_turnos_no_reclamados()['turnos_penalizados'], 0)
+
+
+class PlanificadorTests(APITestCase):
+    def test_run_scheduler_exige_capa_compartida(self):
+        with mock.patch('asyncio.run') as correr:
+            with self.assertRaisesMessage(CommandError, 'configure CANALES_RUTA'):
+                call_command('run_scheduler', stdout=io.StringIO())
+            correr.assert_not_called()
+            with tempfile.TemporaryDirectory() as carpeta, override_settings(CHANNEL_LAYERS={'default': {
+                    'BACKEND': 'cafeteria_turnos.capa_canales.SQLiteChannelLayer',
+                    'CONFIG': {'ruta': os.path.join(carpeta, 'canales.sqlite3')}}}):
+                call_command('run_scheduler', stdout=io.StringIO())
+            correr.assert_called_once()
+            correr.call_args[0][0].close()
+
+    def test_rueda_dispara_a_su_hora(self):
+        rueda = RuedaTemporizadores(tick=1.0, ranuras=8)
+        rueda.agregar('a', 102.5)
+        rueda.agregar('b', 120.0)  # Más de una vuelta de la rueda
+        rueda.agregar('c', 104.0)
+        rueda.cancelar('c')
+        self.assertEqual(rueda.avanzar(100.0), [])
+        self.assertEqual(rueda.avanzar(102.9), [])
+        self.assertEqual(rueda.avanzar(103.0), [('a', None)])
+        self.assertEqual(rueda.avanzar(112.0), [])
+        self.assertEqual(rueda.avanzar(125.0), [('b', None)])
+        self.assertEqual(len(rueda), 0)
+
+    def test_arriendo_un_solo_titular(self):
+        ahora = timezone.now()
+        duracion = timedelta(seconds=15)
+        self.assertTrue(tomar_arriendo('prueba', 'A', duracion, ahora))
+        self.assertFalse(tomar_arriendo('prueba', 'B', duracion, ahora + timedelta(seconds=5)))
+        self.assertTrue(tomar_arriendo('prueba', 'A', duracion, ahora + timedelta(seconds=5)))
+        self.assertTrue(tomar_arriendo('prueba', 'B', duracion, ahora + timedelta(seconds=21)))
+
+    def test_paso_penaliza_y_rota_qr(self):
+        cafe = Cafeteria.objects.create(nombre="Central", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+        user = Usuario.objects.create(username="u", codigo_estudiantil="U1")
+        turno = Turno.objects.create(usuario=user, cafeteria=cafe, fecha=timezone.localdate())
+        planificador = Planificador(titular="test")
+        ahora = timezone.now()
+        planificador.paso(ahora)
+        # Sin QR vigente: se genera en el siguiente tick
+        planificador.paso(ahora + timedelta(seconds=1))
+        self.assertTrue(QRActivo.objects.filter(cafeteria=cafe, expiracion__gt=ahora).exists())
+        turno.refresh_from_db()
+        self.assertEqual(turno.estado, 'pendiente')
+
+        planificador.paso(ahora + timedelta(seconds=31))
+        turno.refresh_from_db()
+        self.assertEqual(turno.estado, 'penalizado')
+        self.assertTrue(Penalizacion.objects.filter(usuario=user).exists())
+
+
+class ArchivoTurnosTests(APITestCase):
+    def setUp(self):
+        self.admin = Usuario.objects.create_superuser(username="admin", password="adminpass", codigo_estudiantil="A1", rol="admin")
+        self.user = Usuario.objects.create_user(username="user", password="userpass", codigo_estudiantil="U1")
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+        self.hoy = timezone.localdate()
+        self.turnos = {
+            dias: Turno.objects.create(usuario=self.user, cafeteria=self.cafe, fecha=self.hoy - timedelta(days=dias),
+                                       codigo_turno=f"A-{dias:03d}")
+            for dias in (0, 1, 10, 20)
+        }
+
+    @override_settings(TURNOS_ARCHIVO_DIAS=7)
+    def test_rollover_expira_y_archiva(self):
+        version = leer_version(clave_turnos())
+        ultimo_cambio = CambioTurno.objects.order_by('-id').values_list('id', flat=True).first()
+        # Una baja de hace un mes ya no le sirve a ningún cliente
+        CambioTurno.objects.create(turno_id=999, cafeteria_id=self.cafe.id, fecha=self.hoy - timedelta(days=30),
+                                   eliminado=True, creado_en=timezone.now() - timedelta(days=30))
+        with self.captureOnCommitCallbacks(execute=True):
+            resultado = rollover()
+        self.assertEqual(resultado, {'expirados': 3, 'archivados': 2, 'lotes': 1, 'pendiente': False})
+        self.assertGreater(leer_version(clave_turnos()), version)
+        self.assertEqual(Turno.objects.get(id=self.turnos[0].id).estado, 'pendiente')
+        ayer = Turno.objects.get(id=self.turnos[1].id)
+        self.assertEqual(ayer.estado, 'expirado')
+        self.assertTrue(CambioTurno.objects.filter(turno_id=ayer.id, id__gt=ultimo_cambio, eliminado=False).exists())
+        self.assertEqual(set(Turno.objects.values_list('id', flat=True)), {self.turnos[0].id, self.turnos[1].id})
+        archivado = TurnoArchivado.objects.get(id=self.turnos[10].id)
+        self.assertEqual((archivado.estado, archivado.codigo_turno), ('expirado', 'A-010'))
+        # Los archivados quedan en el registro solo como bajas; la vieja se depuró
+        self.assertEqual(
+            sorted(CambioTurno.objects.filter(eliminado=True).values_list('turno_id', flat=True)),
+            [self.turnos[10].id, self.turnos[20].id])
+        self.assertFalse(CambioTurno.objects.filter(turno_id__in=[self.turnos[10].id, self.turnos[20].id],
+                                                    eliminado=False).exists())
+        # Sin nada que hacer, otra pasada no cambia nada
+        self.assertEqual(rollover(), {'expirados': 0, 'archivados': 0, 'lotes': 0, 'pendiente': False})
+
+    @override_settings(TURNOS_ARCHIVO_DIAS=7)
+    def test_archivar_por_lotes(self):
+        self.assertEqual(archivar(lote=1, max_lotes=1), {'archivados': 1, 'lotes': 1, 'pendiente': True})
+        self.assertEqual(archivar(lote=1), {'archivados': 1, 'lotes': 1, 'pendiente': False})
+        self.assertEqual(TurnoArchivado.objects.count(), 2)
+
+    @override_settings(TURNOS_ARCHIVO_DIAS=7)
+    def test_lecturas_incluyen_el_archivo(self):
+        archivar()
+        self.client.force_authenticate(user=self.user)
+        mios = self.client.get(reverse('turnos_usuario')).data
+        self.assertEqual([t['id'] for t in mios], [self.turnos[d].id for d in (20, 10, 1, 0)])
+        dashboard = self.client.get(reverse('dashboard_estudiante')).data
+        self.assertEqual(len(dashboard['historial']), 4)
+
+        self.client.force_authenticate(user=self.admin)
+        fecha = (self.hoy - timedelta(days=10)).isoformat()
+        listado = self.client.get(reverse('turnos_list_admin'), {'fecha': fecha}).data
+        self.assertEqual([t['id'] for t in listado], [self.turnos[10].id])
+        detalle = self.client.get(reverse('turno_detail_admin', args=[self.turnos[20].id]))
+        self.assertEqual(detalle.data['codigo_turno'], 'A-020')
+        self.assertEqual(self.client.get(reverse('turno_detail_admin', args=[999999])).status_code, 404)
+
+    @override_settings(TURNOS_ARCHIVO_DIAS=None)
+    def test_archivo_desactivado(self):
+        self.assertEqual(rollover()['archivados'], 0)
+        self.assertEqual(Turno.objects.count(), 4)
+
+
+class EstadisticasTests(APITestCase):
+    def setUp(self):
+        self.admin = Usuario.objects.create_superuser(username="admin", password="adminpass", codigo_estudiantil="A1", rol="admin")
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+        self.usuarios = [Usuario.objects.create(username=f"u{i}", codigo_estudiantil=f"C{i}") for i in range(6)]
+        self.hoy = timezone.localdate()
+        # La difusión corre en un timer aparte y no es parte de esta prueba
+        patcher = mock.patch.object(coalescedor, 'agregar')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Las sumas se aplican al confirmar
+        with self.captureOnCommitCallbacks(execute=True):
+            self.turnos = [Turno.objects.create(usuario=u, cafeteria=self.cafe, fecha=self.hoy) for u in self.usuarios]
+            for turno, segundos, estado in zip(self.turnos, (10, 20, 30, 40), ('usado', 'usado', 'entregado', 'usado')):
+                turno.estado = estado
+                turno.reclamado_en = turno.generado_en + timedelta(seconds=segundos)
+                turno.save()
+
+    def _filas(self):
+        return sorted(EstadisticaDiaria.objects.values(
+            'cafeteria_id', 'fecha', 'hora', *estadisticas.CONTADORES, 'espera_p50', 'espera_p95'))
+
+    def test_contadores_iguales_a_reconstruir(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Turno.objects.filter(id=self.turnos[3].id).get().delete()
+            penalizar_turnos_no_reclamados(timezone.now() + timedelta(minutes=1))
+            turno = Turno.objects.get(id=self.turnos[5].id)
+            turno.estado = 'expirado'
+            turno.save(update_fields=['estado'])
+        estadisticas.recalcular_percentiles()
+        incremental = self._filas()
+        self.assertEqual(sum(fila['emitidos'] for fila in incremental), 5)
+        self.assertEqual(sum(fila['reclamados'] for fila in incremental), 3)
+        self.assertEqual(sum(fila['penalizados'] for fila in incremental), 1)
+        self.assertEqual(sum(fila['expirados'] for fila in incremental), 1)
+        estadisticas.reconstruir(self.hoy, self.hoy)
+        self.assertEqual(self._filas(), incremental)
+
+    def test_sin_original_marca_el_dia_para_el_planificador(self):
+        antes = self._filas()
+        # Con campos diferidos no se sabe qué aportaba: la señal solo marca el día
+        turno = Turno.objects.only('id', 'usuario', 'cafeteria', 'fecha', 'estado').get(id=self.turnos[5].id)
+        turno.estado = 'expirado'
+        with CaptureQueriesContext(connection) as consultas:
+            turno.save(update_fields=['estado'])
+        self.assertFalse([c for c in consultas.captured_queries if 'estadisticadiaria' in c['sql']])
+        self.assertEqual(self._filas(), antes)
+        otro = Turno.objects.only('id', 'usuario', 'cafeteria', 'fecha', 'estado').get(id=self.turnos[4].id)
+        otro.save(update_fields=['estado'])
+        self.assertEqual(EstadisticaPendiente.objects.count(), 1)
+        Planificador(titular="test").percentiles_estadisticas(timezone.now())
+        self.assertFalse(EstadisticaPendiente.objects.exists())
+        self.assertEqual(sum(fila['expirados'] for fila in self._filas()), 1)
+
+    def test_suma_fuera_de_la_transaccion_del_cambio(self):
+        turno = Turno.objects.get(id=self.turnos[5].id)
+        turno.estado = 'expirado'
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as consultas:
+            turno.save(update_fields=['estado'])
+        self.assertFalse([c for c in consultas.captured_queries if 'estadisticadiaria' in c['sql']])
+        self.assertEqual(sum(fila['expirados'] for fila in self._filas()), 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(sum(fila['expirados'] for fila in self._filas()), 1)
+
+    def test_guardar_sin_cambios_no_toca_estadisticas(self):
+        turno = Turno.objects.get(id=self.turnos[0].id)
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as consultas:
+            turno.save()
+        self.assertFalse([c for c in consultas.captured_queries if 'estadistica' in c['sql']])
+
+    def test_percentiles(self):
+        resultado = estadisticas.percentiles({'a': [4, 1, 3, 2], 'b': [7], 'c': []})
+        self.assertEqual(set(resultado), {'a', 'b'})
+        for obtenido, esperado in zip(resultado['a'] + resultado['b'], (2.5, 3.7, 3.85, 7, 7, 7)):
+            self.assertAlmostEqual(obtenido, esperado)
+
+    @skipUnless(importlib.util.find_spec('numpy'), 'numpy no está instalado')
+    def test_percentiles_como_numpy(self):
+        import numpy as np
+        grupos = {i: list(np.random.default_rng(i).exponential(60, size=i * 7 + 1)) for i in range(20)}
+        for clave, valores in estadisticas.percentiles(grupos).items():
+            np.testing.assert_allclose(valores, np.percentile(grupos[clave], estadisticas.PERCENTILES))
+
+    def test_endpoint_sin_recorrer_turnos(self):
+        self.client.force_authenticate(user=self.admin)
+        url = reverse('estadisticas_admin')
+        datos = self.client.get(url).data
+        dia, = datos['dias']
+        self.assertEqual((dia['emitidos'], dia['reclamados'], dia['pendientes']), (6, 4, 2))
+        self.assertEqual(dia['espera_promedio'], 25.0)
+        # La respuesta solo lee las filas materializadas; los percentiles los pone al día el planificador
+        self.assertEqual([(h['espera_p50'], h['percentiles_al_dia']) for h in datos['horas']][-1], (None, False))
+        estadisticas.recalcular_percentiles()
+        with CaptureQueriesContext(connection) as consultas:
+            datos = self.client.get(url, {'desde': self.hoy.isoformat(), 'cafeteria': self.cafe.id}).data
+        self.assertFalse([c for c in consultas.captured_queries if 'turnos_turno' in c['sql']])
+        self.assertTrue(datos['horas'][-1]['percentiles_al_dia'])
+        self.assertIsNotNone(datos['horas'][-1]['espera_p50'])
+        self.assertEqual(self.client.get(url, {'desde': 'ayer'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'desde': self.hoy.isoformat(),
+                                               'hasta': (self.hoy - timedelta(days=1)).isoformat()}).status_code, 400)
+        self.client.force_authenticate(user=self.usuarios[0])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class CargaTests(TransactionTestCase):
+    # La cola en memoria se actualiza al confirmar cada transacción
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_simulacion_atiende_a_todos(self):
+        simulador = SimuladorHoraPico(estudiantes=8, admins=1, cafeterias=2, llegadas=4, atencion=2, kiosco=0.25)
+        simulador.preparar()
+        resultado = simulador.ejecutar()
+        self.assertEqual(simulador.atendidos, 8)
+        self.assertEqual(Turno.objects.filter(estado='pendiente').count(), 0)
+        self.assertEqual({nombre for nombre, medidas in resultado['endpoints'].items() if medidas['errores']}, set())
+        self.assertLessEqual({'login', 'crear turno (QR)', 'crear turno (kiosco)', 'dashboard', 'turno actual',
+                              'pasar turno', 'entregar turno'}, set(resultado['endpoints']))
+        medidas = resultado['endpoints']['login']
+        self.assertLessEqual(medidas['p50_ms'], medidas['p95_ms'])
+        self.assertLessEqual(medidas['p95_ms'], medidas['p99_ms'])
+
+    def test_comparar_con_la_linea_base(self):
+        def corrida(p95, p99, n=200, errores=0, rps=100.0):
+            return {'peticiones_por_segundo': rps,
+                    'endpoints': {'dashboard': {'n': n, 'errores': errores, 'p50_ms': 1.0, 'p95_ms': p95, 'p99_ms': p99}}}
+        base = corrida(10.0, 20.0)
+        self.assertEqual(comparar(corrida(11.9, 23.0), base), [])
+        self.assertEqual(len(comparar(corrida(12.5, 30.0), base)), 2)
+        self.assertEqual(len(comparar(corrida(10.0, 20.0, errores=1, rps=70.0), base)), 2)
+        # Diferencias por debajo de la holgura o p99 con pocas muestras no cuentan
+        self.assertEqual(comparar(corrida(0.9, 30.0, n=50), corrida(0.5, 20.0, n=50)), [])
+
+
+class DifusionTests(APITestCase):
+    def test_rafaga_se_envia_como_un_mensaje(self):
+        mensajes = []
+        coalescedor_prueba = Coalescedor(ventana=60, enviar=mensajes.append)
+        with mock.patch('turnos.difusion.estado_cafeteria', lambda cafeteria_id: {'cafeteria_id': cafeteria_id}):
+            for i in range(20):
+                coalescedor_prueba.agregar(1, [{'id': i, 'codigo_turno': f"A-{i:03d}", 'estado': 'pendiente'}])
+            # El mismo turno cambia otra vez dentro de la ventana: solo viaja su último estado
+            coalescedor_prueba.agregar(1, [{'id': 0, 'codigo_turno': "A-000", 'estado': 'usado'}])
+            coalescedor_prueba.vaciar()
+        self.assertEqual(len(mensajes), 1)
+        self.assertEqual(len(mensajes[0]['transiciones']), 20)
+        self.assertEqual(mensajes[0]['transiciones'][0]['estado'], 'usado')
+
+    def test_delta_por_channel_layer_en_memoria(self):
+        motor.invalidar()
+        admin = Usuario.objects.create_superuser(username="admin", password="adminpass", codigo_estudiantil="A1", rol="admin")
+        cafe = Cafeteria.objects.create(nombre="Central", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+        usuarios = [Usuario.objects.create(username=f"u{i}", codigo_estudiantil=f"C{i}") for i in range(2)]
+        channel_layer = get_channel_layer()
+        canal = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(GRUPO_GENERAL, canal)
+
+        with mock.patch.object(coalescedor, 'ventana', 60):
+            with self.captureOnCommitCallbacks(execute=True):
+                turnos = [emitir_turno(u, cafeteria_id=cafe.id) for u in usuarios]
+            self.client.force_authenticate(user=admin)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('pasar_turno', args=[turnos[0].id]))
+            coalescedor.vaciar()
+
+        mensaje = async_to_sync(channel_layer.receive)(canal)
+        self.assertEqual(mensaje['type'], 'turno_cambiado')
+        self.assertEqual(mensaje['cafeteria_id'], cafe.id)
+        self.assertEqual(mensaje['turno_actual']['id'], turnos[1].id)
+        self.assertEqual(mensaje['en_cola'], 1)
+        estados = {t['id']: t['estado'] for t in mensaje['transiciones']}
+        self.assertEqual(estados, {turnos[0].id: 'usado', turnos[1].id: 'pendiente'})
+        async_to_sync(channel_layer.group_discard)(GRUPO_GENERAL, canal)
+        motor.invalidar()
+
+
+
+class CapaCanalesSQLiteTests(APITestCase):
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.ruta = os.path.join(directorio, 'canales.sqlite3')
+        # Dos instancias sobre el mismo archivo hacen de dos workers distintos
+        self.worker_a = SQLiteChannelLayer(ruta=self.ruta)
+        self.worker_b = SQLiteChannelLayer(ruta=self.ruta)
+
+    def test_group_send_llega_a_otro_proceso(self):
+        canal_a = async_to_sync(self.worker_a.new_channel)()
+        canal_b = async_to_sync(self.worker_b.new_channel)()
+        async_to_sync(self.worker_a.group_add)('pantallas', canal_a)
+        async_to_sync(self.worker_b.group_add)('pantallas', canal_b)
+
+        async_to_sync(self.worker_a.group_send)('pantallas', {'type': 'turno_cambiado', 'n': 1})
+        self.assertEqual(async_to_sync(self.worker_b.receive)(canal_b)['n'], 1)
+        self.assertEqual(async_to_sync(self.worker_a.receive)(canal_a)['n'], 1)
+
+        async_to_sync(self.worker_b.group_discard)('pantallas', canal_b)
+        async_to_sync(self.worker_a.group_send)('pantallas', {'type': 'turno_cambiado', 'n': 2})
+        async_to_sync(self.worker_b.send)(canal_b, {'type': 'directo'})
+        # El canal descartado ya no recibe mensajes del grupo
+        self.assertEqual(async_to_sync(self.worker_b.receive)(canal_b)['type'], 'directo')
+        self.assertEqual(async_to_sync(self.worker_a.receive)(canal_a)['n'], 2)
+
+    def test_mensajes_en_orden_y_repartidos_por_canal(self):
+        canales = [async_to_sync(self.worker_b.new_channel)() for _ in range(3)]
+        for i in range(5):
+            for canal in canales:
+                async_to_sync(self.worker_a.send)(canal, {'type': 'x', 'i': i, 'canal': canal})
+        for canal in reversed(canales):
+            recibidos = [async_to_sync(self.worker_b.receive)(canal) for _ in range(5)]
+            self.assertEqual([m['i'] for m in recibidos], list(range(5)))
+            self.assertTrue(all(m['canal'] == canal for m in recibidos))
+
+    def test_mensaje_vencido_se_descarta(self):
+        capa = SQLiteChannelLayer(ruta=self.ruta, expiry=-1)
+        canal = async_to_sync(self.worker_b.new_channel)()
+        async_to_sync(capa.send)(canal, {'type': 'viejo'})
+        async_to_sync(self.worker_a.send)(canal, {'type': 'nuevo'})
+        self.assertEqual(async_to_sync(self.worker_b.receive)(canal)['type'], 'nuevo')
+
+    def test_sondeo_vacio_no_toma_el_lock_de_escritura(self):
+        canal = async_to_sync(self.worker_b.new_channel)()
+        prefijo = self.worker_b._prefijo(canal)
+        sentencias = []
+        self.worker_b._db().set_trace_callback(sentencias.append)
+        self.assertEqual(self.worker_b._con_lock(self.worker_b._leer, prefijo), [])
+        self.assertFalse([sql for sql in sentencias if sql.startswith('BEGIN')])
+        async_to_sync(self.worker_a.send)(canal, {'type': 'x'})
+        self.assertEqual(len(self.worker_b._con_lock(self.worker_b._leer, prefijo)), 1)
+        self.assertIn('BEGIN IMMEDIATE', sentencias)
+
+    def test_buzones_vacios_o_vencidos_se_borran(self):
+        leido, abandonado = [async_to_sync(self.worker_b.new_channel)() for _ in range(2)]
+        async_to_sync(self.worker_a.send)(leido, {'type': 'x'})
+        async_to_sync(SQLiteChannelLayer(ruta=self.ruta, expiry=0.2).send)(abandonado, {'type': 'x'})
+        self.assertEqual(async_to_sync(self.worker_b.receive)(leido)['type'], 'x')
+        # El canal abandonado (un WebSocket que se desconectó) dejó su buzón, ya vencido
+        self.assertEqual(set(self.worker_b._buzones), {abandonado})
+        time.sleep(0.25)
+        async_to_sync(self.worker_a.send)(leido, {'type': 'y'})
+        self.assertEqual(async_to_sync(self.worker_b.receive)(leido)['type'], 'y')
+        self.assertEqual(self.worker_b._buzones, {})
+
+
+class MetricasTests(APITestCase):
+    def setUp(self):
+        self.ruta = os.path.join(tempfile.mkdtemp(), 'metricas.sqlite3')
+        configuracion = override_settings(METRICAS_RUTA=self.ruta, METRICAS_TOKEN=None)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+        # Lo que otros tests dejaron pendiente va a este archivo y se descuenta
+        metricas.registro.volcar()
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierta", horario_apertura="08:00", horario_cierre="15:00")
+        self.admin = Usuario.objects.create_superuser(username="admin", password="adminpass", codigo_estudiantil="A1")
+
+    def _valor(self, muestra):
+        self.client.force_login(self.admin)
+        texto = self.client.get(reverse('metricas')).content.decode()
+        for linea in texto.splitlines():
+            if linea.startswith(muestra + ' '):
+                return float(linea.rsplit(' ', 1)[1])
+        return 0
+
+    def test_peticiones_por_vista_con_consultas(self):
+        serie = '{codigo="200",metodo="GET",vista="turno_actual"}'
+        antes = self._valor('cafeteria_peticiones_total' + serie)
+        consultas_antes = self._valor('cafeteria_peticion_consultas_sum{metodo="GET",vista="turno_actual"}')
+        for _ in range(2):
+            self.client.get(reverse('turno_actual'), {'cafeteria_id': self.cafe.id})
+        self.assertEqual(self._valor('cafeteria_peticiones_total' + serie), antes + 2)
+        self.assertGreater(self._valor('cafeteria_peticion_consultas_sum{metodo="GET",vista="turno_actual"}'),
+                           consultas_antes)
+        self.assertGreaterEqual(
+            self._valor('cafeteria_peticion_segundos_bucket{metodo="GET",vista="turno_actual",le="+Inf"}'), antes + 2)
+
+    def test_formato_de_exposicion(self):
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('metricas'))
+        self.client.get('/no-existe/')
+        self.assertTrue(respuesta['Content-Type'].startswith('text/plain; version=0.0.4'))
+        texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('# TYPE cafeteria_peticion_segundos histogram', texto)
+        self.assertIn('cafeteria_peticiones_total{codigo="404",metodo="GET",vista="sin_ruta"}', texto)
+        # Buckets acumulados y en orden, terminando en +Inf, _sum y _count
+        lineas = [linea for linea in texto.splitlines() if linea.startswith('cafeteria_peticion_segundos')
+                  and 'vista="metricas"' in linea]
+        self.assertIn('le="+Inf"', lineas[-3])
+        self.assertTrue(lineas[-2].startswith('cafeteria_peticion_segundos_sum'))
+        self.assertTrue(lineas[-1].startswith('cafeteria_peticion_segundos_count'))
+        conteos = [float(linea.rsplit(' ', 1)[1]) for linea in lineas[:-2]]
+        self.assertEqual(conteos, sorted(conteos))
+
+    def test_suma_de_varios_procesos_y_medidores_vivos(self):
+        # Dos registros sobre el mismo archivo hacen de dos workers distintos
+        worker_a, worker_b = metricas.Registro(), metricas.Registro()
+        for worker in (worker_a, worker_b):
+            worker.observar('cafeteria_tarea_segundos', 0.02, tarea='prueba')
+            worker.ajustar('cafeteria_websockets_abiertos', 2, consumidor='prueba')
+            worker.volcar()
+        worker_b.ajustar('cafeteria_websockets_abiertos', -1, consumidor='prueba')
+        worker_b.volcar()
+        self.assertEqual(self._valor('cafeteria_tarea_segundos_count{tarea="prueba"}'), 2)
+        self.assertEqual(self._valor('cafeteria_tarea_segundos_bucket{tarea="prueba",le="0.01"}'), 0)
+        self.assertEqual(self._valor('cafeteria_tarea_segundos_bucket{tarea="prueba",le="0.025"}'), 2)
+        self.assertEqual(self._valor('cafeteria_websockets_abiertos{consumidor="prueba"}'), 3)
+        # El medidor de un proceso que dejó de volcar no cuenta
+        with mock.patch('cafeteria_turnos.metricas.time.time', return_value=timezone.now().timestamp() - 3600):
+            worker_a.volcar()
+        self.assertEqual(self._valor('cafeteria_websockets_abiertos{consumidor="prueba"}'), 1)
+
+    def test_tarea_con_error(self):
+        with self.assertRaises(ValueError), metricas.tarea('prueba_error'):
+            raise ValueError
+        self.assertEqual(self._valor('cafeteria_tarea_errores_total{tarea="prueba_error"}'), 1)
+        self.assertEqual(self._valor('cafeteria_tarea_segundos_count{tarea="prueba_error"}'), 1)
+
+    def test_solo_admins(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 401)
+        estudiante = Usuario.objects.create_user(username="e", password="epass", codigo_estudiantil="E1")
+        token = self.client.post(reverse('token_obtain_pair'), {'username': 'e', 'password': 'epass'}).data['access']
+        self.assertEqual(self.client.get(reverse('metricas'), HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 403)
+        self.client.force_login(estudiante)
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+        self.client.logout()
+        token = self.client.post(reverse('token_obtain_pair'), {'username': 'admin', 'password': 'adminpass'}).data['access']
+        self.assertEqual(self.client.get(reverse('metricas'), HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 200)
+
+    @override_settings(METRICAS_TOKEN='secreto')
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer otro').status_code, 401)
+        respuesta = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(respuesta.status_code, 200)
+
+
+class DashboardTests(APITestCase):
+    def setUp(self):
+        limpiar_caches()
+        motor.invalidar()
+        self.addCleanup(motor.invalidar)
+        self.user = Usuario.objects.create_user(username="user", password="userpass", codigo_estudiantil="U1", rol="estudiante")
+        self.otro = Usuario.objects.create_user(username="otro", password="otropass", codigo_estudiantil="U2", rol="estudiante")
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+        self.client.force_authenticate(user=self.user)
+
+    def test_todo_el_panel_en_una_respuesta(self):
+        emitir_turno(self.otro, cafeteria_id=self.cafe.id)
+        turno = emitir_turno(self.user, cafeteria_id=self.cafe.id)
+        Penalizacion.objects.create(usuario=self.user, fecha=timezone.localdate(), motivo="Prueba")
+        motor.invalidar()
+        motor.reconstruir()
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('dashboard_estudiante'))
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(consultas), 3)
+        self.assertEqual(response.data['turno_hoy']['id'], turno.id)
+        self.assertEqual(response.data['posicion'], {'posicion': 2, 'delante': 1, 'total': 2})
+        self.assertEqual(response.data['penalizacion']['motivo'], "Prueba")
+        self.assertGreater(response.data['penalizacion']['restante_segundos'], 0)
+        self.assertEqual([t['id'] for t in response.data['historial']], [turno.id])
+        self.assertEqual(response.data['cafeterias'][0]['id'], self.cafe.id)
+
+    def test_version_sin_cambios(self):
+        turno = emitir_turno(self.user, cafeteria_id=self.cafe.id)
+        version = self.client.get(reverse('dashboard_estudiante')).data['version']
+        response = self.client.get(reverse('dashboard_estudiante'), {'version': version})
+        self.assertEqual(response.data, {'version': version, 'sin_cambios': True})
+
+        Turno.objects.filter(id=turno.id).update(estado='entregado')
+        response = self.client.get(reverse('dashboard_estudiante'), {'version': version})
+        self.assertFalse(response.data['sin_cambios'])
+        self.assertNotEqual(response.data['version'], version)
+        self.assertEqual(response.data['turno_hoy']['estado'], 'entregado')
+        self.assertIsNone(response.data['posicion'])
+
+    def test_get_condicional_con_etag(self):
+        turno = emitir_turno(self.user, cafeteria_id=self.cafe.id)
+        response = self.client.get(reverse('dashboard_estudiante'))
+        etag = response['ETag']
+        self.assertEqual(etag, f'"dashboard.{response.data["version"]}"')
+        self.assertEqual(self.client.get(reverse('dashboard_estudiante'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Turno.objects.filter(id=turno.id).update(estado='entregado')
+        response = self.client.get(reverse('dashboard_estudiante'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['turno_hoy']['estado'], 'entregado')
+
+    def test_requiere_autenticacion(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse('dashboard_estudiante'))
+        self.assertEqual(response.status_code, 401)
+
+
+class GetCondicionalTests(APITestCase):
+    def setUp(self):
+        limpiar_caches()
+        motor.invalidar()
+        self.addCleanup(motor.invalidar)
+        self.user = Usuario.objects.create_user(username="user", password="userpass", codigo_estudiantil="U1", rol="estudiante")
+        self.otro = Usuario.objects.create_user(username="otro", password="otropass", codigo_estudiantil="U2", rol="estudiante")
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+        self.turno = emitir_turno(self.user, cafeteria_id=self.cafe.id)
+        self.client.force_authenticate(user=self.user)
+
+    def test_mis_turnos_304_hasta_que_cambia_un_turno_propio(self):
+        url = reverse('turnos_usuario')
+        response = self.client.get(url)
+        etag, modificado = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=modificado).status_code, 304)
+
+        # Los turnos de los demás no invalidan la lista
+        emitir_turno(self.otro, cafeteria_id=self.cafe.id)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.turno.estado = 'usado'
+        self.turno.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_mis_turnos_cambian_con_la_cafeteria(self):
+        url = reverse('turnos_usuario')
+        etag = self.client.get(url)['ETag']
+        self.cafe.nombre = "Central renovada"
+        self.cafe.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['cafeteria']['nombre'], "Central renovada")
+
+    def test_etag_distinto_por_usuario(self):
+        etag = self.client.get(reverse('turnos_usuario'))['ETag']
+        self.client.force_authenticate(user=self.otro)
+        response = self.client.get(reverse('turnos_usuario'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_penalizacion_masiva_cambia_la_version(self):
+        url = reverse('turnos_usuario')
+        etag = self.client.get(url)['ETag']
+        Turno.objects.update(generado_en=timezone.now() - timedelta(minutes=1))
+        penalizar_turnos_no_reclamados()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['estado'], 'penalizado')
+
+    def test_turno_actual_304(self):
+        url = reverse('turno_actual')
+        etag = self.client.get(url, {'cafeteria_id': self.cafe.id})['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'cafeteria_id': self.cafe.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        motor.quitar(self.turno.id)
+        response = self.client.get(url, {'cafeteria_id': self.cafe.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data)
+
+
+class ListadoAdminTests(APITestCase):
+    def setUp(self):
+        self.admin = Usuario.objects.create_superuser(username="admin", password="adminpass", codigo_estudiantil="A1", rol="admin")
+        self.cafes = [Cafeteria.objects.create(nombre=f"Cafe {i}", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+                      for i in range(2)]
+        self.usuarios = [Usuario.objects.create(username=f"u{i}", codigo_estudiantil=f"C{i}") for i in range(6)]
+        self.hoy = timezone.localdate()
+        self.turnos = [
+            Turno.objects.create(usuario=u, cafeteria=self.cafes[i % 2], fecha=self.hoy - timedelta(days=i // 3))
+            for i, u in enumerate(self.usuarios)
+        ]
+        self.client.force_authenticate(user=self.admin)
+        self.url = reverse('turnos_list_admin')
+
+    def test_sin_parametros_devuelve_la_lista_completa(self):
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 6)
+
+    def test_paginacion_por_cursor(self):
+        response = self.client.get(self.url, {'page_size': 4})
+        self.assertEqual([t['id'] for t in response.data['results']], [t.id for t in self.turnos[::-1][:4]])
+        siguiente = self.client.get(response.data['next'])
+        self.assertEqual([t['id'] for t in siguiente.data['results']], [t.id for t in self.turnos[::-1][4:]])
+        self.assertIsNone(siguiente.data['next'])
+
+    def test_filtros(self):
+        response = self.client.get(self.url, {'fecha': self.hoy.isoformat(), 'cafeteria': self.cafes[0].id})
+        self.assertEqual({t['id'] for t in response.data}, {self.turnos[0].id, self.turnos[2].id})
+        Turno.objects.filter(id=self.turnos[1].id).update(estado='usado')
+        response = self.client.get(self.url, {'estado': 'usado,entregado'})
+        self.assertEqual([t['id'] for t in response.data], [self.turnos[1].id])
+        self.assertEqual(self.client.get(self.url, {'estado': 'otro'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'fecha': 'ayer'}).status_code, 400)
+
+    def test_since_devuelve_solo_lo_que_cambio(self):
+        inicial = self.client.get(self.url, {'since': 0}).data
+        self.assertTrue(inicial['completo'])
+        self.assertEqual(len(inicial['turnos']), 6)
+        self.assertEqual(self.client.get(self.url, {'since': inicial['siguiente']}).data['turnos'], [])
+
+        self.turnos[2].estado = 'usado'
+        self.turnos[2].save(update_fields=['estado'])
+        eliminado_id = self.turnos[4].id
+        self.turnos[4].delete()
+        cambios = self.client.get(self.url, {'since': inicial['siguiente']}).data
+        self.assertEqual([t['id'] for t in cambios['turnos']], [self.turnos[2].id])
+        self.assertEqual(cambios['turnos'][0]['estado'], 'usado')
+        self.assertEqual(cambios['eliminados'], [eliminado_id])
+        self.assertGreater(cambios['siguiente'], inicial['siguiente'])
+
+        # Una hora no sirve de marca: dos cambios en el mismo instante se perderían
+        self.assertEqual(self.client.get(self.url, {'since': self.turnos[2].actualizado_en.isoformat()}).status_code, 400)
+
+    def test_borrar_el_ultimo_cambio_no_reusa_su_id(self):
+        self.turnos[5].estado = 'usado'
+        self.turnos[5].save(update_fields=['estado'])
+        desde = self.client.get(self.url, {'since': 0}).data['siguiente']
+        turno_id = self.turnos[5].id
+        self.turnos[5].delete()
+        cambios = self.client.get(self.url, {'since': desde}).data
+        self.assertEqual(cambios['eliminados'], [turno_id])
+
+    def test_since_por_partes_no_pierde_cambios(self):
+        Turno.objects.update(generado_en=timezone.now() - timedelta(minutes=1))
+        desde = CambioTurno.objects.order_by('-id').values_list('id', flat=True).first()
+        penalizar_turnos_no_reclamados()
+        vistos = {}
+        with mock.patch.object(TurnosListAdminView, 'LIMITE_CAMBIOS', 2):
+            while True:
+                cambios = self.client.get(self.url, {'since': desde}).data
+                vistos.update((t['id'], t['estado']) for t in cambios['turnos'])
+                desde = cambios['siguiente']
+                if cambios['completo']:
+                    break
+        self.assertEqual(vistos, {t.id: 'penalizado' for t in self.turnos})
+        self.assertEqual(self.client.get(self.url, {'since': desde}).data['turnos'], [])
+
+
+class SerializacionRapidaTests(APITestCase):
+    def setUp(self):
+        self.admin = Usuario.objects.create_superuser(username="admin", password="adminpass", codigo_estudiantil="A1", rol="admin")
+        cafes = [Cafeteria.objects.create(nombre=f"Cafe {i}", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+                 for i in range(3)]
+        self.usuarios = [Usuario.objects.create(username=f"u{i}", codigo_estudiantil=f"C{i}") for i in range(20)]
+        hoy = timezone.localdate()
+        for i, usuario in enumerate(self.usuarios):
+            for dias in range(3):
+                Turno.objects.create(usuario=usuario, cafeteria=cafes[(i + dias) % 3], fecha=hoy - timedelta(days=dias))
+            Penalizacion.objects.create(usuario=usuario, fecha=hoy, motivo="Prueba")
+        Turno.objects.filter(id__in=Turno.objects.values('id')[:10]).update(estado='usado', reclamado_en=timezone.now())
+        self.client.force_authenticate(user=self.admin)
+
+    def test_mismo_json_que_el_serializer_de_modelo(self):
+        turnos = Turno.objects.order_by('id')
+        self.assertEqual(list(TurnoSerializer(turnos, many=True).data), [TurnoSerializer(t).data for t in turnos])
+        penalizaciones = Penalizacion.objects.order_by('id')
+        self.assertEqual(list(PenalizacionSerializer(penalizaciones, many=True).data),
+                         [PenalizacionSerializer(p).data for p in penalizaciones])
+
+    def test_consultas_constantes_en_los_listados(self):
+        # Contador de versión del GET condicional + una consulta con JOIN
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('turnos_list_admin'))
+        self.assertEqual(len(response.data), 60)
+        with self.assertNumQueries(2):
+            self.client.get(reverse('turnos_list_admin'), {'page_size': 25})
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('penalizaciones_list_admin'))
+        self.assertEqual(len(response.data), 20)
+        self.client.force_authenticate(user=self.usuarios[0])
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('turnos_usuario'))
+        self.assertEqual(len(response.data), 3)
+        with self.assertNumQueries(1):
+            self.client.get(reverse('penalizaciones_usuario'))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN es de SQLite')
+class PlanesDeConsultaTests(APITestCase):
+    """Ninguna consulta frecuente debe recorrer una tabla completa."""
+
+    def setUp(self):
+        self.user = Usuario.objects.create_user(username="user", password="userpass", codigo_estudiantil="U1")
+        self.cafe = Cafeteria.objects.create(nombre="Central", estado="abierto", horario_apertura="08:00", horario_cierre="15:00")
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [fila[3] for fila in cursor.fetchall()]
+
+    def assertSinRecorridoCompleto(self, queryset):
+        plan = self.plan(queryset)
+        completos = [paso for paso in plan if re.fullmatch(r'SCAN (TABLE )?\w+( AS \w+)?', paso)]
+        self.assertEqual(completos, [], '\n'.join(plan))
+
+    def test_consultas_frecuentes_usan_indices(self):
+        ahora = timezone.now()
+        hoy = timezone.localdate()
+        consultas = {
+            'chequeos de la emisión': consulta_chequeos(self.user, self.cafe.id, hoy, ahora, 'codigo'),
+            'cola de pendientes': Turno.objects.filter(estado='pendiente').order_by('fecha', 'id'),
+            'turnos vencidos': Turno.objects.filter(estado='pendiente', generado_en__lte=ahora, reclamado_en__isnull=True),
+            'pendientes del planificador': Turno.objects.filter(estado='pendiente', reclamado_en__isnull=True),
+            'mis turnos': Turno.objects.filter(usuario=self.user).order_by('-fecha', '-id'),
+            'turnos del día (admin)': Turno.objects.filter(fecha=hoy).order_by('-fecha'),
+            'cambios desde (admin)': CambioTurno.objects.filter(id__gt=10).order_by('id'),
+            'usuario penalizado': Penalizacion.objects.filter(usuario=self.user, activa=True, creada_en__gte=ahora),
+            'QR vigente': QRActivo.objects.filter(cafeteria=self.cafe, expiracion__gt=ahora),
+            'validar QR': QRActivo.objects.filter(codigo='codigo', cafeteria=self.cafe),
+            'bandeja de notificaciones': Notificacion.objects.filter(usuario=self.user).order_by('-enviada_en'),
+        }
+        for nombre, queryset in consultas.items():
+            with self.subTest(nombre):
+                self.assertSinRecorridoCompleto(queryset)
+
+    def test_detecta_recorrido_completo(self):
+        with self.assertRaises(AssertionError):
+            self.assertSinRecorridoCompleto(Turno.objects.filter(codigo_turno='A-001'))
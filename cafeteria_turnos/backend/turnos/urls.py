@@ -5,7 +5,8 @@ from .views import (
     TurnosListAdminView, TurnoDetailAdminView, TurnoDeleteView,
     PenalizacionesListAdminView, PenalizacionDeleteView,
     TurnoActualView, DespenalizarTurnoAdminView,
-    CrearTurnoPublicoView,
+    CrearTurnoPublicoView, ColaTurnosView, PosicionTurnoView,
+    DashboardEstudianteView, EstadisticasAdminView,
 )
 
 urlpatterns = [
@@ -22,5 +23,9 @@ urlpatterns = [
     path('admin/penalizaciones/', PenalizacionesListAdminView.as_view(), name='penalizaciones_list_admin'),
     path('admin/penalizaciones/eliminar/<int:pk>/', PenalizacionDeleteView.as_view(), name='penalizacion_delete_admin'),
     path('actual/', TurnoActualView.as_view(), name='turno_actual'),
+    path('cola/', ColaTurnosView.as_view(), name='cola_turnos'),
+    path('posicion/<int:turno_id>/', PosicionTurnoView.as_view(), name='posicion_turno'),
+    path('dashboard/', DashboardEstudianteView.as_view(), name='dashboard_estudiante'),
     path('admin/despenalizar/<int:turno_id>/', DespenalizarTurnoAdminView.as_view(), name='despenalizar_turno_admin'),
+    path('admin/estadisticas/', EstadisticasAdminView.as_view(), name='estadisticas_admin'),
 ]
\ No newline at end of file
@@ -1,58 +1,99 @@
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
-from .models import Turno, Penalizacion
+from . import estadisticas, penalizaciones
+from .cola import motor
+from .difusion import coalescedor
+from .models import CambioTurno, Turno, Penalizacion
+from .penalizaciones import DURACION_PENALIZACION
+from .versiones import clave_penalizaciones_usuario, claves_cambio_turno, registrar_cambio
 
-# Si usas Django Channels, descomenta estas líneas, si no, déjalo como pass abajo
-# from channels.layers import get_channel_layer
-# from asgiref.sync import async_to_sync
+# Tiempo que tiene un turno pendiente para ser reclamado antes de penalizarlo
+TIEMPO_RECLAMO = timedelta(seconds=30)
 
-def penalizar_turnos_no_reclamados():
+def penalizar_turnos_no_reclamados(ahora=None):
     """
     Busca turnos pendientes a los que ya les tocó, han pasado 30s y no han sido reclamados.
     Penaliza al usuario por 15 minutos.
+
+    Trabaja por conjuntos: un SELECT de los turnos vencidos, uno de los
+    usuarios ya penalizados, un UPDATE condicional y un bulk_create, sin
+    importar cuántos turnos haya. Devuelve los conteos de lo que hizo.
     """
-    ahora = timezone.now()
-    # Filtramos los turnos pendientes cuyo turno fue generado hace más de 30s y no han sido reclamados
-    turnos = Turno.objects.filter(
+    ahora = ahora or timezone.now()
+    vencidos = Turno.objects.filter(
         estado='pendiente',
-        generado_en__lte=ahora - timedelta(seconds=30),
+        generado_en__lte=ahora - TIEMPO_RECLAMO,
         reclamado_en__isnull=True
     )
-
-    for turno in turnos:
-        # Verifica si ya existe una penalización activa para ese usuario en ese día, creada en los últimos 15 minutos
-        penalizacion_reciente = Penalizacion.objects.filter(
-            usuario=turno.usuario,
+    with transaction.atomic():
+        filas = list(vencidos.select_for_update().order_by('id').values_list(
+            'id', 'usuario_id', 'fecha', 'cafeteria_id', 'codigo_turno', 'generado_en'))
+        if not filas:
+            return {'turnos_penalizados': 0, 'penalizaciones_creadas': 0}
+        # Usuarios que ya tienen una penalización activa de los últimos 15 minutos
+        ya_penalizados = set(Penalizacion.objects.filter(
+            usuario_id__in=vencidos.values('usuario_id'),
             activa=True,
-            creada_en__gte=ahora - timedelta(minutes=15)
-        ).exists()
-        if not penalizacion_reciente:
-            Penalizacion.objects.create(
-                usuario=turno.usuario,
-                fecha=turno.fecha,
-                motivo='No reclamó su turno en 30 segundos',
-                activa=True
-            )
-        turno.estado = 'penalizado'
-        turno.save()
+            creada_en__gte=ahora - DURACION_PENALIZACION
+        ).values_list('usuario_id', flat=True))
+        turnos_penalizados = vencidos.update(estado='penalizado', actualizado_en=ahora)
+        CambioTurno.anotar([(fila[0], fila[3], fila[2]) for fila in filas])
+        estadisticas.transiciones_masivas([(fila[3], fila[2], fila[5]) for fila in filas], 'pendiente', 'penalizado')
+
+        # Una penalización por usuario, con la fecha de su primer turno vencido
+        nuevas = {}
+        for _, usuario_id, fecha, *_ in filas:
+            if usuario_id not in ya_penalizados and usuario_id not in nuevas:
+                nuevas[usuario_id] = Penalizacion(
+                    usuario_id=usuario_id,
+                    fecha=fecha,
+                    motivo='No reclamó su turno en 30 segundos',
+                    activa=True
+                )
+        Penalizacion.objects.bulk_create(nuevas.values(), batch_size=500)
+        # Todas las versiones (cafeterías, turnos y penalizaciones de cada usuario) juntas
+        registrar_cambio(*claves_cambio_turno(*{fila[3] for fila in filas}, usuario_ids={fila[1] for fila in filas}),
+                         *[clave_penalizaciones_usuario(usuario_id) for usuario_id in nuevas])
+
+        # El UPDATE masivo y bulk_create no disparan señales: se sacan de la
+        # cola, se olvida su penalización en caché y se notifican a mano
+        transaction.on_commit(lambda: _penalizados_confirmados(filas))
+    return {'turnos_penalizados': turnos_penalizados, 'penalizaciones_creadas': len(nuevas)}
+
+def _penalizados_confirmados(filas):
+    motor.quitar_varios([turno_id for turno_id, *_ in filas])
+    penalizaciones.olvidar(*{usuario_id for _, usuario_id, *_ in filas})
+    por_cafeteria = {}
+    for turno_id, _, _, cafeteria_id, codigo_turno, _ in filas:
+        por_cafeteria.setdefault(cafeteria_id, []).append(
+            {'id': turno_id, 'codigo_turno': codigo_turno, 'estado': 'penalizado'}
+        )
+    for cafeteria_id, transiciones in por_cafeteria.items():
+        notificar_cambio_turno(cafeteria_id, transiciones)
 
 def usuario_penalizado(usuario):
     """
     Devuelve True si el usuario tiene una penalización activa en los últimos 15 minutos.
+    Consulta primero la caché de penalizaciones y la completa si no estaba.
     """
     ahora = timezone.now()
-    quince_min_antes = ahora - timedelta(minutes=15)
-    return Penalizacion.objects.filter(
+    conocido = penalizaciones.consultar(usuario.id, ahora)
+    if conocido is not None:
+        return bool(conocido)
+    desde = Penalizacion.objects.filter(
         usuario=usuario,
         activa=True,
-        creada_en__gte=quince_min_antes
-    ).exists()
-
-def notificar_cambio_turno():
-    # Si usas Django Channels para notificaciones en tiempo real, descomenta y usa esto:
-    # channel_layer = get_channel_layer()
-    # async_to_sync(channel_layer.group_send)(
-    #     'turno_actual',
-    #     {'type': 'turno_cambiado'}
-    # )
-    pass  # Si no usas channels, déjalo como pass
\ No newline at end of file
+        creada_en__gte=ahora - DURACION_PENALIZACION
+    ).order_by('-creada_en').values_list('creada_en', flat=True).first()
+    penalizaciones.recordar(usuario.id, desde + DURACION_PENALIZACION if desde else None, ahora)
+    return desde is not None
+
+def notificar_cambio_turno(cafeteria_id, transiciones):
+    """
+    Avisa por WebSocket que cambiaron turnos de una cafetería. Las
+    transiciones ({'id', 'codigo_turno', 'estado'}) se agrupan con las de los
+    próximos milisegundos y salen como un solo mensaje (ver difusion.py).
+    Debe llamarse después del commit, cuando la cola en memoria ya refleja el cambio.
+    """
+    coalescedor.agregar(cafeteria_id, transiciones)
@@ -0,0 +1,159 @@
+"""
+Versiones de datos para GET condicional (ETag / Last-Modified).
+
+Cada grupo de datos que se consulta por sondeo tiene un contador de cambios
+en ContadorTurno (clave 'version:<nombre>'):
+
+- 'cafeterias': alta, baja o modificación de cualquier cafetería.
+- 'turnos': cualquier cambio de turno (o de una cafetería, que va anidada).
+- 'turnos:<id>': cambios de turno de una cafetería.
+- 'turnos_usuario:<id>': cambios de los turnos de un usuario (Mis turnos y
+  el panel del estudiante no se invalidan con cada turno de los demás).
+- 'penalizaciones_usuario:<id>': penalizaciones de un usuario.
+- 'qr:<id>': QRs de una cafetería.
+
+Las señales (signals.py) y las operaciones masivas llaman a
+registrar_cambio() dentro de la misma transacción que el cambio. Las vistas
+con VistaCondicionalMixin leen solo el contador (una consulta por clave
+única) y, si el cliente ya tiene esa versión, contestan 304 sin ejecutar la
+consulta principal ni el serializador.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import ContadorTurno
+
+PREFIJO = 'version:'
+
+
+def clave_turnos(cafeteria_id=None):
+    return 'turnos' if cafeteria_id is None else f'turnos:{cafeteria_id}'
+
+
+def clave_qr(cafeteria_id):
+    return f'qr:{cafeteria_id}'
+
+
+def clave_turnos_usuario(usuario_id):
+    return f'turnos_usuario:{usuario_id}'
+
+
+def clave_penalizaciones_usuario(usuario_id):
+    return f'penalizaciones_usuario:{usuario_id}'
+
+
+def claves_cambio_turno(*cafeteria_ids, usuario_ids=()):
+    """Claves que cambian cuando cambian turnos de estas cafeterías (y de estos usuarios)."""
+    return (['turnos'] + [clave_turnos(c) for c in cafeteria_ids]
+            + [clave_turnos_usuario(u) for u in usuario_ids])
+
+
+def registrar_cambio(*claves):
+    """Incrementa los contadores de versión de `claves` con un solo UPDATE."""
+    claves = {PREFIJO + clave for clave in claves}
+    if not claves:
+        return
+    ahora = timezone.now()
+    with transaction.atomic():
+        actualizados = ContadorTurno.objects.filter(clave__in=claves).update(
+            valor=F('valor') + 1, actualizado_en=ahora)
+        if actualizados == len(claves):
+            return
+        existentes = set(ContadorTurno.objects.filter(clave__in=claves).values_list('clave', flat=True))
+        nuevas = claves - existentes
+        # Se crean en 0 y se incrementan juntas: si otra transacción creó
+        # alguna entre medio, ignore_conflicts la deja y el UPDATE la cuenta igual
+        ContadorTurno.objects.bulk_create([ContadorTurno(clave=clave, valor=0, actualizado_en=ahora) for clave in nuevas],
+                                          ignore_conflicts=True)
+        ContadorTurno.objects.filter(clave__in=nuevas).update(valor=F('valor') + 1, actualizado_en=ahora)
+
+
+def leer_version(clave):
+    """Devuelve (valor, actualizado_en) del contador, o (0, None) si nunca cambió."""
+    fila = ContadorTurno.objects.filter(clave=PREFIJO + clave).values_list('valor', 'actualizado_en').first()
+    return fila or (0, None)
+
+
+def leer_versiones(claves):
+    """Como leer_version para varias claves en una consulta: [(valor, actualizado_en), ...] en el mismo orden."""
+    filas = dict((clave.removeprefix(PREFIJO), (valor, actualizado_en)) for clave, valor, actualizado_en in
+                 ContadorTurno.objects.filter(clave__in=[PREFIJO + clave for clave in claves])
+                 .values_list('clave', 'valor', 'actualizado_en'))
+    return [filas.get(clave, (0, None)) for clave in claves]
+
+
+class VistaCondicionalMixin:
+    """
+    GET condicional para vistas de solo lectura. La subclase define
+    clave_version (o get_clave_version, que también puede devolver una tupla
+    de claves si la respuesta depende de varios contadores) y, si la
+    respuesta depende de algo más que la URL y las claves, get_variante_etag.
+
+    Si los datos vencen solos con el tiempo (un QR), get_vigente_hasta
+    devuelve hasta cuándo vale la respuesta; ese instante va dentro del ETag
+    y un ETag vencido ya no produce 304. Esas vistas no usan Last-Modified,
+    que no podría expresarlo.
+
+    Last-Modified tiene resolución de un segundo; si llegan los dos
+    encabezados decide If-None-Match, como indica la RFC 9110.
+    """
+    clave_version = None
+
+    def get_clave_version(self, request):
+        return self.clave_version
+
+    def get_variante_etag(self, request):
+        return ''
+
+    def get_vigente_hasta(self, datos):
+        return None
+
+    def get(self, request, *args, **kwargs):
+        claves = self.get_clave_version(request)
+        if claves is None:
+            return super().get(request, *args, **kwargs)
+        if isinstance(claves, str):
+            claves = (claves,)
+        versiones = leer_versiones(claves) if len(claves) > 1 else [leer_version(claves[0])]
+        base = '+'.join(f'{clave}.{valor}' for clave, (valor, _) in zip(claves, versiones))
+        base += self.get_variante_etag(request)
+        modificado_en = max((m for _, m in versiones if m is not None), default=None)
+
+        if 'HTTP_IF_NONE_MATCH' in request.META:
+            etag_cliente = self._etag_cliente_vigente(request, base)
+            if etag_cliente:
+                return self._no_modificado(etag_cliente)
+        elif modificado_en is not None and not self._vence_con_el_tiempo():
+            desde = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+            if desde is not None and int(modificado_en.timestamp()) <= desde:
+                return self._no_modificado(f'"{base}"')
+
+        respuesta = super().get(request, *args, **kwargs)
+        if respuesta.status_code != status.HTTP_200_OK:
+            return respuesta
+        hasta = self.get_vigente_hasta(respuesta.data)
+        respuesta['ETag'] = f'"{base}~{int(hasta.timestamp())}"' if hasta else f'"{base}"'
+        if modificado_en is not None and not self._vence_con_el_tiempo():
+            respuesta['Last-Modified'] = http_date(modificado_en.timestamp())
+        return respuesta
+
+    def _vence_con_el_tiempo(self):
+        return type(self).get_vigente_hasta is not VistaCondicionalMixin.get_vigente_hasta
+
+    def _no_modificado(self, etag):
+        respuesta = Response(status=status.HTTP_304_NOT_MODIFIED)
+        respuesta['ETag'] = etag
+        return respuesta
+
+    def _etag_cliente_vigente(self, request, base):
+        """Devuelve el ETag del If-None-Match que sigue vigente, o None."""
+        ahora = timezone.now().timestamp()
+        for etag in parse_etags(request.META['HTTP_IF_NONE_MATCH']):
+            etiqueta, _, hasta = etag.removeprefix('W/').strip('"').partition('~')
+            if etiqueta == base and (not hasta or (hasta.isdigit() and int(hasta) > ahora)):
+                return etag
+        return None
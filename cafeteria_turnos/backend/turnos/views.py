@@ -1,72 +1,39 @@
+from django.http import Http404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
 from rest_framework import generics, permissions, status
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from .models import Turno, Penalizacion
-from .serializers import TurnoSerializer, PenalizacionSerializer
-from usuarios.models import Usuario
-from cafeteria.models import Cafeteria
-from qr.models import QRActivo
-from django.utils import timezone
 from rest_framework.views import APIView
-import random
-import string
-from rest_framework.permissions import AllowAny
 
-from .utils import notificar_cambio_turno, usuario_penalizado, penalizar_turnos_no_reclamados
-
-def generar_codigo_turno(longitud=6):
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=longitud))
-
-def cafeteria_esta_abierta(cafeteria):
-    return cafeteria.estado and cafeteria.estado.lower() == "abierto"
+from usuarios.models import Usuario
+from . import estadisticas
+from .archivo import historial_usuario, modelo_para_fecha, turno_o_archivado
+from .cola import motor
+from .dashboard import armar_dashboard
+from .models import CambioTurno, Turno, Penalizacion
+from .penalizaciones import olvidar_al_confirmar
+from .serializers import TurnoSerializer, PenalizacionSerializer, TurnoListSerializer, EstadisticaSerializer
+from .services import emitir_turno, TurnoRechazado
+from .versiones import (VistaCondicionalMixin, clave_penalizaciones_usuario, clave_turnos, clave_turnos_usuario,
+                        registrar_cambio)
 
 # Crear turno (estudiante autenticado)
 class CrearTurnoView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        usuario = request.user
         if request.data.get('qr') == "simulado":
-            cafeteria = Cafeteria.objects.first()
-            fecha = timezone.localdate()
-            if usuario_penalizado(usuario):
-                return Response({'ok': False, 'mensaje': 'Usuario penalizado, no puede generar turno'}, status=status.HTTP_403_FORBIDDEN)
-            if not cafeteria_esta_abierta(cafeteria):
-                return Response({'ok': False, 'mensaje': 'La cafetería está cerrada'}, status=status.HTTP_400_BAD_REQUEST)
-            if Turno.objects.filter(usuario=usuario, fecha=fecha, cafeteria=cafeteria, estado__in=['pendiente', 'entregado', 'penalizado']).exists():
-                return Response({'ok': False, 'mensaje': 'Ya tienes un turno para hoy'}, status=status.HTTP_400_BAD_REQUEST)
-            codigo_generado = generar_codigo_turno()
-            while Turno.objects.filter(codigo_turno=codigo_generado).exists():
-                codigo_generado = generar_codigo_turno()
-            turno = Turno.objects.create(usuario=usuario, cafeteria=cafeteria, fecha=fecha, codigo_turno=codigo_generado)
-            notificar_cambio_turno()
-            return Response(TurnoSerializer(turno).data)
-
-        cafeteria_id = request.data.get('cafeteria_id')
-        codigo_qr = request.data.get('codigo_qr')
-        fecha = timezone.localdate()
-
+            cafeteria_id, codigo_qr = None, None
+        else:
+            cafeteria_id = request.data.get('cafeteria_id')
+            codigo_qr = request.data.get('codigo_qr') or ''
         try:
-            qr = QRActivo.objects.get(codigo=codigo_qr, cafeteria_id=cafeteria_id)
-            if qr.expiracion < timezone.now():
-                return Response({'ok': False, 'mensaje': 'QR expirado'}, status=status.HTTP_400_BAD_REQUEST)
-        except QRActivo.DoesNotExist:
-            return Response({'ok': False, 'mensaje': 'QR inválido'}, status=status.HTTP_400_BAD_REQUEST)
-
-        if usuario_penalizado(usuario):
-            return Response({'ok': False, 'mensaje': 'Usuario penalizado, no puede generar turno'}, status=status.HTTP_403_FORBIDDEN)
-
-        cafeteria = Cafeteria.objects.get(id=cafeteria_id)
-        if not cafeteria_esta_abierta(cafeteria):
-            return Response({'ok': False, 'mensaje': 'La cafetería está cerrada'}, status=status.HTTP_400_BAD_REQUEST)
-
-        if Turno.objects.filter(usuario=usuario, fecha=fecha, cafeteria=cafeteria, estado__in=['pendiente', 'entregado', 'penalizado']).exists():
-            return Response({'ok': False, 'mensaje': 'Ya tienes un turno para hoy'}, status=status.HTTP_400_BAD_REQUEST)
-
-        codigo_generado = generar_codigo_turno()
-        while Turno.objects.filter(codigo_turno=codigo_generado).exists():
-            codigo_generado = generar_codigo_turno()
-        turno = Turno.objects.create(usuario=usuario, cafeteria=cafeteria, fecha=fecha, codigo_turno=codigo_generado)
-        notificar_cambio_turno()
+            turno = emitir_turno(request.user, cafeteria_id=cafeteria_id, codigo_qr=codigo_qr)
+        except TurnoRechazado as e:
+            return Response({'ok': False, 'mensaje': e.mensaje}, status=e.status)
         return Response(TurnoSerializer(turno).data)
 
 # NUEVA VISTA PÚBLICA PARA CREAR TURNO SIN AUTENTICACIÓN
@@ -81,46 +48,124 @@ class CrearTurnoPublicoView(APIView):
             usuario = Usuario.objects.get(codigo_estudiantil=codigo_estudiantil)
         except Usuario.DoesNotExist:
             return Response({'ok': False, 'mensaje': 'Usuario no encontrado'}, status=status.HTTP_404_NOT_FOUND)
-        cafeteria = Cafeteria.objects.first()
-        fecha = timezone.localdate()
-        if usuario_penalizado(usuario):
-            return Response({'ok': False, 'mensaje': 'Usuario penalizado, no puede generar turno'}, status=status.HTTP_403_FORBIDDEN)
-        if not cafeteria_esta_abierta(cafeteria):
-            return Response({'ok': False, 'mensaje': 'La cafetería está cerrada'}, status=status.HTTP_400_BAD_REQUEST)
-        if Turno.objects.filter(usuario=usuario, fecha=fecha, cafeteria=cafeteria, estado__in=['pendiente', 'entregado', 'penalizado']).exists():
-            return Response({'ok': False, 'mensaje': 'Ya tienes un turno para hoy'}, status=status.HTTP_400_BAD_REQUEST)
-        codigo_generado = generar_codigo_turno()
-        while Turno.objects.filter(codigo_turno=codigo_generado).exists():
-            codigo_generado = generar_codigo_turno()
-        turno = Turno.objects.create(usuario=usuario, cafeteria=cafeteria, fecha=fecha, codigo_turno=codigo_generado)
-        notificar_cambio_turno()
+        try:
+            turno = emitir_turno(usuario)
+        except TurnoRechazado as e:
+            return Response({'ok': False, 'mensaje': e.mensaje}, status=e.status)
         # Incluimos información extra para mostrar en el frontend
         data = TurnoSerializer(turno).data
         data["estudiante"] = usuario.get_full_name() or usuario.username
-        data["cafeteria"] = cafeteria.nombre if cafeteria else ""
+        data["cafeteria"] = turno.cafeteria.nombre
         return Response(data)
 
-class TurnosUsuarioView(generics.ListAPIView):
+class TurnosUsuarioView(VistaCondicionalMixin, generics.ListAPIView):
     serializer_class = TurnoSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def get_queryset(self):
-        usuario = self.request.user
-        return Turno.objects.filter(usuario=usuario).order_by('fecha', 'id')
-
-class TurnosListAdminView(generics.ListAPIView):
+    def get_clave_version(self, request):
+        # Solo los turnos del usuario, y las cafeterías que van anidadas
+        return (clave_turnos_usuario(request.user.id), 'cafeterias')
+
+    def list(self, request, *args, **kwargs):
+        # Los días viejos están en TurnoArchivado: se leen los dos
+        filas = historial_usuario(request.user, TurnoListSerializer.columnas)
+        return Response(self.get_serializer(filas, many=True).data)
+
+class TurnoCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    # El id crece con la fecha de emisión y, a diferencia de -fecha, no se repite
+    ordering = '-id'
+
+class TurnosListAdminView(VistaCondicionalMixin, generics.ListAPIView):
+    """
+    Turnos para el panel del admin, con filtros ?fecha=AAAA-MM-DD,
+    ?estado=pendiente,usado y ?cafeteria=<id>.
+
+    - Con ?cursor= o ?page_size= la respuesta va paginada por cursor. Sin
+      ellos se devuelve la lista completa, como antes.
+    - Con ?since=<cambio> devuelve solo los turnos modificados y los ids que
+      salieron de Turno (borrados o archivados) después de ese cambio de
+      CambioTurno, y en 'siguiente' el valor para el próximo ?since=. Con
+      'completo' en falso quedan más cambios: se pide de nuevo enseguida.
+      since=0 trae todo lo que está en Turno. Las bajas se guardan
+      TURNOS_CAMBIOS_RETENCION_DIAS días; pasado eso se recarga con since=0.
+    """
     serializer_class = TurnoSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = TurnoCursorPagination
+    clave_version = clave_turnos()
+    LIMITE_CAMBIOS = 500
+
+    def list(self, request, *args, **kwargs):
+        try:
+            self.filtros = self._leer_filtros(request.query_params)
+        except ValueError as e:
+            return Response({'ok': False, 'mensaje': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if 'since' in request.query_params:
+            return self._cambios_desde(request.query_params['since'])
+        return super().list(request, *args, **kwargs)
+
+    def _leer_filtros(self, params):
+        filtros = {}
+        if params.get('fecha'):
+            fecha = parse_date(params['fecha']) if len(params['fecha']) == 10 else None
+            if fecha is None:
+                raise ValueError('fecha debe tener el formato AAAA-MM-DD')
+            filtros['fecha'] = fecha
+        if params.get('estado'):
+            estados = params['estado'].split(',')
+            if not set(estados) <= set(dict(Turno.ESTADOS)):
+                raise ValueError('Estado inválido')
+            filtros['estado__in'] = estados
+        if params.get('cafeteria'):
+            if not params['cafeteria'].isdigit():
+                raise ValueError('cafeteria debe ser un id')
+            filtros['cafeteria_id'] = int(params['cafeteria'])
+        return filtros
 
     def get_queryset(self):
-        penalizar_turnos_no_reclamados()
-        return Turno.objects.all().order_by('-fecha')
+        # Un día ya archivado se lee de TurnoArchivado
+        modelo = modelo_para_fecha(self.filtros.get('fecha'))
+        return modelo.objects.filter(**self.filtros).select_related('usuario', 'cafeteria').order_by('-fecha')
+
+    def paginate_queryset(self, queryset):
+        if not {'cursor', 'page_size'} & set(self.request.query_params):
+            return None
+        # La página se lee como filas (values), el serializer de lista las convierte directo
+        return super().paginate_queryset(queryset.values(*TurnoListSerializer.columnas))
+
+    def _cambios_desde(self, since):
+        if not since.isdigit():
+            return Response({'ok': False, 'mensaje': 'since debe ser un número de cambio'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        desde = int(since)
+        cambios = list(CambioTurno.objects.filter(id__gt=desde, **{
+            clave: valor for clave, valor in self.filtros.items() if clave in ('fecha', 'cafeteria_id')
+        }).order_by('id').values_list('id', 'turno_id', 'eliminado')[:self.LIMITE_CAMBIOS])
+        # Vale el último cambio de cada turno
+        eliminado = {turno_id: baja for _, turno_id, baja in cambios}
+        turnos = (Turno.objects.filter(id__in=[t for t, baja in eliminado.items() if not baja], **self.filtros)
+                  .select_related('usuario', 'cafeteria').order_by('id'))
+        return Response({
+            'siguiente': cambios[-1][0] if cambios else desde,
+            'completo': len(cambios) < self.LIMITE_CAMBIOS,
+            'turnos': self.get_serializer(turnos, many=True).data,
+            'eliminados': [t for t, baja in eliminado.items() if baja],
+        })
 
 class TurnoDetailAdminView(generics.RetrieveAPIView):
     serializer_class = TurnoSerializer
     permission_classes = [permissions.IsAdminUser]
     queryset = Turno.objects.all()
 
+    def get_object(self):
+        turno = turno_o_archivado(self.kwargs['pk'])
+        if turno is None:
+            raise Http404
+        return turno
+
 class PasarTurnoView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
@@ -132,7 +177,6 @@ class PasarTurnoView(APIView):
             turno.estado = 'usado'
             turno.reclamado_en = timezone.now()
             turno.save()
-            notificar_cambio_turno()
             return Response(TurnoSerializer(turno).data)
         except Turno.DoesNotExist:
             return Response({'ok': False, 'mensaje': 'Turno no encontrado'}, status=status.HTTP_404_NOT_FOUND)
@@ -148,7 +192,6 @@ class EntregarTurnoAdminView(APIView):
             turno.estado = 'entregado'
             turno.reclamado_en = timezone.now()
             turno.save()
-            notificar_cambio_turno()
             return Response(TurnoSerializer(turno).data)
         except Turno.DoesNotExist:
             return Response({'ok': False, 'mensaje': 'Turno no encontrado'}, status=status.HTTP_404_NOT_FOUND)
@@ -164,14 +207,14 @@ class PenalizacionesUsuarioView(generics.ListAPIView):
 
     def get_queryset(self):
         usuario = self.request.user
-        return Penalizacion.objects.filter(usuario=usuario, activa=True)
+        return Penalizacion.objects.filter(usuario=usuario, activa=True).select_related('usuario')
 
 class PenalizacionesListAdminView(generics.ListAPIView):
     serializer_class = PenalizacionSerializer
     permission_classes = [permissions.IsAdminUser]
 
     def get_queryset(self):
-        return Penalizacion.objects.all().order_by('-fecha')
+        return Penalizacion.objects.select_related('usuario').order_by('-fecha')
 
 class PenalizacionDeleteView(generics.DestroyAPIView):
     serializer_class = PenalizacionSerializer
@@ -189,6 +232,8 @@ class DespenalizarTurnoAdminView(APIView):
             if not penalizaciones.exists():
                 return Response({'ok': False, 'mensaje': 'No hay penalizaciones activas para este usuario.'}, status=status.HTTP_400_BAD_REQUEST)
             penalizaciones.update(activa=False)
+            olvidar_al_confirmar(usuario.id)
+            registrar_cambio(clave_penalizaciones_usuario(usuario.id))
             # Cambiar el turno penalizado a expirado
             if turno.estado == 'penalizado':
                 turno.estado = 'expirado'
@@ -197,13 +242,112 @@ class DespenalizarTurnoAdminView(APIView):
         except Turno.DoesNotExist:
             return Response({'ok': False, 'mensaje': 'Turno no encontrado.'}, status=status.HTTP_404_NOT_FOUND)
 
+class EstadisticasAdminView(APIView):
+    """
+    Estadísticas de servicio de EstadisticaDiaria, sin recorrer los turnos:
+    ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD (por defecto hoy) y ?cafeteria=<id>.
+    'horas' trae una fila por cafetería, día y hora de emisión, con los
+    percentiles de espera que materializa el planificador
+    (percentiles_al_dia=False mientras falte recalcularlos); 'dias', los
+    totales de cada cafetería por día.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    MAX_DIAS = 366
+
+    def get(self, request):
+        hoy = timezone.localdate()
+        fechas = {}
+        for nombre in ('desde', 'hasta'):
+            valor = request.query_params.get(nombre)
+            fechas[nombre] = parse_date(valor) if valor and len(valor) == 10 else (None if valor else hoy)
+            if fechas[nombre] is None:
+                return Response({'ok': False, 'mensaje': f'{nombre} debe tener el formato AAAA-MM-DD'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        desde, hasta = fechas['desde'], fechas['hasta']
+        if desde > hasta:
+            return Response({'ok': False, 'mensaje': 'desde no puede ser posterior a hasta'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if (hasta - desde).days >= self.MAX_DIAS:
+            return Response({'ok': False, 'mensaje': f'El rango no puede pasar de {self.MAX_DIAS} días'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        cafeteria = request.query_params.get('cafeteria')
+        if cafeteria and not cafeteria.isdigit():
+            return Response({'ok': False, 'mensaje': 'cafeteria debe ser un id'}, status=status.HTTP_400_BAD_REQUEST)
+        horas, dias = estadisticas.consultar(desde, hasta, int(cafeteria) if cafeteria else None)
+        return Response({
+            'desde': desde.isoformat(),
+            'hasta': hasta.isoformat(),
+            'horas': EstadisticaSerializer(horas, many=True).data,
+            'dias': EstadisticaSerializer(dias, many=True).data,
+        })
+
+def _cafeteria_id_param(request):
+    cafeteria_id = request.query_params.get('cafeteria_id')
+    return int(cafeteria_id) if cafeteria_id and cafeteria_id.isdigit() else None
+
 class TurnoActualView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
-        turno = Turno.objects.filter(estado='pendiente').order_by('fecha', 'id').first()
-        if turno:
-            data = TurnoSerializer(turno).data
+        # El turno sale de la cola en memoria, así que el ETag se arma con él
+        # mismo en vez de leer el contador de versión de la base de datos
+        cafeteria_id = _cafeteria_id_param(request)
+        turno = motor.actual(cafeteria_id)
+        etag = f'"actual.{cafeteria_id or 0}.{turno["id"] if turno else 0}"'
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            respuesta = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            respuesta = Response(turno)
+        respuesta['ETag'] = etag
+        return respuesta
+
+# Próximos N turnos de la cola de una cafetería
+class ColaTurnosView(APIView):
+    permission_classes = [AllowAny]
+    MAX_SIGUIENTES = 50
+
+    def get(self, request):
+        cafeteria_id = _cafeteria_id_param(request)
+        if cafeteria_id is None:
+            return Response({'ok': False, 'mensaje': 'cafeteria_id requerido'}, status=status.HTTP_400_BAD_REQUEST)
+        n = request.query_params.get('n', '10')
+        n = min(int(n), self.MAX_SIGUIENTES) if n.isdigit() else 10
+        siguientes, total = motor.siguientes(cafeteria_id, n)
+        return Response({'cafeteria_id': cafeteria_id, 'total': total, 'siguientes': siguientes})
+
+# Posición de un turno en la cola (dueño del turno o admin)
+class PosicionTurnoView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, turno_id):
+        resultado = motor.posicion(turno_id)
+        if resultado is None:
+            return Response({'ok': False, 'mensaje': 'El turno no está en la cola'}, status=status.HTTP_404_NOT_FOUND)
+        cafeteria_id, usuario_id, posicion, total = resultado
+        if usuario_id != request.user.id and not request.user.is_staff:
+            return Response({'ok': False, 'mensaje': 'El turno no está en la cola'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'turno_id': turno_id,
+            'cafeteria_id': cafeteria_id,
+            'posicion': posicion,
+            'delante': posicion - 1,
+            'total': total,
+        })
+
+# Todo el panel del estudiante en una respuesta, con token de versión
+class DashboardEstudianteView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        # Sin espera en el servidor: los cambios llegan por WebSocket y el
+        # cliente vuelve a preguntar con ?version= o If-None-Match
+        datos, version = armar_dashboard(request.user)
+        etag = f'"dashboard.{version}"'
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            respuesta = Response(status=status.HTTP_304_NOT_MODIFIED)
+        elif version == request.query_params.get('version'):
+            respuesta = Response({'version': version, 'sin_cambios': True})
         else:
-            data = None
-        return Response(data)
\ No newline at end of file
+            respuesta = Response({'version': version, 'sin_cambios': False, **datos})
+        respuesta['ETag'] = etag
+        return respuesta
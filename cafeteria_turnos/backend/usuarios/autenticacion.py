@@ -0,0 +1,103 @@
+"""
+Autenticación JWT sin leer la fila del usuario en cada petición.
+
+El token de login ya trae id, username, rol, is_staff, codigo_estudiantil y
+la version_token del usuario (CustomTokenObtainPairSerializer). Con eso se
+arma un Usuario "diferido" (Usuario.from_db solo con esos campos): sirve para
+IsAuthenticated/IsAdminUser, para filtrar (usuario=request.user) y para
+asignarlo a una FK; si una vista lee otro campo, Django lo carga en ese
+momento.
+
+Lo único que se consulta es si el token sigue vigente: la version_token y
+is_active de cada usuario se guardan en un LRU por proceso de
+USUARIOS_JWT_LRU entradas, que se relee cada USUARIOS_JWT_REVALIDAR_SEGUNDOS.
+Un usuario que sondea cada 2 s paga una consulta por ese intervalo, no una
+por petición.
+
+Revocar: Usuario.save sube version_token al cambiar contraseña, rol,
+is_staff, is_active, username o código. El proceso que guarda olvida su
+entrada en el momento (señal post_save); los demás lo ven al revalidar, a
+más tardar USUARIOS_JWT_REVALIDAR_SEGUNDOS después.
+
+Los tokens emitidos antes de este esquema (sin 'ver') se autentican como
+siempre, leyendo el usuario completo.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import router
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Usuario
+
+CLAIM_VERSION = 'ver'
+# Campos del Usuario que se arman con los claims del token
+CAMPOS_CLAIMS = ('username', 'rol', 'is_staff', 'codigo_estudiantil')
+
+_lock = threading.Lock()
+_versiones = OrderedDict()  # usuario_id -> (version_token, is_active, leida_en)
+
+
+def agregar_claims(token, usuario):
+    """Agrega al token lo necesario para autenticar sin leer el usuario."""
+    for campo in CAMPOS_CLAIMS:
+        token[campo] = getattr(usuario, campo)
+    token[CLAIM_VERSION] = usuario.version_token
+    return token
+
+
+def _version(usuario_id):
+    """(version_token, is_active) del usuario, o None si no existe."""
+    revalidar_cada = getattr(settings, 'USUARIOS_JWT_REVALIDAR_SEGUNDOS', 30)
+    ahora = time.monotonic()
+    with _lock:
+        entrada = _versiones.get(usuario_id)
+        if entrada is not None and ahora - entrada[2] < revalidar_cada:
+            _versiones.move_to_end(usuario_id)
+            return entrada[:2]
+    fila = Usuario.objects.filter(pk=usuario_id).values_list('version_token', 'is_active').first()
+    if fila is None:
+        return None
+    with _lock:
+        _versiones[usuario_id] = (*fila, ahora)
+        _versiones.move_to_end(usuario_id)
+        while len(_versiones) > getattr(settings, 'USUARIOS_JWT_LRU', 10000):
+            _versiones.popitem(last=False)
+    return fila
+
+
+def olvidar(*usuario_ids):
+    with _lock:
+        for usuario_id in usuario_ids:
+            _versiones.pop(usuario_id, None)
+
+
+class JWTClaimsAuthentication(JWTAuthentication):
+    """JWTAuthentication que arma el usuario con los claims del token."""
+
+    def get_user(self, validated_token):
+        if CLAIM_VERSION not in validated_token:
+            return super().get_user(validated_token)
+        try:
+            usuario_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidToken('El token no identifica a un usuario') from None
+
+        vigente = _version(usuario_id)
+        if vigente is None:
+            raise AuthenticationFailed('Usuario no encontrado', code='user_not_found')
+        version, activo = vigente
+        if not activo:
+            raise AuthenticationFailed('Usuario inactivo', code='user_inactive')
+        if version != validated_token[CLAIM_VERSION]:
+            raise AuthenticationFailed('La sesión fue revocada, vuelve a iniciar sesión', code='token_revoked')
+
+        datos = {campo: validated_token.get(campo) for campo in CAMPOS_CLAIMS}
+        datos.update(id=usuario_id, is_active=True, version_token=version)
+        # from_db espera los valores en el orden de los campos del modelo
+        campos = [f.attname for f in Usuario._meta.concrete_fields if f.attname in datos]
+        return Usuario.from_db(router.db_for_read(Usuario), campos, [datos[campo] for campo in campos])
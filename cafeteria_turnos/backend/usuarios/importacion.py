@@ -0,0 +1,333 @@
+"""
+Importación masiva de la base de estudiantes (CSV o XLSX).
+
+El archivo se lee fila por fila (csv sobre el archivo subido, openpyxl en
+modo read_only) y se procesa por lotes de USUARIOS_IMPORTACION_LOTE filas:
+una consulta trae los usuarios existentes del lote por codigo_estudiantil,
+otra los nombres de usuario ocupados, y luego un bulk_create de los nuevos y
+un bulk_update de los que cambiaron, todo en una transacción por lote. Un
+lote con errores de fila no se pierde: las filas inválidas se informan y las
+demás se guardan.
+
+Columnas (la primera fila es el encabezado; se aceptan algunos alias en
+español): codigo_estudiantil (obligatoria), username, first_name, last_name,
+email, password y rol. Sin username se usa el código. Sin password, los
+usuarios nuevos quedan con una contraseña inutilizable (no pueden entrar
+con la app hasta que un admin les asigne una; el kiosco sigue funcionando
+con el código) y los existentes conservan la suya.
+
+La importación solo crea y actualiza estudiantes: rol, si viene, tiene que
+ser 'estudiante', y las filas de usuarios admin o staff existentes se
+rechazan (cambiarles la contraseña o el username sería tomar su cuenta).
+
+Hashear contraseñas es lo que más cuesta (PBKDF2 tarda ~0.3 s por
+contraseña). La vista las hashea en el mismo proceso; el comando
+importar_estudiantes las reparte en USUARIOS_IMPORTACION_PROCESOS procesos.
+Con USUARIOS_IMPORTACION_ITERACIONES se puede hashear con menos iteraciones
+de PBKDF2: Django vuelve a hashear con las iteraciones completas en el
+primer inicio de sesión de cada estudiante.
+"""
+import codecs
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, get_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from . import autenticacion
+from .models import Usuario
+
+CAMPOS = ('codigo_estudiantil', 'username', 'first_name', 'last_name', 'email', 'password', 'rol')
+ALIAS = {
+    'codigo': 'codigo_estudiantil',
+    'usuario': 'username',
+    'nombre': 'first_name',
+    'nombres': 'first_name',
+    'apellido': 'last_name',
+    'apellidos': 'last_name',
+    'correo': 'email',
+    'contraseña': 'password',
+    'contrasena': 'password',
+}
+CAMPOS_ACTUALIZABLES = ('username', 'first_name', 'last_name', 'email', 'password', 'version_token')
+# Cuántos errores de fila se devuelven con detalle
+MAX_ERRORES_DETALLE = 500
+
+
+class ErrorImportacion(Exception):
+    """El archivo completo no se puede importar (formato o encabezado)."""
+
+
+# --- Lectura -----------------------------------------------------------------
+
+def leer_filas(archivo):
+    """
+    Valida el encabezado y devuelve un iterador de (número de fila, dict)
+    que lee el resto del archivo a medida que se consume.
+    """
+    nombre = (getattr(archivo, 'name', '') or '').lower()
+    if nombre.endswith('.xlsx'):
+        filas = _filas_xlsx(archivo)
+    elif nombre.endswith(('.csv', '.txt')) or not nombre:
+        filas = _filas_csv(archivo)
+    else:
+        raise ErrorImportacion('El archivo debe ser .csv o .xlsx')
+    try:
+        encabezado = next(filas)
+    except StopIteration:
+        raise ErrorImportacion('El archivo está vacío') from None
+    columnas = [_columna(valor) for valor in encabezado]
+    if 'codigo_estudiantil' not in columnas:
+        raise ErrorImportacion('Falta la columna codigo_estudiantil')
+    return _como_dicts(columnas, filas)
+
+
+def _columna(valor):
+    nombre = str(valor or '').strip().lower().replace(' ', '_')
+    nombre = ALIAS.get(nombre, nombre)
+    return nombre if nombre in CAMPOS else None
+
+
+def _como_dicts(columnas, filas):
+    for numero, valores in enumerate(filas, start=2):
+        fila = {}
+        for columna, valor in zip(columnas, valores):
+            if columna is not None and valor is not None:
+                fila[columna] = str(valor).strip()
+        if any(fila.values()):
+            yield numero, fila
+
+
+def _codificacion(muestra):
+    try:
+        muestra.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # Un carácter cortado al final de la muestra no cuenta
+        if e.start < len(muestra) - 3:
+            return 'cp1252'
+    return 'utf-8-sig'
+
+
+def _filas_csv(archivo):
+    archivo.seek(0)
+    flujo = archivo.file if hasattr(archivo, 'file') else archivo
+    muestra = flujo.read(64 * 1024)
+    flujo.seek(0)
+    texto = codecs.getreader(_codificacion(muestra))(flujo)
+    primera = muestra.split(b'\n', 1)[0].decode('latin-1')
+    # Excel en español exporta con punto y coma
+    delimitador = max(',;\t', key=primera.count)
+    return csv.reader(texto, delimiter=delimitador)
+
+
+def _filas_xlsx(archivo):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ErrorImportacion('Para importar .xlsx el servidor necesita openpyxl; sube un .csv') from None
+    archivo.seek(0)
+    try:
+        libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    except Exception as e:
+        raise ErrorImportacion(f'No se pudo leer el .xlsx: {e}') from None
+    return libro.active.iter_rows(values_only=True)
+
+
+# --- Contraseñas ---------------------------------------------------------------
+
+def hashear(password, iteraciones=None):
+    """make_password, con menos iteraciones de PBKDF2 si se piden."""
+    hasher = get_hasher('default')
+    if iteraciones and isinstance(hasher, PBKDF2PasswordHasher):
+        return hasher.encode(password, hasher.salt(), iterations=iteraciones)
+    return make_password(password)
+
+
+def _hashear_varias(passwords, iteraciones):
+    return [hashear(password, iteraciones) for password in passwords]
+
+
+def _iniciar_proceso():
+    # Con fork Django ya viene cargado; con spawn hay que cargarlo
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+@contextmanager
+def _pool(procesos):
+    if procesos <= 1:
+        yield None
+        return
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso) as pool:
+        yield pool
+
+
+# --- Importación ---------------------------------------------------------------
+
+class ImportacionEstudiantes:
+    """
+    Uso: `for progreso in importacion.ejecutar(filas): ...` y al final
+    `importacion.resumen()`. Cada lote produce un dict de progreso.
+    """
+
+    def __init__(self, lote=None, procesos=1, iteraciones=None):
+        self.lote = lote or getattr(settings, 'USUARIOS_IMPORTACION_LOTE', 1000)
+        self.procesos = procesos or 1
+        self.iteraciones = iteraciones or getattr(settings, 'USUARIOS_IMPORTACION_ITERACIONES', None)
+        self.procesadas = self.creados = self.actualizados = self.sin_cambios = self.sin_contrasena = 0
+        self.errores = []
+        self.total_errores = 0
+        self._codigos_vistos = {}
+        self._usernames_vistos = {}
+
+    def ejecutar(self, filas):
+        with _pool(self.procesos) as pool:
+            self._hashear_lote = self._hasheador(pool)
+            lote = []
+            for numero, fila in filas:
+                lote.append((numero, fila))
+                if len(lote) >= self.lote:
+                    yield self._procesar(lote)
+                    lote = []
+            if lote:
+                yield self._procesar(lote)
+
+    def resumen(self):
+        return {
+            'procesadas': self.procesadas,
+            'creados': self.creados,
+            'actualizados': self.actualizados,
+            'sin_cambios': self.sin_cambios,
+            'sin_contrasena': self.sin_contrasena,
+            'total_errores': self.total_errores,
+            'errores': self.errores,
+        }
+
+    def progreso(self):
+        return {clave: valor for clave, valor in self.resumen().items() if clave != 'errores'}
+
+    def _hasheador(self, pool):
+        if pool is None:
+            return lambda passwords: _hashear_varias(passwords, self.iteraciones)
+
+        def hashear_en_pool(passwords):
+            # Un trozo por proceso, para no pagar el envío de cada contraseña por separado
+            tamano = -(-len(passwords) // self.procesos) or 1
+            trozos = [passwords[i:i + tamano] for i in range(0, len(passwords), tamano)]
+            return [h for hashes in pool.map(_hashear_varias, trozos, [self.iteraciones] * len(trozos))
+                    for h in hashes]
+        return hashear_en_pool
+
+    def _error(self, numero, fila, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < MAX_ERRORES_DETALLE:
+            self.errores.append({'fila': numero, 'codigo_estudiantil': fila.get('codigo_estudiantil', ''),
+                                 'mensaje': mensaje})
+
+    def _validar(self, numero, fila):
+        codigo = fila.get('codigo_estudiantil', '')
+        if not codigo:
+            return 'Falta codigo_estudiantil'
+        if codigo in self._codigos_vistos:
+            return f'codigo_estudiantil repetido (fila {self._codigos_vistos[codigo]})'
+        fila['username'] = fila.get('username') or codigo
+        for campo, valor in fila.items():
+            if campo != 'password' and len(valor) > Usuario._meta.get_field(campo).max_length:
+                return f'{campo} demasiado largo'
+        if fila['username'] in self._usernames_vistos:
+            return f'username repetido (fila {self._usernames_vistos[fila["username"]]})'
+        if fila.get('email'):
+            try:
+                validate_email(fila['email'])
+            except ValidationError:
+                return 'email inválido'
+        if fila.get('rol') and fila['rol'] not in dict(Usuario.ROLES):
+            return 'rol inválido'
+        if fila.get('rol', 'estudiante') != 'estudiante':
+            return 'la importación solo crea estudiantes'
+        self._codigos_vistos[codigo] = numero
+        self._usernames_vistos[fila['username']] = numero
+        return None
+
+    def _procesar(self, lote):
+        self.procesadas += len(lote)
+        validas = []
+        for numero, fila in lote:
+            error = self._validar(numero, fila)
+            if error:
+                self._error(numero, fila, error)
+            else:
+                validas.append((numero, fila))
+
+        codigos = [fila['codigo_estudiantil'] for _, fila in validas]
+        with transaction.atomic():
+            existentes = {u.codigo_estudiantil: u for u in Usuario.objects.filter(codigo_estudiantil__in=codigos)}
+            duenos_username = dict(Usuario.objects.filter(
+                username__in=[fila['username'] for _, fila in validas]
+            ).values_list('username', 'codigo_estudiantil'))
+
+            nuevos, cambiados, por_hashear = [], [], []
+            # bulk_update arma un CASE por fila y campo: solo los campos que cambiaron
+            campos_cambiados = set()
+            for numero, fila in validas:
+                codigo = fila['codigo_estudiantil']
+                dueno = duenos_username.get(fila['username'])
+                if dueno is not None and dueno != codigo:
+                    self._error(numero, fila, 'username ya usado por otro usuario')
+                    continue
+                usuario = existentes.get(codigo)
+                if usuario is not None and (usuario.rol != 'estudiante' or usuario.is_staff or usuario.is_superuser):
+                    self._error(numero, fila, 'el usuario es administrador; no se modifica desde la importación')
+                    continue
+                if usuario is None:
+                    usuario = Usuario(codigo_estudiantil=codigo, rol='estudiante')
+                    self._asignar(usuario, fila)
+                    nuevos.append(usuario)
+                    if fila.get('password'):
+                        por_hashear.append((usuario, fila['password']))
+                    else:
+                        usuario.set_unusable_password()
+                        self.sin_contrasena += 1
+                else:
+                    campos = self._asignar(usuario, fila)
+                    # La misma contraseña de siempre no se rehashea ni revoca la
+                    # sesión. Sin setter: comprobar no debe reescribir el hash.
+                    if fila.get('password') and not check_password(fila['password'], usuario.password):
+                        campos.append('password')
+                        por_hashear.append((usuario, fila['password']))
+                    if set(campos) & set(Usuario.CAMPOS_TOKEN):
+                        # bulk_update no pasa por Usuario.save: revocar los tokens a mano
+                        usuario.version_token += 1
+                        campos.append('version_token')
+                    if campos:
+                        cambiados.append(usuario)
+                        campos_cambiados.update(campos)
+                    else:
+                        self.sin_cambios += 1
+
+            for (usuario, _), hash_ in zip(por_hashear, self._hashear_lote([p for _, p in por_hashear])):
+                usuario.password = hash_
+            Usuario.objects.bulk_create(nuevos, batch_size=500)
+            if cambiados:
+                campos = [campo for campo in CAMPOS_ACTUALIZABLES if campo in campos_cambiados]
+                Usuario.objects.bulk_update(cambiados, campos, batch_size=500)
+                if 'version_token' in campos:
+                    autenticacion.olvidar(*(usuario.pk for usuario in cambiados))
+        self.creados += len(nuevos)
+        self.actualizados += len(cambiados)
+        return self.progreso()
+
+    def _asignar(self, usuario, fila):
+        """Copia la fila al usuario y devuelve los campos que cambiaron."""
+        cambios = []
+        for campo in ('username', 'first_name', 'last_name', 'email'):
+            if campo in fila and fila[campo] and getattr(usuario, campo) != fila[campo]:
+                setattr(usuario, campo, fila[campo])
+                cambios.append(campo)
+        return cambios
@@ -0,0 +1,32 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from usuarios.importacion import ErrorImportacion, ImportacionEstudiantes, leer_filas
+
+class Command(BaseCommand):
+    help = 'Importa la base de estudiantes desde un CSV o XLSX (crea o actualiza por codigo_estudiantil)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--procesos', type=int, default=None,
+                            help='Procesos para hashear contraseñas (por defecto USUARIOS_IMPORTACION_PROCESOS)')
+
+    def handle(self, *args, **options):
+        with open(options['archivo'], 'rb') as archivo:
+            try:
+                filas = leer_filas(archivo)
+                procesos = (options['procesos'] or getattr(settings, 'USUARIOS_IMPORTACION_PROCESOS', None)
+                            or os.cpu_count())
+                importacion = ImportacionEstudiantes(procesos=procesos)
+                for progreso in importacion.ejecutar(filas):
+                    self.stdout.write(f"{progreso['procesadas']:,} filas: {progreso['creados']:,} creados, "
+                                      f"{progreso['actualizados']:,} actualizados, {progreso['total_errores']:,} errores")
+            except ErrorImportacion as e:
+                raise CommandError(str(e))
+        for error in importacion.errores:
+            self.stdout.write(self.style.WARNING(f"Fila {error['fila']} ({error['codigo_estudiantil']}): {error['mensaje']}"))
+        if importacion.sin_contrasena:
+            self.stdout.write(self.style.WARNING(
+                f"{importacion.sin_contrasena:,} estudiantes nuevos sin contraseña: no pueden entrar hasta que se les asigne una"))
+        self.stdout.write(self.style.SUCCESS('Importación terminada'))
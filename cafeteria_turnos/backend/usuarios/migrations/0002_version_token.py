@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='version_token',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -6,8 +6,34 @@ class Usuario(AbstractUser):
         ('estudiante', 'Estudiante'),
         ('admin', 'Administrador'),
     )
+    # Campos que van en el JWT o que deben cortar las sesiones abiertas al cambiar
+    CAMPOS_TOKEN = ('username', 'password', 'rol', 'is_staff', 'is_active', 'codigo_estudiantil')
+
     rol = models.CharField(max_length=20, choices=ROLES, default='estudiante')
     codigo_estudiantil = models.CharField(max_length=20, unique=True)
+    # Sube cuando cambia algún CAMPOS_TOKEN; los tokens emitidos con otra
+    # versión dejan de valer (ver usuarios/autenticacion.py)
+    version_token = models.PositiveIntegerField(default=0)
 
     def __str__(self):
-        return f"{self.username} ({self.rol})"
\ No newline at end of file
+        return f"{self.username} ({self.rol})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        usuario = super().from_db(db, field_names, values)
+        usuario._token_original = usuario._campos_token()
+        return usuario
+
+    def _campos_token(self):
+        # Solo los campos cargados: leer uno diferido haría una consulta
+        return {campo: self.__dict__[campo] for campo in self.CAMPOS_TOKEN if campo in self.__dict__}
+
+    def save(self, *args, **kwargs):
+        original = getattr(self, '_token_original', None)
+        actual = self._campos_token()
+        if original is not None and any(actual.get(campo, valor) != valor for campo, valor in original.items()):
+            self.version_token += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version_token'}
+        super().save(*args, **kwargs)
+        self._token_original = self._campos_token()
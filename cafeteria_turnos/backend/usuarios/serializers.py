@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .autenticacion import agregar_claims
 
 class UsuarioSerializer(serializers.ModelSerializer):
     class Meta:
@@ -40,10 +41,8 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
-        token['username'] = user.username
-        token['rol'] = user.rol
-        token['codigo_estudiantil'] = getattr(user, 'codigo_estudiantil', '')
-        return token
+        # username, rol, is_staff, codigo_estudiantil y la versión para revocarlo
+        return agregar_claims(token, user)
 
     def validate(self, attrs):
         data = super().validate(attrs)
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import autenticacion
+from .models import Usuario
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def olvidar_version_token(sender, instance, **kwargs):
+    autenticacion.olvidar(instance.pk)
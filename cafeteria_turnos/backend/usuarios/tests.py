@@ -1,6 +1,15 @@
+import json
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
+from . import autenticacion
+from .importacion import ImportacionEstudiantes, leer_filas
 from .models import Usuario
 
 class UsuarioTests(APITestCase):
@@ -25,4 +34,155 @@ class UsuarioTests(APITestCase):
         data = {"username": "testuser", "password": "testpass123"}
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn("access", response.data)
\ No newline at end of file
+        self.assertIn("access", response.data)
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class JWTClaimsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        autenticacion.olvidar(*Usuario.objects.values_list('pk', flat=True))
+        self.user = Usuario.objects.create_user(username="est", password="estpass123", codigo_estudiantil="C1")
+        self.admin = Usuario.objects.create_superuser(username="admin", password="adminpass", codigo_estudiantil="A1")
+
+    def login(self, username, password):
+        response = self.client.post(reverse('token_obtain_pair'), {"username": username, "password": password})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def test_sondeo_no_lee_la_tabla_de_usuarios(self):
+        self.login("est", "estpass123")
+        self.client.get(reverse('turnos_usuario'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('turnos_usuario'))
+        self.assertEqual(response.status_code, 200)
+        # Solo la versión de la lista y los turnos (con el JOIN de siempre): ningún SELECT del usuario
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertFalse(any(q['sql'].startswith('SELECT "usuarios_usuario"') for q in ctx.captured_queries))
+        # El perfil sí lee el usuario completo
+        response = self.client.get(reverse('usuario_perfil'))
+        self.assertEqual(response.data['codigo_estudiantil'], "C1")
+        self.assertEqual(self.client.get(reverse('usuarios_list')).status_code, 403)
+
+    def test_admin_por_claims(self):
+        self.login("admin", "adminpass")
+        self.assertEqual(self.client.get(reverse('usuarios_list')).status_code, 200)
+
+    def test_cambiar_password_revoca_el_token(self):
+        self.login("est", "estpass123")
+        response = self.client.post(reverse('cambiar_password'),
+                                    {"old_password": "estpass123", "new_password": "otraclave456"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('turnos_usuario')).status_code, 401)
+        self.login("est", "otraclave456")
+        self.assertEqual(self.client.get(reverse('turnos_usuario')).status_code, 200)
+
+    def test_cambio_de_rol_o_desactivar_revoca(self):
+        self.login("est", "estpass123")
+        self.user.is_staff = True
+        self.user.save(update_fields=['is_staff'])
+        self.assertEqual(self.client.get(reverse('turnos_usuario')).status_code, 401)
+        self.login("est", "estpass123")
+        # Cambiar el nombre no toca el token
+        self.user.first_name = "Eva"
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('usuarios_list')).status_code, 200)
+        Usuario.objects.filter(pk=self.user.pk).update(is_active=False)
+        autenticacion.olvidar(self.user.pk)
+        self.assertEqual(self.client.get(reverse('turnos_usuario')).status_code, 401)
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                   USUARIOS_IMPORTACION_PROCESOS=1, USUARIOS_IMPORTACION_LOTE=2)
+class SubirBaseTests(APITestCase):
+    def setUp(self):
+        self.admin = Usuario.objects.create_superuser(username="admin", password="adminpass", codigo_estudiantil="A1")
+        self.client.force_authenticate(user=self.admin)
+        self.url = reverse('subir_base')
+
+    def subir(self, contenido, nombre="estudiantes.csv", **params):
+        archivo = SimpleUploadedFile(nombre, contenido.encode('utf-8'), content_type='text/csv')
+        url = self.url + ('?progreso=1' if params.get('progreso') else '')
+        return self.client.post(url, {'archivo': archivo}, format='multipart')
+
+    def test_crea_actualiza_y_reporta_errores(self):
+        Usuario.objects.create_user(username="viejo", password="x", codigo_estudiantil="E2", first_name="Ana")
+        response = self.subir(
+            "codigo;nombre;apellido;correo\n"
+            "E1;Luis;Pérez;luis@correo.com\n"
+            "E2;Ana María;Gómez;\n"
+            "E1;Repetido;;\n"
+            ";Sin código;;\n"
+            "E3;Eva;;no-es-correo\n"
+            "E4;Juan;;\n"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['creados'], response.data['actualizados']), (2, 1))
+        self.assertEqual([(e['fila'], e['mensaje']) for e in response.data['errores']],
+                         [(4, 'codigo_estudiantil repetido (fila 2)'), (5, 'Falta codigo_estudiantil'),
+                          (6, 'email inválido')])
+        luis = Usuario.objects.get(codigo_estudiantil="E1")
+        self.assertEqual((luis.username, luis.last_name, luis.rol), ("E1", "Pérez", "estudiante"))
+        # Sin columna de contraseña: los nuevos no pueden entrar hasta tener una; los existentes conservan la suya
+        self.assertFalse(luis.has_usable_password())
+        self.assertFalse(luis.check_password("E1"))
+        self.assertEqual(response.data['sin_contrasena'], 2)
+        self.assertTrue(Usuario.objects.get(codigo_estudiantil="E2").check_password("x"))
+        self.assertEqual(Usuario.objects.get(codigo_estudiantil="E2").first_name, "Ana María")
+
+        response = self.subir("codigo_estudiantil,first_name\nE1,Luis\nE4,Juan\n")
+        self.assertEqual((response.data['creados'], response.data['actualizados'], response.data['sin_cambios']),
+                         (0, 0, 2))
+
+    def test_misma_contrasena_no_revoca_tokens(self):
+        usuario = Usuario.objects.create_user(username="E1", password="clave", codigo_estudiantil="E1")
+        version = usuario.version_token
+        response = self.subir("codigo_estudiantil,password\nE1,clave\n")
+        self.assertEqual((response.data['actualizados'], response.data['sin_cambios']), (0, 1))
+        usuario.refresh_from_db()
+        self.assertEqual(usuario.version_token, version)
+
+        response = self.subir("codigo_estudiantil,password\nE1,otra\n")
+        self.assertEqual((response.data['actualizados'], response.data['sin_cambios']), (1, 0))
+        usuario.refresh_from_db()
+        self.assertTrue(usuario.check_password("otra"))
+        self.assertEqual(usuario.version_token, version + 1)
+
+    def test_username_de_otro_usuario(self):
+        response = self.subir("codigo_estudiantil,username\nE1,admin\n")
+        self.assertEqual(response.data['errores'][0]['mensaje'], 'username ya usado por otro usuario')
+        self.assertFalse(Usuario.objects.filter(codigo_estudiantil="E1").exists())
+
+    def test_no_crea_ni_modifica_admins(self):
+        response = self.subir("codigo_estudiantil,rol,password\nE1,admin,clave-nueva\nA1,estudiante,clave-nueva\n")
+        self.assertEqual([(e['fila'], e['mensaje']) for e in response.data['errores']],
+                         [(2, 'la importación solo crea estudiantes'),
+                          (3, 'el usuario es administrador; no se modifica desde la importación')])
+        self.assertFalse(Usuario.objects.filter(codigo_estudiantil="E1").exists())
+        admin = Usuario.objects.get(codigo_estudiantil="A1")
+        self.assertTrue(admin.check_password("adminpass"))
+
+    def test_la_vista_no_abre_procesos(self):
+        with mock.patch('usuarios.importacion.ProcessPoolExecutor') as pool:
+            response = self.subir("codigo_estudiantil,password\nE1,uno\nE2,dos\n")
+        self.assertEqual(response.data['creados'], 2)
+        pool.assert_not_called()
+        self.assertTrue(Usuario.objects.get(codigo_estudiantil="E2").check_password("dos"))
+
+    def test_progreso_ndjson(self):
+        response = self.subir("codigo_estudiantil\nE1\nE2\nE3\n", progreso=True)
+        lineas = [json.loads(linea) for linea in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([linea['procesadas'] for linea in lineas], [2, 3, 3])
+        self.assertTrue(lineas[-1]['ok'])
+        self.assertEqual(lineas[-1]['creados'], 3)
+
+    def test_encabezado_invalido_y_permisos(self):
+        response = self.subir("nombre,apellido\nLuis,Pérez\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['mensaje'], 'Falta la columna codigo_estudiantil')
+        self.client.force_authenticate(user=Usuario.objects.create_user(username="e", password="x", codigo_estudiantil="E9"))
+        self.assertEqual(self.subir("codigo_estudiantil\nE1\n").status_code, 403)
+
+    def test_hashea_en_varios_procesos(self):
+        filas = leer_filas(SimpleUploadedFile("b.csv", b"codigo_estudiantil,password\nE1,uno\nE2,dos\nE3,tres\n"))
+        importacion = ImportacionEstudiantes(procesos=2)
+        list(importacion.ejecutar(filas))
+        self.assertEqual(importacion.creados, 3)
+        self.assertTrue(Usuario.objects.get(codigo_estudiantil="E3").check_password("tres"))
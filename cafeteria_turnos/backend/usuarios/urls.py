@@ -3,7 +3,7 @@ from .views import (
     RegistroUsuarioView, CustomTokenObtainPairView,
     UsuarioPerfilView, UsuarioDetailView,
     UsuarioUpdateView, PasswordChangeView,
-    UsuarioListView, UsuarioDeleteView
+    UsuarioListView, UsuarioDeleteView, SubirBaseEstudiantesView
 )
 
 urlpatterns = [
@@ -15,4 +15,5 @@ urlpatterns = [
     path('cambiar_password/', PasswordChangeView.as_view(), name='cambiar_password'),
     path('listar/', UsuarioListView.as_view(), name='usuarios_list'),
     path('eliminar/<int:pk>/', UsuarioDeleteView.as_view(), name='usuario_delete'),
+    path('subir_base/', SubirBaseEstudiantesView.as_view(), name='subir_base'),
 ]
\ No newline at end of file
@@ -1,6 +1,10 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
+from django.http import StreamingHttpResponse
+import json
+from .importacion import ErrorImportacion, ImportacionEstudiantes, leer_filas
 from .models import Usuario
 from .serializers import (
     UsuarioSerializer, RegistroSerializer,
@@ -10,6 +14,10 @@ from .serializers import (
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import get_user_model
 
+def usuario_completo(request):
+    # request.user puede venir armado solo con los claims del JWT (autenticacion.py)
+    return Usuario.objects.get(pk=request.user.pk)
+
 # Registro
 class RegistroUsuarioView(generics.CreateAPIView):
     queryset = Usuario.objects.all()
@@ -22,7 +30,7 @@ class UsuarioPerfilView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        return usuario_completo(self.request)
 
 # Perfil por ID (admin)
 class UsuarioDetailView(generics.RetrieveAPIView):
@@ -36,7 +44,7 @@ class UsuarioUpdateView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        return usuario_completo(self.request)
 
 # Cambiar contraseña propia
 class PasswordChangeView(APIView):
@@ -45,7 +53,7 @@ class PasswordChangeView(APIView):
     def post(self, request):
         serializer = PasswordChangeSerializer(data=request.data)
         if serializer.is_valid():
-            user = request.user
+            user = usuario_completo(request)
             if not user.check_password(serializer.validated_data['old_password']):
                 return Response({"old_password": ["Contraseña actual incorrecta"]}, status=status.HTTP_400_BAD_REQUEST)
             user.set_password(serializer.validated_data['new_password'])
@@ -67,4 +75,49 @@ class UsuarioDeleteView(generics.DestroyAPIView):
 
 # Login customizado con datos extra en el JWT y en el response
 class CustomTokenObtainPairView(TokenObtainPairView):
-    serializer_class = CustomTokenObtainPairSerializer
\ No newline at end of file
+    serializer_class = CustomTokenObtainPairSerializer
+
+# Subir la base de estudiantes en CSV/XLSX (admin). Crea o actualiza por
+# codigo_estudiantil (ver importacion.py). Con ?progreso=1 la respuesta es
+# NDJSON: una línea de progreso por lote y el resumen al final. Las
+# contraseñas se hashean en este proceso; para archivos grandes con
+# contraseñas está el comando importar_estudiantes, que usa varios procesos
+class SubirBaseEstudiantesView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        archivo = request.FILES.get('archivo')
+        if archivo is None:
+            return Response({'ok': False, 'mensaje': 'Debes enviar el archivo en el campo "archivo".'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            filas = leer_filas(archivo)
+        except ErrorImportacion as e:
+            return Response({'ok': False, 'mensaje': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        importacion = ImportacionEstudiantes()
+        if request.query_params.get('progreso'):
+            return StreamingHttpResponse(self._lineas(importacion, filas), content_type='application/x-ndjson')
+        try:
+            for _ in importacion.ejecutar(filas):
+                pass
+        except ErrorImportacion as e:
+            return Response({'ok': False, 'mensaje': str(e), **importacion.resumen()},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'ok': True, 'mensaje': self._mensaje(importacion), **importacion.resumen()})
+
+    def _lineas(self, importacion, filas):
+        try:
+            for progreso in importacion.ejecutar(filas):
+                yield json.dumps(progreso) + '\n'
+        except ErrorImportacion as e:
+            yield json.dumps({'ok': False, 'mensaje': str(e), **importacion.resumen()}) + '\n'
+            return
+        yield json.dumps({'ok': True, 'mensaje': self._mensaje(importacion), **importacion.resumen()}) + '\n'
+
+    def _mensaje(self, importacion):
+        mensaje = (f"{importacion.creados} estudiantes creados, {importacion.actualizados} actualizados, "
+                   f"{importacion.total_errores} filas con errores")
+        if importacion.sin_contrasena:
+            mensaje += f"; {importacion.sin_contrasena} nuevos sin contraseña (hay que asignársela)"
+        return mensaje